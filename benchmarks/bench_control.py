@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the control layer of CreatecWin32 on the simulated backend,
+with a per-call latency mimicking the cross-process COM overhead
+
+Run from the root directory with
+python benchmarks/bench_control.py [latency_ms]
+"""
+import sys
+import time
+
+from createc.Createc_pyCOM import CreatecWin32
+from createc.utils.stm_simulator import STM_SIMULATOR
+
+
+def timed(func, repeat=20):
+    """
+    Best wall time of a function call
+
+    Parameters
+    ----------
+    func : callable
+    repeat : int
+
+    Returns
+    -------
+    seconds : float
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def geometry(stm):
+    # the reads of the show area callback of the map applet
+    return ([stm.offset for _ in range(4)], [stm.nom_size for _ in range(4)], [stm.angle for _ in range(3)])
+
+
+def geometry_snapshot(stm):
+    with stm.snapshot():
+        return geometry(stm)
+
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) * 1e-3 if len(sys.argv) > 1 else 1e-3
+    stm = CreatecWin32(backend=STM_SIMULATOR(latency=latency))
+    print(f'latency per remote call     {latency * 1e3:8.2f} ms')
+    print(f'getparam                    {timed(lambda: stm.getparam("OffsetX")) * 1e3:8.2f} ms')
+    stm.client.latency = 0
+    plain = timed(lambda: stm.getparam('OffsetX'), repeat=10000)
+    stm.instrument()
+    instrumented = timed(lambda: stm.getparam('OffsetX'), repeat=10000)
+    stm.instrument(False)
+    stm.client.latency = latency
+    print(f'instrumentation overhead    {(instrumented - plain) * 1e6:8.2f} us per call')
+    print(f'map applet geometry         {timed(lambda: geometry(stm)) * 1e3:8.2f} ms')
+    print(f'  within snapshot()         {timed(lambda: geometry_snapshot(stm)) * 1e3:8.2f} ms')
+    stm.setparam('Biasvolt.[mV]', 100)
+    print(f'ramp_bias_mV 100 -> 1000 mV {timed(lambda: stm.ramp_bias_mV(1000), repeat=1):8.2f} s')
+    print(f'  with duration=0.5         {timed(lambda: stm.ramp_bias_mV(100, duration=0.5), repeat=1):8.2f} s')
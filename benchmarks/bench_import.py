@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the import time of the package, each measurement runs in a fresh interpreter
+
+Run from the root directory with
+python benchmarks/bench_import.py [repeat]
+"""
+import subprocess
+import sys
+
+statements = {'import createc': 'import createc',
+              'createc.DAT_IMG': 'import createc; createc.DAT_IMG',
+              'createc.VERT_SPEC + pandas': 'import createc, pandas; createc.VERT_SPEC'}
+
+
+def import_time(statement, repeat=5):
+    """
+    Best wall time of a statement in fresh interpreters
+
+    Parameters
+    ----------
+    statement : str
+        python statement
+    repeat : int
+        number of interpreters to start
+
+    Returns
+    -------
+    seconds : float
+    """
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    return min(float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(repeat))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, statement in statements.items():
+        print(f'{name:30s} {import_time(statement, repeat) * 1e3:8.1f} ms')
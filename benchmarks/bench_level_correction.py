@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of level_correction,
+comparing the previous design matrix implementation with the cached normal equations
+
+Run from the root directory with
+python benchmarks/bench_level_correction.py [size]
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from createc.utils.image_utils import level_correction
+
+
+def legacy_level_correction(img):
+    """
+    The previous implementation, building the (m*n)x3 design matrix for every image
+
+    Parameters
+    ----------
+    img : numpy.array
+
+    Returns
+    -------
+    result : numpy.array
+    """
+    m, n = img.shape
+    X1, X2 = np.mgrid[:m, :n]
+    X = np.hstack((np.reshape(X1, (m * n, 1)), np.reshape(X2, (m * n, 1))))
+    X = np.hstack((np.ones((m * n, 1)), X))
+    YY = np.reshape(img, (m * n, 1))
+    theta = np.dot(np.dot(np.linalg.pinv(np.dot(X.transpose(), X)), X.transpose()), YY)
+    plane = np.reshape(np.dot(X, theta), (m, n))
+    return img - plane
+
+
+def best(func, number=10):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    rng = np.random.default_rng(0)
+    img = rng.normal(size=(size, size))
+    stack = rng.normal(size=(16, size, size))
+    mask = rng.random((size, size)) > 0.95
+    print(f'{size} x {size} image')
+    print(f'legacy                 : {best(lambda: legacy_level_correction(img)) * 1e3:8.2f} ms')
+    print(f'plane                  : {best(lambda: level_correction(img)) * 1e3:8.2f} ms')
+    print(f'plane, masked          : {best(lambda: level_correction(img, mask=mask)) * 1e3:8.2f} ms')
+    print(f'order 3                : {best(lambda: level_correction(img, order=3)) * 1e3:8.2f} ms')
+    print(f'rows                   : {best(lambda: level_correction(img, rows=True)) * 1e3:8.2f} ms')
+    print(f'stack of 16, per image : {best(lambda: level_correction(stack)) / 16 * 1e3:8.2f} ms')
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the meta data parsing per file,
+comparing the previous line-by-line parser with GENERIC_FILE._bin2meta_dict
+
+Run from the root directory with
+python benchmarks/bench_meta_parse.py [file ...]
+"""
+import glob
+import os
+import sys
+import timeit
+
+from createc.Createc_pyFile import GENERIC_FILE, DAT_IMG
+
+this_dir = os.path.dirname(__file__)
+
+
+def legacy_bin2meta_dict(meta_binary):
+    """
+    The previous parser, splitting the whole meta binary into lines in a python loop
+
+    Parameters
+    ----------
+    meta_binary : bin
+        meta data in binary
+
+    Returns
+    -------
+    meta : dict
+    """
+    meta = dict()
+    meta_list = meta_binary.decode('cp1252', errors='ignore').split('\n')
+    meta['file_version'] = meta_list[0]
+    for line in meta_list:
+        temp = line.split('=')
+        if len(temp) == 2:
+            keywords = temp[0].split(' / ')
+            keywords = [kw.strip().lower() for kw in keywords]
+            for kw in keywords:
+                meta[kw] = temp[1][:-1]
+    return meta
+
+
+def parse(meta_binary):
+    """
+    Parse with the current GENERIC_FILE parser, without reading any file
+
+    Parameters
+    ----------
+    meta_binary : bin
+        meta data in binary
+
+    Returns
+    -------
+    meta : dict
+    """
+    file = GENERIC_FILE.__new__(GENERIC_FILE)
+    file.meta = dict()
+    file._meta_binary = meta_binary
+    file._bin2meta_dict()
+    return file.meta
+
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or glob.glob(os.path.join(this_dir, '..', 'examples', 'sample_data', '**', '*.dat'),
+                                      recursive=True)
+    number = 200
+    t_legacy = t_new = t_open = 0
+    for fp in files:
+        with open(fp, 'rb') as f:
+            meta_binary = f.read(16384)
+        t_legacy += min(timeit.repeat(lambda: legacy_bin2meta_dict(meta_binary), number=number, repeat=3)) / number
+        t_new += min(timeit.repeat(lambda: parse(meta_binary), number=number, repeat=3)) / number
+        t_open += min(timeit.repeat(lambda: DAT_IMG(fp, header_only=True), number=number, repeat=3)) / number
+    print(f'{len(files)} files')
+    print(f'legacy parser          : {t_legacy / len(files) * 1e6:8.1f} us/file')
+    print(f'current parser         : {t_new / len(files) * 1e6:8.1f} us/file')
+    print(f'DAT_IMG(header_only)   : {t_open / len(files) * 1e6:8.1f} us/file')
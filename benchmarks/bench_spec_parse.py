@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of parsing the spec table of a .VERT file of a long bias sweep,
+comparing the previous python engine of pandas.read_csv with VERT_SPEC._read_spec
+
+Run from the root directory with
+python benchmarks/bench_spec_parse.py [rows ...]
+"""
+import io
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from createc.Createc_pyFile import VERT_SPEC
+from createc.utils.misc import load_global_const
+
+cgc = load_global_const()
+this_dir = os.path.dirname(__file__)
+
+
+def spec_body(file, rows):
+    """
+    A synthetic spec table in the format of the file, with the given number of rows
+
+    Parameters
+    ----------
+    file : VERT_SPEC
+        a file giving the columns
+    rows : int
+        number of data points
+
+    Returns
+    -------
+    spec_body : bin
+    """
+    rng = np.random.default_rng(0)
+    columns = [np.arange(rows).astype(str)]
+    for _ in file.spec_headers[1:]:
+        columns.append(np.char.mod('%.6G', rng.normal(size=rows) * 10.0 ** rng.integers(-12, 3)))
+    return ''.join('\t'.join(row) + '\t\r\n' for row in zip(*columns)).encode('cp1252')
+
+
+def legacy_read_spec(file, body):
+    """
+    The previous parser, pandas.read_csv with the python engine
+    """
+    return pd.read_csv(filepath_or_buffer=io.BytesIO(body), sep=cgc['g_file_spec_delimiter'],
+                       header=None,
+                       names=file.spec_headers,
+                       index_col=cgc['g_file_spec_index_header'],
+                       engine='python',
+                       usecols=range(len(file.spec_headers)))
+
+
+if __name__ == '__main__':
+    file = VERT_SPEC(os.path.join(this_dir, '..', 'tests', 'A201222.074639.VERT'))
+    for rows in [int(arg) for arg in sys.argv[1:]] or [1024, 10240, 51200]:
+        body = spec_body(file, rows)
+        pd.testing.assert_frame_equal(legacy_read_spec(file, body), file._read_spec(body))
+        number = max(1, 20000 // rows)
+        t_legacy = min(timeit.repeat(lambda: legacy_read_spec(file, body), number=number, repeat=3)) / number
+        t_new = min(timeit.repeat(lambda: file._read_spec(body), number=number, repeat=3)) / number
+        print(f'{rows:6d} rows, python engine : {t_legacy * 1e3:8.1f} ms')
+        print(f'{rows:6d} rows, _read_spec    : {t_new * 1e3:8.1f} ms')
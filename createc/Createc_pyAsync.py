@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio client of the STM software
+
+The COM object is created and used on one dedicated worker thread,
+so an event loop, e.g. of a Bokeh server, is never blocked by ramps or scans.
+"""
+import asyncio
+import concurrent.futures
+import time
+
+from .Createc_pyCOM import CreatecWin32, bias_ramp_setpoints, current_ramp_setpoints, timed_ramp_setpoints, \
+    _bias_segments, _current_segments, _ramp_step_delay, cgc
+
+
+class AsyncCreatec:
+    """
+    The asyncio counterpart of CreatecWin32.
+
+    All the calls are queued onto one worker thread which owns the CreatecWin32 instance,
+    ramps and scan waits sleep on the event loop in between, and can be cancelled like any asyncio task.
+
+    Parameters
+    ----------
+    backend : object
+        See CreatecWin32, by default the COM server of the STM software
+
+    Examples
+    --------
+    async with AsyncCreatec() as stm:
+        await asyncio.gather(stm.ramp_bias_mV(500), stm.ramp_current_pA(20))
+        await stm.call('scanstart')
+        await stm.wait_scan_finished()
+        file_path = await stm.get('savedatfilename')
+    """
+
+    def __init__(self, backend=None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='createc')
+        self._connected = self._executor.submit(self._connect, backend)
+        self._ramp_locks = dict()
+
+    @staticmethod
+    def _connect(backend):
+        """
+        Create the CreatecWin32 instance on the worker thread, which is where COM has to be initialised
+
+        Parameters
+        ----------
+        backend : object
+
+        Returns
+        -------
+        stm : CreatecWin32
+        """
+        if backend is None:
+            import pythoncom
+            pythoncom.CoInitialize()
+        return CreatecWin32(backend=backend)
+
+    async def __aenter__(self):
+        await asyncio.wrap_future(self._connected)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker thread once the queued calls are done
+
+        Returns
+        -------
+        None : None
+        """
+        self._executor.shutdown(wait=False)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a function on the worker thread, with the CreatecWin32 instance as the first argument
+
+        Parameters
+        ----------
+        func : callable
+            e.g. CreatecWin32.pre_scan_config or a lambda stm: ...
+        args, kwargs :
+            The other arguments of func
+
+        Returns
+        -------
+        result : object
+            Whatever func returns
+        """
+        stm = await asyncio.wrap_future(self._connected)
+        return await asyncio.wrap_future(self._executor.submit(func, stm, *args, **kwargs))
+
+    async def call(self, name, *args, **kwargs):
+        """
+        Call a method of CreatecWin32, or of the remote object, on the worker thread
+
+        Parameters
+        ----------
+        name : str
+            Method name, e.g. 'scanstart' or 'setxyoffpixel'
+        args, kwargs :
+            Arguments of the method
+
+        Returns
+        -------
+        result : object
+        """
+        return await self.run(lambda stm: getattr(stm, name)(*args, **kwargs))
+
+    async def get(self, name):
+        """
+        Get a property of CreatecWin32, or of the remote object, on the worker thread
+
+        Parameters
+        ----------
+        name : str
+            Property name, e.g. 'offset', 'duration' or 'scanstatus'
+
+        Returns
+        -------
+        value : object
+        """
+        return await self.run(getattr, name)
+
+    async def getparam(self, key):
+        """
+        Get a parameter from the STM software
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        value : str
+        """
+        return await self.run(CreatecWin32.getparam, key)
+
+    async def setparam(self, key, value):
+        """
+        Set a parameter in the STM software
+
+        Parameters
+        ----------
+        key : str
+        value : str, int or float
+
+        Returns
+        -------
+        None : None
+        """
+        await self.run(CreatecWin32.setparam, key, value)
+
+    async def _ramp(self, key, setpoints):
+        """
+        Set the setpoints of a ramp one after another, sleeping on the event loop in between.
+        Ramps of the same parameter are queued, a cancelled ramp leaves the parameter at its last setpoint.
+
+        Parameters
+        ----------
+        key : str
+            Parameter name
+        setpoints : iterable[tuple[float]]
+            (delay, value) as from bias_ramp_setpoints()
+
+        Returns
+        -------
+        None : None
+        """
+        for delay, value in setpoints:
+            if delay:
+                await asyncio.sleep(delay)
+            await self.setparam(key, value)
+
+    async def _ramp_timed(self, key, setpoints):
+        """
+        Set the setpoints of timed_ramp_setpoints() on time, sleeping on the event loop in between
+
+        Parameters
+        ----------
+        key : str
+            Parameter name
+        setpoints : generator
+            From timed_ramp_setpoints()
+
+        Returns
+        -------
+        count : int
+            Number of setpoints set
+        """
+        count = 0
+        for deadline, value in setpoints:
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.setparam(key, value)
+            count += 1
+        return count
+
+    async def ramp_param(self, key: str, end: float, duration: float = None, rate: float = None, log: bool = False,
+                         interval: float = _ramp_step_delay):
+        """
+        Ramp any parameter to the target value in a given time or at a maximum rate, see CreatecWin32.ramp_param
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, e.g. 'Biasvolt.[mV]'
+        end : float
+            target value
+        duration : float
+            duration in seconds
+        rate : float
+            maximum rate, in the unit of the parameter per second, or in decades per second if log
+        log : bool
+            Whether to ramp logarithmically, which needs nonzero values of the same polarity
+        interval : float
+            shortest time between two setpoints in seconds
+
+        Returns
+        -------
+        count : int
+            Number of setpoints set
+        """
+        async with self._ramp_lock(key):
+            init = float((await self.getparam(key)).split()[-1])
+            if init == end:
+                return 0
+            return await self._ramp_timed(key, timed_ramp_setpoints([(init, end)], duration, rate, log, interval))
+
+    def _ramp_lock(self, key):
+        if key not in self._ramp_locks:
+            self._ramp_locks[key] = asyncio.Lock()
+        return self._ramp_locks[key]
+
+    async def ramp_bias_mV(self, end_bias_mV: float, speed: int = 100, duration: float = None, rate: float = None):
+        """
+        Ramp bias from current value to another value, see CreatecWin32.ramp_bias_mV
+
+        Parameters
+        ----------
+        end_bias_mV : float
+            target bias in mV
+        speed : int
+            speed is actually steps, it can be any integer larger than 0.
+            1 means directly stepping to the final value, it is default to 100.
+        duration : float
+            If given, ramp in this many seconds instead, see ramp_param()
+        rate : float
+            If given, ramp at most this many decades per second instead, see ramp_param()
+
+        Returns
+        -------
+        None : None
+        """
+        speed = int(speed)
+        assert speed > 0, "speed should be larger than 0"
+        async with self._ramp_lock('Biasvolt.[mV]'):
+            init_bias_mV = float(await self.getparam('Biasvolt.[mV]'))
+            if duration is not None or rate is not None:
+                await self._ramp_timed('Biasvolt.[mV]', timed_ramp_setpoints(
+                    _bias_segments(init_bias_mV, end_bias_mV), duration, rate, log=True))
+            else:
+                await self._ramp('Biasvolt.[mV]', bias_ramp_setpoints(init_bias_mV, end_bias_mV, speed))
+
+    async def ramp_current_pA(self, end_FBLogIset: float, speed: int = 100, duration: float = None,
+                              rate: float = None):
+        """
+        Ramp current to the target value, see CreatecWin32.ramp_current_pA
+
+        Parameters
+        ----------
+        end_FBLogIset : float
+            end_current in pA
+        speed : int
+            speed is actually steps, it can be any integer larger than 0.
+            1 means directly stepping to the final value, it is default to 100.
+        duration : float
+            If given, ramp in this many seconds instead, see ramp_param()
+        rate : float
+            If given, ramp at most this many decades per second instead, see ramp_param()
+
+        Returns
+        -------
+        None : None
+        """
+        speed = int(speed)
+        assert speed > 0, 'speed should be larger than 0'
+        async with self._ramp_lock('FBLogIset'):
+            init_FBLogIset = float((await self.getparam('FBLogIset')).split()[-1])
+            if init_FBLogIset == end_FBLogIset or end_FBLogIset < 0:
+                return
+            preampgain = await self.get('preampgain')
+            end_FBLogIset = end_FBLogIset * 10 ** (preampgain - cgc['g_preamp_gain'])
+            if duration is not None or rate is not None:
+                await self._ramp_timed('FBLogIset', timed_ramp_setpoints(
+                    _current_segments(init_FBLogIset, end_FBLogIset), duration, rate, log=True))
+            else:
+                await self._ramp('FBLogIset', current_ramp_setpoints(init_FBLogIset, end_FBLogIset, speed))
+
+    async def wait_scan_finished(self, poll_min=0.05, poll_max=5.0, stop_on_cancel=False):
+        """
+        Wait until the running scan is finished, without freezing the STM software as scanwaitfinished does.
+
+        The scan status is polled adaptively: seldom while much of the expected duration is left,
+        every poll_min seconds around the expected end, and then less and less often if the scan takes longer.
+
+        Parameters
+        ----------
+        poll_min : float
+            Shortest polling interval in seconds
+        poll_max : float
+            Longest polling interval in seconds
+        stop_on_cancel : bool
+            Whether to stop the scan if the wait is cancelled
+
+        Returns
+        -------
+        waited : float
+            Seconds waited
+        """
+        start = time.monotonic()
+        # as CreatecWin32.duration, but not rounded down to whole seconds
+        duration = await self.run(lambda stm: float(stm.getparam('Sec/Image:')) / 2 *
+                                  (1 + 1 / float(stm.getparam('Delay Y'))))
+        overdue = poll_min
+        try:
+            while await self.get('scanstatus'):
+                remaining = duration - (time.monotonic() - start)
+                if remaining > 0:
+                    interval = min(poll_max, max(poll_min, remaining / 2))
+                else:
+                    interval, overdue = overdue, min(poll_max, overdue * 2)
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            if stop_on_cancel:
+                await asyncio.shield(self.call('scanstop'))
+            raise
+        return time.monotonic() - start
+
+    async def scan(self, **kwargs):
+        """
+        Configure and start a scan, and wait until it is finished
+
+        Parameters
+        ----------
+        kwargs :
+            Parameters of CreatecWin32.pre_scan_config, and poll_min, poll_max, stop_on_cancel of wait_scan_finished
+
+        Returns
+        -------
+        waited : float
+            Seconds waited
+        """
+        wait_kwargs = {k: kwargs.pop(k) for k in ('poll_min', 'poll_max', 'stop_on_cancel') if k in kwargs}
+        if kwargs:
+            await self.run(CreatecWin32.pre_scan_config, **kwargs)
+        await self.call('scanstart')
+        return await self.wait_scan_finished(**wait_kwargs)
@@ -4,16 +4,252 @@ Created on Thu May 16 17:07:44 2019
 
 @author: xuc1
 """
+import collections
+import contextlib
+import functools
 import numpy as np
-import time
-from .utils.misc import XY2D
-import yaml
 import os
+import tempfile
+import time
+from .utils.misc import XY2D, load_global_const
+
+cgc = load_global_const()
+
+_ramp_step_delay = 0.01  # seconds between two steps of a ramp
+
+SCAN_LINES = collections.namedtuple('SCAN_LINES', ['start', 'stop', 'imgs'])
+SCAN_LINES.__doc__ = """
+    Scan lines completed since the last ones, see CreatecWin32.scan_lines()
+
+    Parameters
+    ----------
+    start : int
+        The first new row
+    stop : int
+        The row after the last new one, the rows :stop of imgs are complete
+    imgs : numpy.array
+        The buffer of all the channels, in the shape of (channels, Num.Y, Num.X)
+    """
+
+
+def _bias_ramp_same_pole(end_bias_mV, init_bias_mV, speed):
+    """
+    Setpoints to ramp the bias logarithmically between two values of the same polarity
+
+    Parameters
+    ----------
+    end_bias_mV : float
+        target bias in mV
+    init_bias_mV : float
+        starting bias in mV, it should be of the same polarity of end_bias_mV
+    speed : int
+        steps per decade
+
+    Yields
+    ------
+    delay : float
+        seconds to wait before setting the value
+    bias : float
+        bias in mV
+    """
+    bias_pole = np.sign(init_bias_mV)
+    init = speed * np.log10(np.abs(init_bias_mV))
+    end = speed * np.log10(np.abs(end_bias_mV))
+    sign = int(np.sign(end - init))
+    for i in range(int(init) + sign, int(end) + sign, sign):
+        yield _ramp_step_delay, bias_pole * 10 ** (i / speed)
+    yield 0, end_bias_mV
 
-this_dir = os.path.dirname(__file__)
-cgc_file = os.path.join(this_dir, 'Createc_global_const.yaml')
-with open(cgc_file, 'rt') as f:
-    cgc = yaml.safe_load(f.read())
+
+def _bias_segments(init_bias_mV, end_bias_mV):
+    """
+    Split a bias ramp into logarithmic segments of the same polarity.
+    When the polarity changes the bias is flipped at the smaller magnitude.
+
+    Parameters
+    ----------
+    init_bias_mV : float
+        starting bias in mV
+    end_bias_mV : float
+        target bias in mV
+
+    Returns
+    -------
+    segments : list[tuple[float]]
+        (start, stop) of each segment, start == stop means directly setting the value
+    """
+    if init_bias_mV * end_bias_mV == 0 or init_bias_mV == end_bias_mV:
+        return []
+    if init_bias_mV * end_bias_mV > 0:
+        return [(init_bias_mV, end_bias_mV)]
+    if np.abs(init_bias_mV) > np.abs(end_bias_mV):
+        return [(-init_bias_mV, -init_bias_mV), (-init_bias_mV, end_bias_mV)]
+    if np.abs(init_bias_mV) < np.abs(end_bias_mV):
+        return [(init_bias_mV, -end_bias_mV), (end_bias_mV, end_bias_mV)]
+    return [(end_bias_mV, end_bias_mV)]
+
+
+def bias_ramp_setpoints(init_bias_mV, end_bias_mV, speed):
+    """
+    Setpoints to ramp the bias from one value to another, shared by the blocking and the async clients.
+    The bias is ramped logarithmically, when the polarity changes it is flipped at the smaller magnitude.
+
+    Parameters
+    ----------
+    init_bias_mV : float
+        starting bias in mV
+    end_bias_mV : float
+        target bias in mV
+    speed : int
+        steps per decade, 1 means directly stepping to the final value
+
+    Yields
+    ------
+    delay : float
+        seconds to wait before setting the value
+    bias : float
+        bias in mV
+    """
+    for start, stop in _bias_segments(init_bias_mV, end_bias_mV):
+        if start == stop:
+            yield 0, stop
+        else:
+            yield from _bias_ramp_same_pole(stop, start, speed)
+
+
+def current_ramp_setpoints(init_FBLogIset, end_FBLogIset, speed):
+    """
+    Setpoints to ramp the current setpoint logarithmically, shared by the blocking and the async clients
+
+    Parameters
+    ----------
+    init_FBLogIset : float
+        starting FBLogIset
+    end_FBLogIset : float
+        target FBLogIset, already scaled by the preamp gain
+    speed : int
+        steps per decade, 1 means directly stepping to the final value
+
+    Yields
+    ------
+    delay : float
+        seconds to wait before setting the value
+    current : float
+        FBLogIset
+    """
+    _init_FBLogIset = init_FBLogIset if init_FBLogIset else 0.1
+    _end_FBLogIset = end_FBLogIset if end_FBLogIset else 0.1
+    init = int(speed * np.log10(np.abs(_init_FBLogIset)))
+    end = int(speed * np.log10(np.abs(_end_FBLogIset)))
+    one_step = int(np.sign(end - init))
+    now = init
+    while now != end:
+        now += one_step
+        yield _ramp_step_delay, 10 ** (now / speed)
+    yield 0, end_FBLogIset
+
+
+def _current_segments(init_FBLogIset, end_FBLogIset):
+    """
+    Logarithmic segments of a current ramp, zero is ramped from or to 0.1
+
+    Parameters
+    ----------
+    init_FBLogIset : float
+        starting FBLogIset
+    end_FBLogIset : float
+        target FBLogIset, already scaled by the preamp gain
+
+    Returns
+    -------
+    segments : list[tuple[float]]
+        (start, stop) of each segment, start == stop means directly setting the value
+    """
+    _init_FBLogIset = init_FBLogIset if init_FBLogIset else 0.1
+    _end_FBLogIset = end_FBLogIset if end_FBLogIset else 0.1
+    segments = [(_init_FBLogIset, _end_FBLogIset)]
+    if _end_FBLogIset != end_FBLogIset:
+        segments.append((end_FBLogIset, end_FBLogIset))
+    return segments
+
+
+def _span(start, stop, log):
+    """
+    Length of a ramp segment, in decades if log else in the unit of the parameter
+    """
+    if start == stop:
+        return 0.0
+    if log:
+        return float(np.abs(np.log10(np.abs(stop)) - np.log10(np.abs(start))))
+    return float(np.abs(stop - start))
+
+
+def timed_ramp_setpoints(segments, duration=None, rate=None, log=False, interval=_ramp_step_delay,
+                         clock=time.monotonic):
+    """
+    Setpoints of a ramp scheduled against a monotonic clock, shared by the blocking and the async clients.
+
+    The ramp takes the given duration, or as long as the maximum rate allows, whichever is longer,
+    regardless of how long each remote call takes. Each setpoint is the value due when the call is expected
+    to be done, using the measured latency of the previous calls. If the client falls behind,
+    the missed setpoints are dropped instead of being sent late, and setpoints equal to the previous one are skipped.
+
+    Parameters
+    ----------
+    segments : list[tuple[float]]
+        (start, stop) of each segment, start == stop means directly setting the value
+    duration : float
+        Total duration in seconds, without a rate a duration of 0 sets the values at once
+    rate : float
+        Maximum rate, in the unit of the parameter per second, or in decades per second if log, 0 means no limit
+    log : bool
+        Whether to ramp logarithmically, the values of a segment have to be nonzero and of the same polarity
+    interval : float
+        Shortest time between two setpoints in seconds
+    clock : callable
+        The monotonic clock
+
+    Yields
+    ------
+    deadline : float
+        Time of the clock at which to set the value
+    value : float
+        The setpoint. The generator should be resumed once it is set, which is how the latency is measured
+    """
+    assert duration is not None or rate is not None, 'either duration or rate is needed'
+    spans = [_span(start, stop, log) for start, stop in segments]
+    total = sum(spans)
+    latency = 0.0
+    for (start, stop), span in zip(segments, spans):
+        if span == 0:
+            yield clock(), stop
+            continue
+        seconds = max(duration * span / total if duration else 0.0, span / rate if rate else 0.0)
+        if seconds <= 0:
+            # e.g. duration=0, the value is set at once
+            yield clock(), stop
+            continue
+        if log:
+            assert start * stop > 0, 'a log ramp needs nonzero values of the same polarity'
+            sign, log_start, log_stop = np.sign(start), np.log10(np.abs(start)), np.log10(np.abs(stop))
+            value_at = lambda fraction: float(sign * 10 ** (log_start + (log_stop - log_start) * fraction))
+        else:
+            value_at = lambda fraction: start + (stop - start) * fraction
+        begin = deadline = clock()
+        last = start
+        while True:
+            # ticks missed while falling behind are coalesced into the next one
+            deadline = max(deadline + interval, clock())
+            fraction = (deadline + latency - begin) / seconds
+            if fraction >= 1:
+                break
+            value = value_at(fraction)
+            if value == last:
+                continue
+            yield deadline, value
+            latency = 0.7 * latency + 0.3 * max(0.0, clock() - deadline)
+            last = value
+        yield begin + seconds - latency, stop
 
 
 class CreatecWin32:
@@ -24,14 +260,24 @@ class CreatecWin32:
     this class is just a wrapper so many more custom methods can be added.
     """
 
-    def __init__(self):
+    def __init__(self, backend=None):
         """
         Initiator for CreatecWin32 class.
 
+        Parameters
+        ----------
+        backend : object
+            The remote operation object, by default the COM server of the STM software.
+            Any object with the same methods can be used instead, e.g. createc.utils.stm_simulator.STM_SIMULATOR
+
         Returns
         -------
         CreatecWin32
         """
+        self._param_cache = None  # dict of parameter reads while a snapshot() is active
+        if backend is not None:
+            self.client = backend
+            return
         import win32com.client as win32
         from pywintypes import com_error
 
@@ -57,7 +303,167 @@ class CreatecWin32:
         -------
         None
         """
-        return getattr(self.client, name)
+        if name.startswith('__') or name in ('client', '_param_cache'):
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if self._param_cache is not None and callable(attr) and not name.lower().startswith('get'):
+            # any remote call other than a getter may change parameters, e.g. setxyoffvolt, scanstart
+            return functools.partial(self._invalidating_call, attr)
+        return attr
+
+    def _invalidating_call(self, method, *args, **kwargs):
+        """
+        Call a remote method and clear the parameter cache
+
+        Parameters
+        ----------
+        method : callable
+            The remote method
+        args, kwargs :
+            Arguments of the remote method
+
+        Returns
+        -------
+        result : object
+            Whatever the remote method returns
+        """
+        self._param_cache.clear()
+        return method(*args, **kwargs)
+
+    def getparam(self, key):
+        """
+        Get a parameter from the STM software, the read is cached while a snapshot() is active
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, e.g. 'Biasvolt.[mV]'
+
+        Returns
+        -------
+        value : str
+        """
+        if self._param_cache is None:
+            return self.client.getparam(key)
+        if key not in self._param_cache:
+            self._param_cache[key] = self.client.getparam(key)
+        return self._param_cache[key]
+
+    def setparam(self, key, value):
+        """
+        Set a parameter in the STM software, which invalidates the cached parameter reads
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, e.g. 'Biasvolt.[mV]'
+        value : str, int or float
+            Parameter value
+
+        Returns
+        -------
+        None : None
+        """
+        if self._param_cache is not None:
+            self._param_cache.clear()
+        self.client.setparam(key, value)
+
+    def get_params(self, keys):
+        """
+        Get several parameters at once, each distinct parameter is read only once
+
+        Parameters
+        ----------
+        keys : list[str]
+            Parameter names
+
+        Returns
+        -------
+        params : dict[str, str]
+        """
+        with self.snapshot():
+            return {key: self.getparam(key) for key in keys}
+
+    def set_params(self, params):
+        """
+        Set several parameters at once, in the order given
+
+        Parameters
+        ----------
+        params : dict
+            Parameter names and values
+
+        Returns
+        -------
+        None : None
+        """
+        for key, value in params.items():
+            self.setparam(key, value)
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        """
+        Context in which the parameter reads are cached, e.g. the piezo constants and the preamp gain
+        are read only once for several properties. The cache is cleared on any write through this instance.
+        Nested snapshots share the cache of the outermost one.
+
+        Examples
+        --------
+        with stm.snapshot():
+            offset, nom_size, angle = stm.offset, stm.nom_size, stm.angle
+
+        Returns
+        -------
+        None : None
+        """
+        if self._param_cache is not None:
+            yield
+            return
+        self._param_cache = dict()
+        try:
+            yield
+        finally:
+            self._param_cache = None
+
+    def instrument(self, enable: bool = True, log_file: str = None, interval: float = None):
+        """
+        Switch the instrumentation of the remote calls on or off.
+        While on, every call, getparam and setparam included, is counted and timed, see stats().
+        While off, the remote object is called directly without any overhead.
+
+        Parameters
+        ----------
+        enable : bool
+            on or off
+        log_file : str
+            If given, the stats are appended to this file as json lines
+        interval : float
+            Seconds between two exports of the stats, to the log_file or else to the 'createc' logger
+
+        Returns
+        -------
+        None : None
+        """
+        from .utils.instrumentation import INSTRUMENTED_CLIENT
+
+        if isinstance(self.client, INSTRUMENTED_CLIENT):
+            self.client = self.client.close()
+        if enable:
+            self.client = INSTRUMENTED_CLIENT(self.client, log_file, interval)
+
+    def stats(self):
+        """
+        Stats of the remote calls since the instrumentation is on, see instrument()
+
+        Returns
+        -------
+        stats : dict[str, dict]
+            Per method count, errors, total_s, and mean_ms, p50_ms, p90_ms, p99_ms, max_ms of the latency.
+            Empty if the instrumentation is off
+        """
+        from .utils.instrumentation import INSTRUMENTED_CLIENT
+
+        return self.client.stats() if isinstance(self.client, INSTRUMENTED_CLIENT) else dict()
 
     def is_active(self):
         """
@@ -67,42 +473,73 @@ class CreatecWin32:
         -------
         is_active : Boolean
         """
-        from pywintypes import com_error
+        try:
+            from pywintypes import com_error
+        except ImportError:
+            com_error = ConnectionError
         try:
             self.scanstatus
             return True
         except com_error:
             return False
 
-    def _ramp_bias_same_pole(self, _end_bias_mV: float, _init_bias_mV: float, _speed: float):
+    def _ramp_timed(self, key, setpoints):
         """
-        To be called by ramp_bias_mV().
-        The end result is the machine will ramp the bias gradually to the target value.
+        Set the setpoints of timed_ramp_setpoints() on time
 
         Parameters
         ----------
-        _end_bias_mV : float
-            target bias in mV
-        _init_bias_mV : float
-            starting bias in mV, it should be of the same polarity of _end_bias_mV
-        _speed : int
-            speed is actually steps, it can be any integer larger than 0.
-            1 means directly stepping to the final bias, it is default to 100.
+        key : str
+            Parameter name
+        setpoints : generator
+            From timed_ramp_setpoints()
 
         Returns
         -------
-        None : None
+        count : int
+            Number of setpoints set
+        """
+        count = 0
+        for deadline, value in setpoints:
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.setparam(key, value)
+            count += 1
+        return count
+
+    def ramp_param(self, key: str, end: float, duration: float = None, rate: float = None, log: bool = False,
+                   interval: float = _ramp_step_delay):
+        """
+        Ramp any parameter from its current value to the target value in a given time or at a maximum rate,
+        see timed_ramp_setpoints()
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, e.g. 'Biasvolt.[mV]'
+        end : float
+            target value
+        duration : float
+            duration in seconds
+        rate : float
+            maximum rate, in the unit of the parameter per second, or in decades per second if log
+        log : bool
+            Whether to ramp logarithmically, which needs nonzero values of the same polarity
+        interval : float
+            shortest time between two setpoints in seconds
+
+        Returns
+        -------
+        count : int
+            Number of setpoints set
         """
-        bias_pole = np.sign(_init_bias_mV)
-        init = _speed * np.log10(np.abs(_init_bias_mV))
-        end = _speed * np.log10(np.abs(_end_bias_mV))
-        sign = np.int(np.sign(end - init))
-        for i in range(np.int(init) + sign, np.int(end) + sign, sign):
-            time.sleep(0.01)
-            self.setparam('Biasvolt.[mV]', bias_pole * 10 ** ((i) / _speed))
-        self.setparam('Biasvolt.[mV]', _end_bias_mV)
+        init = float(self.getparam(key).split()[-1])
+        if init == end:
+            return 0
+        return self._ramp_timed(key, timed_ramp_setpoints([(init, end)], duration, rate, log, interval))
 
-    def ramp_bias_mV(self, end_bias_mV: float, speed: int = 100):
+    def ramp_bias_mV(self, end_bias_mV: float, speed: int = 100, duration: float = None, rate: float = None):
         """
         Ramp bias from current value to another value
 
@@ -113,6 +550,10 @@ class CreatecWin32:
         speed : int
             speed is actually steps, it can be any integer larger than 0.
             1 means directly stepping to the final value, it is default to 100.
+        duration : float
+            If given, ramp in this many seconds instead, see ramp_param()
+        rate : float
+            If given, ramp at most this many decades per second instead, see ramp_param()
 
         Returns
         -------
@@ -122,23 +563,16 @@ class CreatecWin32:
         assert speed > 0, "speed should be larger than 0"
 
         init_bias_mV = float(self.getparam('Biasvolt.[mV]'))
-        if init_bias_mV * end_bias_mV == 0:
-            pass
-        elif init_bias_mV == end_bias_mV:
-            pass
-        elif init_bias_mV * end_bias_mV > 0:
-            self._ramp_bias_same_pole(end_bias_mV, init_bias_mV, speed)
-        else:
-            if np.abs(init_bias_mV) > np.abs(end_bias_mV):
-                self.setparam('Biasvolt.[mV]', -init_bias_mV)
-                self._ramp_bias_same_pole(end_bias_mV, -init_bias_mV, speed)
-            elif np.abs(init_bias_mV) < np.abs(end_bias_mV):
-                self._ramp_bias_same_pole(-end_bias_mV, init_bias_mV, speed)
-                self.setparam('Biasvolt.[mV]', end_bias_mV)
-            else:
-                self.setparam('Biasvolt.[mV]', end_bias_mV)
+        if duration is not None or rate is not None:
+            self._ramp_timed('Biasvolt.[mV]', timed_ramp_setpoints(_bias_segments(init_bias_mV, end_bias_mV),
+                                                                   duration, rate, log=True))
+            return
+        for delay, bias in bias_ramp_setpoints(init_bias_mV, end_bias_mV, speed):
+            if delay:
+                time.sleep(delay)
+            self.setparam('Biasvolt.[mV]', bias)
 
-    def ramp_current_pA(self, end_FBLogIset: float, speed: int = 100):
+    def ramp_current_pA(self, end_FBLogIset: float, speed: int = 100, duration: float = None, rate: float = None):
         """
         Ramp current to the target value
 
@@ -149,6 +583,10 @@ class CreatecWin32:
         speed : int
             speed is actually steps, it can be any integer larger than 0.
             1 means directly stepping to the final value, it is default to 100.
+        duration : float
+            If given, ramp in this many seconds instead, see ramp_param()
+        rate : float
+            If given, ramp at most this many decades per second instead, see ramp_param()
 
         Returns
         -------
@@ -158,24 +596,18 @@ class CreatecWin32:
         speed = int(speed)
         assert speed > 0, 'speed should be larger than 0'
 
-        init_FBLogIset = np.float(self.getparam('FBLogIset').split()[-1])
+        init_FBLogIset = float(self.getparam('FBLogIset').split()[-1])
         if init_FBLogIset == end_FBLogIset: return
         if end_FBLogIset < 0: return
         end_FBLogIset = end_FBLogIset * 10 ** (self.preampgain - cgc['g_preamp_gain'])
-        # init_FBLogIset = np.int(init_FBLogIset)
-        # end_FBLogIset = np.int(end_FBLogIset)
-        # if init_FBLogIset == 0:
-        _init_FBLogIset = init_FBLogIset if init_FBLogIset else 0.1
-        _end_FBLogIset = end_FBLogIset if end_FBLogIset else 0.1
-        init = np.int(speed * np.log10(np.abs(_init_FBLogIset)))
-        end = np.int(speed * np.log10(np.abs(_end_FBLogIset)))
-        one_step = np.int(np.sign(end - init))
-        now = init
-        while now != end:
-            time.sleep(0.01)
-            now += one_step
-            self.setparam('FBLogIset', 10 ** (now / speed))
-        self.setparam('FBLogIset', end_FBLogIset)
+        if duration is not None or rate is not None:
+            self._ramp_timed('FBLogIset', timed_ramp_setpoints(_current_segments(init_FBLogIset, end_FBLogIset),
+                                                               duration, rate, log=True))
+            return
+        for delay, current in current_ramp_setpoints(init_FBLogIset, end_FBLogIset, speed):
+            if delay:
+                time.sleep(delay)
+            self.setparam('FBLogIset', current)
 
     @property
     def current_pA(self):
@@ -256,6 +688,98 @@ class CreatecWin32:
         self.scanstart()
         self.scanwaitfinished()
 
+    def scan_lines(self, file_path=None, block=1, poll_min=0.05, poll_max=5.0, start=True):
+        """
+        Generator of the scan lines as they are completed, so drift estimation, live display or an early
+        scanstop can start while the scan is still running, instead of after filesave and DAT_IMG.
+
+        The progress is polled from the backend if it tells it, e.g. STM_SIMULATOR.scan_progress.
+        A backend without it only gets blocks estimated from the time since the start and the duration of the scan,
+        so the rows of the previous block are read again with each new one, in case the scan is slower than
+        its 'Sec/Image:', and the whole image is read again once the scan is over.
+        The new lines are read through the data access of the backend if it has one, e.g. STM_SIMULATOR.scan_rows,
+        otherwise from a .dat file saved for each block. They are copied into one preallocated buffer.
+        Once the scan is finished or stopped, the rest of the buffer is filled at once.
+
+        Parameters
+        ----------
+        file_path : str
+            The .dat file saved to read the lines if the backend has no data access, a temporary file by default
+        block : int
+            Lines to wait for at least before reading, except for the last ones
+        poll_min : float
+            Shortest polling interval in seconds
+        poll_max : float
+            Longest polling interval in seconds
+        start : bool
+            Whether to start the scan, otherwise the scan started last is followed, from the call on
+
+        Yields
+        ------
+        lines : SCAN_LINES
+            The rows start:stop of imgs are new, imgs is the same buffer every time
+
+        Examples
+        --------
+        for lines in stm.scan_lines(block=8):
+            shift = tracker.shift(lines.imgs[:, :lines.stop])  # or update a plot, or stm.scanstop()
+        """
+        from .Createc_pyFile import DAT_IMG
+
+        try:
+            read_rows = self.client.scan_rows
+        except AttributeError:
+            read_rows = None
+        temp_path = None
+        if read_rows is None and file_path is None:
+            fd, temp_path = tempfile.mkstemp(suffix='.dat')
+            os.close(fd)
+            file_path = temp_path
+        nx, ny = int(float(self.getparam('Num.X'))), int(float(self.getparam('Num.Y')))
+        channels = int(float(self.getparam('Channels')))
+        # as CreatecWin32.duration, but not rounded down to whole seconds
+        duration = float(self.getparam('Sec/Image:')) / 2 * (1 + 1 / float(self.getparam('Delay Y')))
+        interval = min(poll_max, max(poll_min, duration / ny * block))
+        imgs = np.zeros((channels, ny, nx), dtype=cgc['g_file_dat_img_pixel_data_npdtype'])
+        try:
+            if start:
+                self.scanstart()
+            t0 = time.monotonic()
+            done = 0
+            estimated = False
+            checked = 0  # the rows before are known to be scanned
+            while done < ny:
+                scanning = self.scanstatus
+                if scanning:
+                    try:
+                        progress = self.client.scan_progress
+                    except AttributeError:
+                        estimated = True
+                        progress = (time.monotonic() - t0) / duration if duration > 0 else 0.0
+                    rows = min(ny, int(progress * ny))
+                    if estimated:
+                        # the last rows are only read once the scan is over
+                        rows = min(rows, ny - 1)
+                else:
+                    rows = ny
+                if rows - done >= block or (rows > done and not scanning):
+                    first = 0 if estimated and not scanning else checked
+                    if read_rows is not None:
+                        imgs[:, first:rows] = read_rows(first, rows)
+                    else:
+                        self.filesave(file_path)
+                        file = DAT_IMG(file_path)
+                        for img, img_file in zip(imgs, file.img_array_list):
+                            img[first:rows] = img_file[first:rows]
+                    yield SCAN_LINES(start=done, stop=rows, imgs=imgs)
+                    checked = done if estimated else rows
+                    done = rows
+                else:
+                    time.sleep(interval)
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
     @property
     def nom_size(self):
         """
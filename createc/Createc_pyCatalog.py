@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent catalog of the Createc image files in a directory tree, based on sqlite3
+
+Only the headers are read while scanning. The catalog keeps the file name, datetime, offset, nominal size,
+rotation, bias, current and channels of each file, plus the bounding box of its footprint in an R-tree,
+so that one can ask e.g. which images cover a point, or which images were taken in a time range at a bias.
+"""
+
+import os
+import sqlite3
+import warnings
+from collections import namedtuple
+from itertools import compress
+
+import numpy as np
+
+from .Createc_pyFile import DAT_IMG
+from .utils.misc import XY2D, point_rot2D_y_inv, points_rot2D_y_inv
+
+CATALOG_RECORD = namedtuple('CATALOG_RECORD', ['path', 'fn', 'timestamp', 'offset_x', 'offset_y',
+                                               'nom_size_x', 'nom_size_y', 'rotation', 'bias', 'current',
+                                               'channels', 'center_x', 'center_y'])
+CATALOG_RECORD.__doc__ = """
+    Namedtuple of one file in FILE_CATALOG, the lengths are in angstrom,
+    bias in mV and current in pA as in the file headers
+"""
+
+_catalog_version = 1
+_file_extensions = ('.dat',)
+
+
+def footprint(file):
+    """
+    The footprint of an image on the whole scan range, assuming no pre-termination while scanning,
+    with the same geometry as in the map applet
+
+    Parameters
+    ----------
+    file : GENERIC_FILE
+        The file instance, header_only is enough
+
+    Returns
+    -------
+    center : XY2D
+        Center of the footprint in angstrom
+    bbox : tuple[float]
+        Axis aligned bounding box of the footprint (x_min, x_max, y_min, y_max) in angstrom
+    """
+    offset, nom_size = file.offset, file.nom_size
+    radians = np.deg2rad(file.rotation)
+    center = point_rot2D_y_inv(XY2D(x=offset.x, y=offset.y + nom_size.y / 2), offset, radians)
+    cos_rad, sin_rad = abs(np.cos(radians)), abs(np.sin(radians))
+    half_x = (cos_rad * nom_size.x + sin_rad * nom_size.y) / 2
+    half_y = (sin_rad * nom_size.x + cos_rad * nom_size.y) / 2
+    center = XY2D(x=float(center.x), y=float(center.y))
+    return center, (center.x - half_x, center.x + half_x, center.y - half_y, center.y + half_y)
+
+
+class FILE_CATALOG:
+    """
+    A catalog of the .dat files in directory trees, persisted in one sqlite file
+
+    Parameters
+    ----------
+    catalog_path : str
+        Path to the sqlite file, ':memory:' for a catalog which is not persisted
+
+    Examples
+    --------
+    with FILE_CATALOG('catalog.sqlite') as catalog:
+        catalog.refresh('path/to/data_folder')
+        records = catalog.query(point=(100, -50), bias=100)
+        records = catalog.query(start=datetime.datetime(2020, 6, 21), end=datetime.datetime(2020, 6, 22))
+    """
+
+    def __init__(self, catalog_path=':memory:'):
+        self.catalog_path = catalog_path
+        self.db = sqlite3.connect(catalog_path)
+        self._create_tables()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        """
+        Close the catalog
+
+        Returns
+        -------
+        None : None
+        """
+        self.db.close()
+
+    def _create_tables(self):
+        """
+        Create the tables if they do not exist yet, an R-tree is used for the bounding boxes if sqlite supports it
+
+        Returns
+        -------
+        None : None
+        """
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, _catalog_version):
+            self.db.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS bbox;')
+        with self.db:
+            self.db.execute(f'PRAGMA user_version = {_catalog_version}')
+            self.db.execute('CREATE TABLE IF NOT EXISTS files ('
+                            'id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, file_size INTEGER, '
+                            + ', '.join(f'{field} REAL' for field in CATALOG_RECORD._fields[1:]) + ')')
+            self.db.execute('CREATE INDEX IF NOT EXISTS files_timestamp ON files (timestamp)')
+            try:
+                self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS bbox USING rtree(id, x_min, x_max, y_min, y_max)')
+            except sqlite3.OperationalError:
+                # sqlite without the R-tree module, a plain table with an index on x
+                self.db.execute('CREATE TABLE IF NOT EXISTS bbox ('
+                                'id INTEGER PRIMARY KEY, x_min REAL, x_max REAL, y_min REAL, y_max REAL)')
+                self.db.execute('CREATE INDEX IF NOT EXISTS bbox_x ON bbox (x_min, x_max)')
+
+    def refresh(self, directory):
+        """
+        Scan a directory tree and update the catalog. Only files which are new, or whose mtime or size changed,
+        are read, and files which are gone are removed from the catalog.
+
+        Parameters
+        ----------
+        directory : str
+            The directory which is searched recursively
+
+        Returns
+        -------
+        updated : int
+            Number of files added or updated
+        removed : int
+            Number of files removed
+        """
+        directory = os.path.abspath(directory)
+        known = {path: (file_id, mtime_ns, file_size) for file_id, path, mtime_ns, file_size in
+                 self.db.execute('SELECT id, path, mtime_ns, file_size FROM files')
+                 if path.startswith(os.path.join(directory, ''))}
+        updated = 0
+        with self.db:
+            for root, _, fns in os.walk(directory):
+                for fn in sorted(fns):
+                    if not fn.lower().endswith(_file_extensions):
+                        continue
+                    path = os.path.join(root, fn)
+                    stat = os.stat(path)
+                    file_id, mtime_ns, file_size = known.pop(path, (None, None, None))
+                    if (mtime_ns, file_size) == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                    if file_id is not None:
+                        self._remove(file_id)
+                    updated += self._add(path, stat)
+            for file_id, _, _ in known.values():
+                self._remove(file_id)
+        return updated, len(known)
+
+    def _add(self, path, stat):
+        """
+        Read the header of a file and add it to the catalog
+
+        Parameters
+        ----------
+        path : str
+            Full file path
+        stat : os.stat_result
+            stat of the file
+
+        Returns
+        -------
+        added : int
+            1 if the file is added, 0 if its header can not be read
+        """
+        try:
+            file = DAT_IMG(path, header_only=True)
+            center, bbox = footprint(file)
+        except (KeyError, ValueError, IndexError, UnicodeDecodeError) as error:
+            warnings.warn(f'{path} is not catalogued: {error!r}')
+            return 0
+        try:
+            timestamp = file.timestamp
+        except (ValueError, TypeError):
+            timestamp = None
+        offset, nom_size = file.offset, file.nom_size
+        values = (path, file.fn, timestamp, offset.x, offset.y, nom_size.x, nom_size.y, file.rotation,
+                  file.bias, file.current, file.channels, center.x, center.y)
+        cursor = self.db.execute('INSERT INTO files (mtime_ns, file_size, ' + ', '.join(CATALOG_RECORD._fields) +
+                                 ') VALUES (?, ?' + ', ?' * len(values) + ')',
+                                 (stat.st_mtime_ns, stat.st_size) + values)
+        self.db.execute('INSERT INTO bbox VALUES (?, ?, ?, ?, ?)', (cursor.lastrowid,) + bbox)
+        return 1
+
+    def _remove(self, file_id):
+        """
+        Remove a file from the catalog
+
+        Parameters
+        ----------
+        file_id : int
+            id of the file in the catalog
+
+        Returns
+        -------
+        None : None
+        """
+        self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        self.db.execute('DELETE FROM bbox WHERE id = ?', (file_id,))
+
+    def query(self, point=None, bbox=None, start=None, end=None, bias=None, bias_tol=1e-3,
+              current=None, current_tol=1e-3, channels=None):
+        """
+        Query the catalog, all the given conditions have to be met
+
+        Parameters
+        ----------
+        point : tuple[float]
+            (x, y) in angstrom, which has to be covered by the rotated footprint of the image
+        bbox : tuple[float]
+            (x_min, x_max, y_min, y_max) in angstrom, which has to overlap with the bounding box of the footprint
+        start : datetime.datetime or float
+            Earliest datetime or timestamp
+        end : datetime.datetime or float
+            Latest datetime or timestamp
+        bias : float
+            Bias in mV
+        bias_tol : float
+            Tolerance of the bias in mV
+        current : float
+            Current in pA
+        current_tol : float
+            Tolerance of the current in pA
+        channels : int
+            Number of channels
+
+        Returns
+        -------
+        records : list[CATALOG_RECORD]
+            Sorted by time
+        """
+        conditions, params = [], []
+        if point is not None:
+            bbox = (point[0], point[0], point[1], point[1])
+        if bbox is not None:
+            conditions.append('files.id IN (SELECT id FROM bbox WHERE x_max >= ? AND x_min <= ? '
+                              'AND y_max >= ? AND y_min <= ?)')
+            params += [bbox[0], bbox[1], bbox[2], bbox[3]]
+        for field, op, value in (('timestamp', '>=', start), ('timestamp', '<=', end)):
+            if value is not None:
+                conditions.append(f'{field} {op} ?')
+                params.append(value.timestamp() if hasattr(value, 'timestamp') else value)
+        for field, value, tol in (('bias', bias, bias_tol), ('current', current, current_tol)):
+            if value is not None:
+                conditions.append(f'{field} BETWEEN ? AND ?')
+                params += [value - tol, value + tol]
+        if channels is not None:
+            conditions.append('channels = ?')
+            params.append(channels)
+
+        sql = 'SELECT ' + ', '.join(CATALOG_RECORD._fields) + ' FROM files'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        records = [CATALOG_RECORD(*row) for row in self.db.execute(sql + ' ORDER BY timestamp, path', params)]
+        if point is not None and records:
+            records = list(compress(records, _covering(records, point)))
+        return records
+
+
+def _covering(records, point):
+    """
+    Whether the rotated footprints of records cover a point, for all the records at once
+
+    Parameters
+    ----------
+    records : list[CATALOG_RECORD]
+    point : tuple[float]
+        (x, y) in angstrom
+
+    Returns
+    -------
+    covers : numpy.array
+        bool, one per record
+    """
+    fields = np.array([(r.center_x, r.center_y, r.rotation, r.nom_size_x, r.nom_size_y) for r in records])
+    centers, sizes = fields[:, :2], fields[:, 3:]
+    local = points_rot2D_y_inv(np.broadcast_to(np.asarray(point, dtype=float), centers.shape), centers,
+                               -np.deg2rad(fields[:, 2]))
+    tol = 1e-9 * sizes.max(axis=1, keepdims=True)
+    return np.all(np.abs(local - centers) <= sizes / 2 + tol, axis=1)
@@ -5,40 +5,132 @@ Created on Wed May  8 17:57:09 2019
 @author: xuc1
 """
 
+import codecs
+import functools
 import io
+import operator
 import os
 import re
 import zlib
 from itertools import compress
 
 import numpy as np
-import pandas as pd
-import yaml
 
-from .utils.misc import XY2D
+from .utils.misc import XY2D, load_global_const, affine_matrix, affine_transform
+
+cgc = load_global_const()
+
+# (property name, meta key, type) for GENERIC_FILE._extracted_meta()
+_meta_fields = (('xPixel', 'num.x', int),
+                ('yPixel', 'num.y', int),
+                ('channels', 'channels', int),
+                ('ch_zoff', 'chmodezoff', float),
+                ('ch_bias', 'chmodebias[mv]', float),
+                ('chmode', 'chmode', int),
+                ('rotation', 'rotation', float),
+                ('ddeltaX', 'dx_div_ddelta-x', int),
+                ('deltaX_dac', 'delta x', int),
+                ('channels_code', 'channelselectval', str),
+                ('scan_ymode', 'scanymode', int),
+                ('xPiezoConst', 'xpiezoconst', float),
+                ('yPiezoConst', 'ypiezoconst', float),
+                ('zPiezoConst', 'zpiezoconst', float),
+                ('bias', 'biasvoltage', float),
+                ('current', 'fblogiset', float))
+
+
+@functools.lru_cache(maxsize=None)
+def _meta_keywords(key):
+    """
+    Normalise a raw meta key such as 'Delta X / Delta X [Dac]' into its keywords.
+
+    Parameters
+    ----------
+    key : str
+        raw meta key
+
+    Returns
+    -------
+    keywords : tuple[str]
+        e.g. ('delta x', 'delta x [dac]')
+    """
+    return tuple(kw.strip().lower() for kw in key.split(' / '))
+
 
-this_dir = os.path.dirname(__file__)
-cgc_file = os.path.join(this_dir, 'Createc_global_const.yaml')
-with open(cgc_file, 'rt') as f:
-    cgc = yaml.safe_load(f.read())
+@functools.lru_cache(maxsize=32)
+def _meta_layout(keys):
+    """
+    Map the sequence of raw meta keys of a file onto the meta dict keywords.
+    Files written by the same software version share the same keys in the same order,
+    so this is computed only once per version.
+
+    Parameters
+    ----------
+    keys : tuple[str]
+        raw meta keys in the order as in the file
+
+    Returns
+    -------
+    keywords : tuple[str]
+        all keywords, in the order as in the file
+    getter : operator.itemgetter
+        picks the value for each of the keywords from the list of values
+    """
+    keywords, index = [], []
+    for i, key in enumerate(keys):
+        for kw in _meta_keywords(key):
+            keywords.append(kw)
+            index.append(i)
+    return tuple(keywords), operator.itemgetter(*index)
 
 
 class GENERIC_FILE:
     """
     Generic file class, common for .dat, .vert files etc.
 
+    Parameters
+    ----------
+    file_path : str
+        Full file path
+    file_binary : bin
+        The binary content of the file, used together with file_name
+    file_name : str
+        The file name as a string
+    header_only : bool
+        If True, only the meta data part of the file is read from disk.
+        The data part is read later on demand with _read_data_binary().
+    cache : PARSE_CACHE or str
+        An on-disk cache of parsed files, or its directory. Only used together with file_path.
+        If the cache holds a valid entry for the file, the file itself is not read,
+        the entry is left in self._cached for the child class.
+
     Returns
     -------
     generic_file : GENERIC_FILE
     """
+    _array_attrs = ('_data_binary',)
 
-    def __init__(self, file_path=None, file_binary=None, file_name=None):
+    def __init__(self, file_path=None, file_binary=None, file_name=None, header_only=False, cache=None):
         self.meta = dict()
+        self.fp = None
+        self._cache = None
+        self._cached = None
 
         if file_path is not None:
             self.fp = file_path
             _, self.fn = os.path.split(self.fp)
-            self._meta_binary, self._data_binary = self._read_binary()
+            if cache is not None:
+                self._cache = cache if isinstance(cache, PARSE_CACHE) else PARSE_CACHE(cache)
+                self._cached = self._cache.load(self)
+            if self._cached is not None:
+                self.meta = self._cached['meta']
+                self._meta_binary, self._data_binary = None, None
+                self._extracted_meta()
+                return
+            if header_only:
+                self._meta_binary, self._data_binary = self._read_meta_binary(), None
+            else:
+                self._meta_binary, self._data_binary = self._read_binary()
         else:
             self.fn = file_name
             self._meta_binary = file_binary[:int(cgc['g_file_data_bin_offset'])]
@@ -65,30 +157,61 @@ class GENERIC_FILE:
 
         return _binary[:cgc['g_file_data_bin_offset']], _binary[cgc['g_file_data_bin_offset']:]
 
+    def _read_meta_binary(self):
+        """
+        Open file in raw binary format and read the meta data part only
+
+        Returns
+        -------
+        _meta_binary : bin
+            meta data in binary
+        """
+        with open(self.fp, 'rb') as f:
+            return f.read(cgc['g_file_data_bin_offset'])
+
+    def _read_data_binary(self):
+        """
+        Return the data part of the file in binary, reading it from disk if it was skipped in header_only mode
+
+        Returns
+        -------
+        _data_binary : bin
+            data in binary
+        """
+        if self._data_binary is None:
+            with open(self.fp, 'rb') as f:
+                f.seek(cgc['g_file_data_bin_offset'])
+                self._data_binary = f.read()
+        return self._data_binary
+
     def _bin2meta_dict(self):
         """
         Convert meta binary to meta info using ansi encoding, filling out the meta dictionary
         Here ansi means Windows-1252 extended ascii code page CP-1252
 
+        The parsing stops at the first padding byte, the rest of the meta binary holds no key=value lines
+        but only e.g. an embedded thumbnail. The raw keys are mapped to the meta keywords through
+        the cached _meta_layout(), so the values are filled in with one dict.update().
+
         Returns
         -------
         None : None
         """
-
-        meta_list = self._meta_binary.decode('cp1252', errors='ignore').split('\n')
+        end = self._meta_binary.find(b'\x00')
+        meta_list = self._meta_binary[:end if end >= 0 else None].decode('cp1252', errors='ignore').split('\n')
         self.meta['file_version'] = meta_list[0]
-        for line in meta_list:
-            temp = line.split('=')
-            if len(temp) == 2:
-                keywords = temp[0].split(' / ')
-                keywords = [kw.strip().lower() for kw in keywords]
-                for kw in keywords:
-                    self.meta[kw] = temp[1][:-1]
+        key_values = [temp for temp in [line.split('=') for line in meta_list] if len(temp) == 2]
+        if not key_values:
+            return
+        keys, values = zip(*key_values)
+        keywords, getter = _meta_layout(keys)
+        values = getter([value[:-1] for value in values])
+        self.meta.update(zip(keywords, values if len(keywords) > 1 else (values,)))
 
     def _extracted_meta(self):
         """
         Assign meta data to easily readable properties.
-        One can expand these at will, one may use the method meta_key() to see what keys are available
+        One can expand these at will in _meta_fields, one may use the method meta_key() to see what keys are available
 
         Returns
         -------
@@ -97,22 +220,8 @@ class GENERIC_FILE:
         """
         self.file_version = self.meta['file_version']
         self.file_version = ''.join(e for e in self.file_version if e.isalnum())
-        self.xPixel = int(self.meta['num.x'])
-        self.yPixel = int(self.meta['num.y'])
-        self.channels = int(self.meta['channels'])
-        self.ch_zoff = float(self.meta['chmodezoff'])
-        self.ch_bias = float(self.meta['chmodebias[mv]'])
-        self.chmode = int(self.meta['chmode'])
-        self.rotation = float(self.meta['rotation'])
-        self.ddeltaX = int(self.meta['dx_div_ddelta-x'])
-        self.deltaX_dac = int(self.meta['delta x'])
-        self.channels_code = self.meta['channelselectval']
-        self.scan_ymode = int(self.meta['scanymode'])
-        self.xPiezoConst = float(self.meta['xpiezoconst'])
-        self.yPiezoConst = float(self.meta['ypiezoconst'])
-        self.zPiezoConst = float(self.meta['zpiezoconst'])
-        self.bias = float(self.meta['biasvoltage'])
-        self.current = float(self.meta['fblogiset'])
+        for attr, key, convert in _meta_fields:
+            setattr(self, attr, convert(self.meta[key]))
 
     def _spec_meta(self, spec_meta: str, index_header: str, vz_header: str, spec_headers: str):
         """
@@ -148,6 +257,53 @@ class GENERIC_FILE:
                             cgc[vz_header][self.file_version][self.spec_out_channel_count] + \
                             list(compress(cgc[spec_headers][self.file_version], self._filter))
 
+    def _export_arrays(self):
+        """
+        Return the (large) numpy arrays of the instance, to be shipped or stored separately from the rest.
+        The attributes holding them are listed in _array_attrs, see load_many()
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+        """
+        return dict()
+
+    def _import_arrays(self, arrays):
+        """
+        Restore the arrays returned by _export_arrays()
+
+        Parameters
+        ----------
+        arrays : dict[str, numpy.array]
+
+        Returns
+        -------
+        None : None
+        """
+        pass
+
+    def _shared_arrays(self):
+        """
+        The arrays to send to another process, see load_many().
+        Only the arrays already in memory are sent, the rest is read or mapped from the file again over there
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+            None if nothing is to be sent
+        """
+        return self._export_arrays()
+
+    def _reopen_arrays(self):
+        """
+        Reopen the arrays which are not sent by _shared_arrays(), see load_many()
+
+        Returns
+        -------
+        None : None
+        """
+        pass
+
     def meta_keys(self):
         """
         Print all available keys in meta
@@ -168,8 +324,8 @@ class GENERIC_FILE:
         -------
         offset : XY2D
         """
-        x_offset = np.float(self.meta['scanrotoffx'])
-        y_offset = np.float(self.meta['scanrotoffy'])
+        x_offset = float(self.meta['scanrotoffx'])
+        y_offset = float(self.meta['scanrotoffy'])
 
         # x_piezo_const = np.float(self.meta['xpiezoconst'])
         # y_piezo_const = np.float(self.meta['ypiezoconst'])
@@ -207,6 +363,90 @@ class GENERIC_FILE:
         return XY2D(y=float(self.meta['length y[a]']),
                     x=float(self.meta['length x[a]']))
 
+    def affine(self, src='pixel', dst='angstrom'):
+        """
+        The affine matrix converting 2D points between the coordinate frames of the file
+
+        'dac': the offset in DAC units, as scanrotoffx and scanrotoffy in the meta data
+        'angstrom': the piezo position in angstrom over the whole scan range, the frame of offset and of the map applet
+        'pixel': (column, row) of the images, the first pixel spans 0 ~ 1 in both, rows in the order of the scan
+
+        Parameters
+        ----------
+        src : str
+            The frame of the input points
+        dst : str
+            The frame of the output points
+
+        Returns
+        -------
+        matrix : numpy.array
+            In the shape of (3, 3), see createc.utils.misc.affine_transform
+        """
+        # only the matrices on the way are built, e.g. the pixel frame might need the images
+        to_angstrom = {'angstrom': lambda: np.eye(3),
+                       'dac': self._affine_dac2angstrom,
+                       'pixel': self._affine_pixel2angstrom}
+        assert src in to_angstrom and dst in to_angstrom, f'frames are {list(to_angstrom)}'
+        if src == dst:
+            return np.eye(3)
+        matrix = to_angstrom[src]()
+        if dst != 'angstrom':
+            matrix = np.linalg.inv(to_angstrom[dst]()) @ matrix
+        return matrix
+
+    def transform(self, points, src='pixel', dst='angstrom'):
+        """
+        Convert 2D points between the coordinate frames of the file, see affine()
+
+        Parameters
+        ----------
+        points : numpy.array
+            Points in the shape of (N, 2), or one point in the shape of (2,), as (x, y)
+        src : str
+            The frame of the input points
+        dst : str
+            The frame of the output points
+
+        Returns
+        -------
+        result : numpy.array
+            In the shape of points
+        """
+        return affine_transform(self.affine(src, dst), points)
+
+    def _affine_dac2angstrom(self):
+        """
+        The affine matrix from DAC offsets to angstrom, as in offset
+
+        Returns
+        -------
+        matrix : numpy.array
+        """
+        scale = -cgc['g_XY_volt'] / 2 ** cgc['g_XY_bits']
+        return affine_matrix(((scale * self.xPiezoConst, 0), (0, scale * self.yPiezoConst)))
+
+    def _affine_pixel2angstrom(self):
+        """
+        The affine matrix from pixels to angstrom, with the same geometry as in the map applet:
+        offset is the middle of the first scan line, the image is rotated around it by rotation.
+        The pixel size comes from Num.X and Num.Y, only a scan in ScanYMode 2 needs the number of scanned lines
+        from the images, as it ends at the nominal frame.
+
+        Returns
+        -------
+        matrix : numpy.array
+        """
+        offset, nom_size = self.offset, self.nom_size
+        y_start = nom_size.y * (self.yPixel - self.img_pixels.y) / self.yPixel if self.scan_ymode == 2 else 0
+        radians = np.deg2rad(self.rotation)
+        cos_rad, sin_rad = np.cos(radians), np.sin(radians)
+        # scale to angstrom, move the middle of the first line to the origin, rotate as point_rot2D_y_inv, then shift
+        rotation = affine_matrix(((cos_rad, sin_rad), (-sin_rad, cos_rad)), (offset.x, offset.y))
+        scale = affine_matrix(((nom_size.x / self.xPixel, 0), (0, nom_size.y / self.yPixel)),
+                              (-nom_size.x / 2, y_start))
+        return rotation @ scale
+
     @property
     def datetime(self):
         """
@@ -242,29 +482,91 @@ class VERT_SPEC(GENERIC_FILE):
     ----------
     file_path : str
         Full file path
+    cache : PARSE_CACHE or str
+        An on-disk cache of parsed files, or its directory
 
     Returns
     -------
     vert_spec : VERT_SPEC
     """
+    _array_attrs = ('_data_binary', 'spec')
 
-    def __init__(self, file_path=None, file_binary=None, file_name=None):
-        super().__init__(file_path, file_binary, file_name)
+    def __init__(self, file_path=None, file_binary=None, file_name=None, cache=None):
+        super().__init__(file_path, file_binary, file_name, cache=cache)
 
-        spec_data = self._data_binary.decode('cp1252', errors='ignore')
-        _, spec_meta, spec_f_obj = spec_data.split('\n', maxsplit=2)
+        if self._cached is not None:
+            self._spec_meta_line = self._cached['state']['spec_meta']
+        else:
+            _, spec_meta, spec_body = self._data_binary.split(b'\n', maxsplit=2)
+            self._spec_meta_line = spec_meta.decode('cp1252', errors='ignore')
 
-        super()._spec_meta(spec_meta=spec_meta,
+        super()._spec_meta(spec_meta=self._spec_meta_line,
                            index_header='g_file_spec_index_header',
                            vz_header='g_file_spec_vz_header',
                            spec_headers='g_file_spec_headers')
-        # f_obj = io.StringIO('\n'.join(self._line_list[cgc['g_file_spec_skip_rows'][self.file_version]:]))
-        self.spec = pd.read_csv(filepath_or_buffer=io.StringIO(spec_f_obj), sep=cgc['g_file_spec_delimiter'],
-                                header=None,
-                                names=self.spec_headers,
-                                index_col=cgc['g_file_spec_index_header'],
-                                engine='python',
-                                usecols=range(len(self.spec_headers)))
+        if self._cached is not None:
+            self._import_arrays(self._cached['arrays'])
+            self._cached = None
+            return
+        self.spec = self._read_spec(spec_body)
+        if self._cache is not None:
+            self._cache.store(self, state={'spec_meta': self._spec_meta_line})
+
+    def _read_spec(self, spec_body):
+        """
+        Parse the tab-delimited spec table into a DataFrame with the C engine of pandas.read_csv
+
+        Parameters
+        ----------
+        spec_body : bin
+            the spec table in binary, one line per data point
+
+        Returns
+        -------
+        spec : pandas.DataFrame
+        """
+        import pandas as pd
+
+        # the delimiter in Createc_global_const is the escaped string r'\t', only the python engine reads it as a regex
+        delimiter = codecs.decode(cgc['g_file_spec_delimiter'], 'unicode_escape')
+        return pd.read_csv(filepath_or_buffer=io.BytesIO(spec_body), sep=delimiter,
+                           header=None,
+                           names=self.spec_headers,
+                           index_col=cgc['g_file_spec_index_header'],
+                           engine='c',
+                           usecols=range(len(self.spec_headers)))
+
+    def _export_arrays(self):
+        """
+        Return the index and the columns of spec as numpy arrays
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+        """
+        arrays = {'index': self.spec.index.to_numpy()}
+        for i, header in enumerate(self.spec.columns):
+            arrays[f'spec{i}'] = self.spec[header].to_numpy()
+        return arrays
+
+    def _import_arrays(self, arrays):
+        """
+        Rebuild spec from the arrays returned by _export_arrays()
+
+        Parameters
+        ----------
+        arrays : dict[str, numpy.array]
+
+        Returns
+        -------
+        None : None
+        """
+        import pandas as pd
+
+        index_header, = cgc['g_file_spec_index_header']
+        columns = [h for h in self.spec_headers if h != index_header]
+        self.spec = pd.DataFrame({header: arrays[f'spec{i}'] for i, header in enumerate(columns)},
+                                 index=pd.Index(arrays['index'], name=index_header))
 
 
 class DAT_IMG(GENERIC_FILE):
@@ -281,6 +583,14 @@ class DAT_IMG(GENERIC_FILE):
 
     b. the file_name as a string
 
+    With header_only=True only the meta data is read when the instance is created,
+    the images are read and decoded on the first access to imgs, img_array_list or img_pixels.
+
+    With mmap=True the file is memory-mapped. For a file which is not zlib-compressed,
+    img_array_list holds read-only views into the mapped file, so the images are not copied into memory,
+    and the pages are shared between processes opening the same file.
+    Compressed files are decompressed straight from the mapped file.
+
     Parameters
     ----------
     file_path : str
@@ -289,6 +599,13 @@ class DAT_IMG(GENERIC_FILE):
         the binary content of the file together
     file_name : str
         the file_name as a string
+    header_only : bool
+        whether to defer reading and decoding the images until they are accessed
+    mmap : bool
+        whether to memory-map the file instead of reading it, only works with file_path
+    cache : PARSE_CACHE or str
+        an on-disk cache of parsed files, or its directory, only works with file_path.
+        The images are taken from the cache if it is valid, otherwise they are stored there once decoded.
 
     Returns
     -------
@@ -297,18 +614,111 @@ class DAT_IMG(GENERIC_FILE):
         Meta data is a dict, one can expand the dict at will.
         Images are a list of numpy arrays.
     """
+    _array_attrs = ('_data_binary', '_img_array_list', '_imgs')
+
+    def __init__(self, file_path=None, file_binary=None, file_name=None, header_only=False, mmap=False,
+                 cache=None):
+        assert not mmap or file_path is not None, 'mmap is only possible with file_path'
+        super().__init__(file_path, file_binary, file_name, header_only or mmap, cache)
+        self._mmap = mmap
+        self._img_array_list = None
+        self._imgs = None
+
+        if self._cached is not None:
+            self._import_arrays(self._cached['arrays'])
+            self._cached = None
+        elif not header_only:
+            self._load_img()
 
-    def __init__(self, file_path=None, file_binary=None, file_name=None):
-        super().__init__(file_path, file_binary, file_name)
-        self.img_array_list = []
-        self._read_img()
+    @property
+    def img_array_list(self):
+        """
+        The raw images as a list of numpy arrays, one for each channel
 
-        # imgs are numpy arrays, with rows with only zeros cropped off
-        self.imgs = [self._crop_img(arr) for arr in self.img_array_list]
+        Returns
+        -------
+        img_array_list : list[numpy.array]
+        """
+        if self._img_array_list is None:
+            self._load_img()
+        return self._img_array_list
+
+    @property
+    def imgs(self):
+        """
+        The images as a list of numpy arrays, with rows with only zeros cropped off
+
+        Returns
+        -------
+        imgs : list[numpy.array]
+        """
+        if self._imgs is None:
+            self._imgs = [self._crop_img(arr, view=self._mmap) for arr in self.img_array_list]
+        return self._imgs
+
+    @property
+    def img_pixels(self):
+        """
+        The size of the (cropped) images in pixels in namedtuple (x, y)
+
+        Returns
+        -------
+        img_pixels : XY2D
+        """
         # assert(len(set(img.shape for img in self.imgs)) <= 1)
-        # Pixels = namedtuple('Pixels', ['y', 'x'])
-        self.img_pixels = XY2D(y=self.imgs[0].shape[0],
-                               x=self.imgs[0].shape[1])  # size in (y, x)
+        return XY2D(y=self.imgs[0].shape[0],
+                    x=self.imgs[0].shape[1])  # size in (y, x)
+
+    def _export_arrays(self):
+        """
+        Return the raw images as numpy arrays
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+        """
+        return {f'img{i}': arr for i, arr in enumerate(self.img_array_list)}
+
+    def _import_arrays(self, arrays):
+        """
+        Restore the raw images from the arrays returned by _export_arrays()
+
+        Parameters
+        ----------
+        arrays : dict[str, numpy.array]
+
+        Returns
+        -------
+        None : None
+        """
+        self._img_array_list = [arrays[f'img{i}'] for i in range(self.channels)]
+        self._imgs = None
+
+    def _shared_arrays(self):
+        """
+        The raw images if they are decoded, nothing for a header-only or memory-mapped file,
+        whose images are read or mapped lazily as usual
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+            None if nothing is to be sent
+        """
+        if self._img_array_list is None or self._mmap:
+            return None
+        return self._export_arrays()
+
+    def _load_img(self):
+        """
+        Read the images from the file, and store them in the cache if there is one
+
+        Returns
+        -------
+        None : None
+        """
+        self._read_img()
+        if self._cache is not None:
+            self._cache.store(self)
 
     def _read_img(self):
         """
@@ -320,20 +730,50 @@ class DAT_IMG(GENERIC_FILE):
         -------
         None : None
         """
+        if self._mmap:
+            return self._map_img()
+        data_binary = self._read_data_binary()
         try:
             # if it is compressed data, then decompress it
-            decompressed_data = zlib.decompress(self._data_binary)
+            decompressed_data = zlib.decompress(data_binary)
         except zlib.error:
             # else if it is not compressed, then do nothing
-            decompressed_data = self._data_binary
+            decompressed_data = data_binary
         img_array = np.frombuffer(decompressed_data, np.dtype(cgc['g_file_dat_img_pixel_data_npdtype']))
         img_array = np.reshape(img_array[1: self.xPixel * self.yPixel * self.channels + 1],
                                (self.channels * self.yPixel, self.xPixel))
-        for i in range(self.channels):
-            self.img_array_list.append(img_array[self.yPixel * i:self.yPixel * (i + 1)])
+        self._img_array_list = [img_array[self.yPixel * i:self.yPixel * (i + 1)] for i in range(self.channels)]
+
+    def _map_img(self):
+        """
+        Memory-map the img binary, filling out the img_array_list.
+        Uncompressed data are used in place as views into the file,
+        compressed data are decompressed directly from the mapped file.
+        prerequisite: self.xPixel, self.yPixel, self.channels
+
+        Returns
+        -------
+        None : None
+        """
+        pixel_dtype = np.dtype(cgc['g_file_dat_img_pixel_data_npdtype'])
+        data_binary = np.memmap(self.fp, dtype=np.uint8, mode='r', offset=cgc['g_file_data_bin_offset'])
+        try:
+            decompressed_data = zlib.decompress(data_binary)
+        except zlib.error:
+            decompressed_data = None
+        if decompressed_data is None:
+            # it is not compressed, skip the first pixel as in _read_img()
+            img_array = np.memmap(self.fp, dtype=pixel_dtype, mode='r',
+                                  offset=cgc['g_file_data_bin_offset'] + pixel_dtype.itemsize,
+                                  shape=(self.channels * self.yPixel, self.xPixel))
+        else:
+            img_array = np.frombuffer(decompressed_data, pixel_dtype)
+            img_array = np.reshape(img_array[1: self.xPixel * self.yPixel * self.channels + 1],
+                                   (self.channels * self.yPixel, self.xPixel))
+        self._img_array_list = [img_array[self.yPixel * i:self.yPixel * (i + 1)] for i in range(self.channels)]
 
     @staticmethod
-    def _crop_img(arr):
+    def _crop_img(arr, view=False):
         """
         Crop an image, by removing all rows which contain only zeros.
 
@@ -341,32 +781,48 @@ class DAT_IMG(GENERIC_FILE):
         ----------
         arr : numpy array
             Individual image
+        view : bool
+            If True, return a view instead of a copy when the remaining rows are contiguous,
+            which is the usual case of a scan terminated early.
 
         Returns
         -------
         arr : numpy array
             Cropped image
         """
-        return arr[~np.all(arr == 0, axis=1)]
+        rows = ~np.all(arr == 0, axis=1)
+        if view:
+            idx = np.flatnonzero(rows)
+            if len(idx) == 0 or idx[-1] - idx[0] + 1 == len(idx):
+                return arr[idx[0]:idx[-1] + 1] if len(idx) else arr[:0]
+        return arr[rows]
 
 
 class GRID_SPEC:
     """
     Read .gridspec file
 
+    With mmap=True the file is memory-mapped instead of read, so grids larger than the memory can be opened.
+    specdata, cube_array etc. are then read-only views into the file, only the parts which are indexed
+    are read from disk. Use pixel() and iter_blocks() to go through the grid piece by piece.
+
     Parameters
     ----------
     file_path : str
         The file path to the .specgrid file
+    mmap : bool
+        Whether to memory-map the file instead of reading it
     """
-    def __init__(self, file_path):
+    _array_attrs = ('specvz', 'specvz3', 'data', 'specdata', 'cube_array')
+
+    def __init__(self, file_path, mmap=False):
 
         self.fp = file_path
         _, self.fn = os.path.split(self.fp)
+        self._mmap = mmap
         # self.DAT_IMG = DAT_IMG(file_path + ".dat")
 
-        with open(file_path, "rb") as file:
-            b = np.fromfile(file, dtype=np.float32)
+        b = self._read_floats()
 
         a = b[:256].view(np.uint32)
 
@@ -418,3 +874,451 @@ class GRID_SPEC:
         self.cube_array = self.specdata[:, :, :, 1].T
 
         _, self.xpix, self.ypix = self.cube_array.shape
+
+    def _read_floats(self):
+        """
+        Read or memory-map the whole file as float32
+
+        Returns
+        -------
+        b : numpy.array or numpy.memmap
+        """
+        if self._mmap:
+            return np.memmap(self.fp, dtype=np.float32, mode='r')
+        with open(self.fp, "rb") as file:
+            return np.fromfile(file, dtype=np.float32)
+
+    def pixel(self, x, y):
+        """
+        Return the spectrum at one pixel of the grid
+
+        Parameters
+        ----------
+        x : int
+            pixel index along the first axis of specdata
+        y : int
+            pixel index along the second axis of specdata
+
+        Returns
+        -------
+        spectrum : numpy.array
+            in the shape of (vertpoints, channels)
+        """
+        return np.array(self.specdata[x, y])
+
+    def iter_blocks(self, rows=16, channel=None):
+        """
+        Iterate over the grid in blocks of rows along the first axis of specdata.
+        In mmap mode only one block is in memory at a time.
+
+        Parameters
+        ----------
+        rows : int
+            number of rows in a block
+        channel : int
+            if given, only this channel is returned
+
+        Yields
+        ------
+        (slice, numpy.array)
+            The rows of the block, and the block in the shape of (rows, b, vertpoints, channels),
+            or (rows, b, vertpoints) for a single channel
+        """
+        assert rows > 0, 'rows should be larger than 0'
+        for start in range(0, self.specdata.shape[0], rows):
+            block = slice(start, min(start + rows, self.specdata.shape[0]))
+            if channel is None:
+                yield block, np.array(self.specdata[block])
+            else:
+                yield block, np.array(self.specdata[block, :, :, channel])
+
+    def _export_arrays(self):
+        """
+        Return the bias/z table and the spectra as numpy arrays
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+        """
+        return {'specvz3': self.specvz3, 'specdata': self.specdata}
+
+    def _import_arrays(self, arrays):
+        """
+        Restore the arrays returned by _export_arrays(), together with the views on them
+
+        Parameters
+        ----------
+        arrays : dict[str, numpy.array]
+
+        Returns
+        -------
+        None : None
+        """
+        self.specvz3 = arrays['specvz3']
+        self.specvz = self.specvz3.reshape(-1)
+        self.specdata = arrays['specdata']
+        self.data = self.specdata.reshape(-1)
+        self.cube_array = self.specdata[:, :, :, 1].T
+
+    def _shared_arrays(self):
+        """
+        The arrays to send to another process, nothing in mmap mode, where they are mapped again over there
+
+        Returns
+        -------
+        arrays : dict[str, numpy.array]
+            None if nothing is to be sent
+        """
+        return None if self._mmap else self._export_arrays()
+
+    def _reopen_arrays(self):
+        """
+        Read or map the arrays from the file again, see load_many()
+
+        Returns
+        -------
+        None : None
+        """
+        b = self._read_floats()
+        self._import_arrays({'specvz3': b[256: 256 + self.count3].reshape(self.vertpoints, 3),
+                             'specdata': b[256 + self.count3:].reshape(self.a, self.b, self.vertpoints, -1)})
+
+
+class PARSE_CACHE:
+    """
+    On-disk cache of parsed files, e.g. DAT_IMG(file_path, cache=PARSE_CACHE('path/to/cache'))
+
+    Each entry is one .npz file in cache_dir, holding the meta dict and the arrays of a parsed file.
+    An entry is keyed by the file class and the absolute path, size and modification time of the file,
+    so it is not used any more once the file changes.
+    When the entries exceed max_bytes in total, the least recently used ones are removed.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache, it is created if it does not exist
+    max_bytes : int
+        Maximum total size of the cache in bytes, default to 1 GB
+    """
+    _version = 1  # to be increased whenever the content of the entries changes
+
+    def __init__(self, cache_dir, max_bytes=2 ** 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, file):
+        """
+        Path of the cache entry for a file instance
+
+        Parameters
+        ----------
+        file : GENERIC_FILE
+            with file.fp
+
+        Returns
+        -------
+        entry_path : str
+        """
+        import hashlib
+
+        fp = os.path.abspath(file.fp)
+        stat = os.stat(fp)
+        key = f'{self._version}|{type(file).__name__}|{fp}|{stat.st_size}|{stat.st_mtime_ns}'
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npz')
+
+    def load(self, file):
+        """
+        Load the cache entry for a file instance
+
+        Parameters
+        ----------
+        file : GENERIC_FILE
+            with file.fp
+
+        Returns
+        -------
+        entry : dict or None
+            {'meta': dict, 'state': dict, 'arrays': dict[str, numpy.array]}, None if there is no valid entry
+        """
+        import json
+        import zipfile
+
+        entry_path = self._entry_path(file)
+        try:
+            with np.load(entry_path, allow_pickle=False) as npz:
+                entry = {'meta': json.loads(str(npz['__meta__'])),
+                         'state': json.loads(str(npz['__state__'])),
+                         'arrays': {k: npz[k] for k in npz.files if k not in ('__meta__', '__state__')}}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # a corrupted entry, e.g. from an interrupted write
+            self._remove(entry_path)
+            return None
+        os.utime(entry_path)  # mark as recently used
+        return entry
+
+    def store(self, file, state=None):
+        """
+        Store a parsed file instance, then evict the least recently used entries if the cache is too large
+
+        Parameters
+        ----------
+        file : GENERIC_FILE
+            with file.fp
+        state : dict
+            extra JSON-serializable information needed to rebuild the instance
+
+        Returns
+        -------
+        None : None
+        """
+        import json
+        import tempfile
+
+        entry_path = self._entry_path(file)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, __meta__=json.dumps(file.meta), __state__=json.dumps(state or {}),
+                         **file._export_arrays())
+            os.replace(temp_path, entry_path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        Remove the least recently used entries until the cache is not larger than max_bytes
+
+        Parameters
+        ----------
+        max_bytes : int
+            default to self.max_bytes, 0 to clear the cache
+
+        Returns
+        -------
+        None : None
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= max_bytes:
+                break
+            self._remove(entry_path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        """
+        Remove a file if it still exists
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        None : None
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_file_kinds = {'dat': DAT_IMG, 'vert': VERT_SPEC, 'grid': GRID_SPEC}
+
+
+def _arrays_to_shared_memory(arrays):
+    """
+    Copy numpy arrays into one new block of shared memory
+
+    Parameters
+    ----------
+    arrays : dict[str, numpy.array]
+
+    Returns
+    -------
+    name : str
+        name of the shared memory block
+    layout : list[tuple]
+        (key, dtype, shape, offset) for each array
+    """
+    from multiprocessing import shared_memory
+
+    layout = []
+    size = 0
+    for key, arr in arrays.items():
+        layout.append((key, arr.dtype.str, arr.shape, size))
+        size += -(-arr.nbytes // 64) * 64  # keep every array 64-byte aligned
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for (_, dtype, shape, offset), arr in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = arr
+    finally:
+        shm.close()
+    return shm.name, layout
+
+
+def _arrays_from_shared_memory(name, layout):
+    """
+    Copy the arrays out of a block of shared memory made by _arrays_to_shared_memory(), and free the block
+
+    Parameters
+    ----------
+    name : str
+        name of the shared memory block
+    layout : list[tuple]
+        (key, dtype, shape, offset) for each array
+
+    Returns
+    -------
+    arrays : dict[str, numpy.array]
+    """
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        arrays = {key: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset).copy()
+                  for key, dtype, shape, offset in layout}
+    finally:
+        shm.close()
+        shm.unlink()
+    return arrays
+
+
+def _load_to_shared_memory(kind, file_path, kwargs):
+    """
+    Worker of load_many(), it parses one file and puts its arrays into shared memory
+
+    Parameters
+    ----------
+    kind : str
+        'dat', 'vert' or 'grid'
+    file_path : str
+        Full file path
+    kwargs : dict
+        Extra keyword arguments for the file class
+
+    Returns
+    -------
+    state : dict
+        the instance __dict__ without the arrays
+    name : str
+        name of the shared memory block, None if no arrays are sent
+    layout : list[tuple]
+        (key, dtype, shape, offset) for each array
+    """
+    file = _file_kinds[kind](file_path, **kwargs)
+    arrays = file._shared_arrays()
+    name, layout = (None, None) if arrays is None else _arrays_to_shared_memory(arrays)
+    state = file.__dict__.copy()
+    state.update(dict.fromkeys(file._array_attrs))
+    return state, name, layout
+
+
+def _load_from_shared_memory(kind, state, name, layout):
+    """
+    Rebuild the instance from what _load_to_shared_memory() returns
+
+    Parameters
+    ----------
+    kind : str
+        'dat', 'vert' or 'grid'
+    state : dict
+        the instance __dict__ without the arrays
+    name : str
+        name of the shared memory block, None if no arrays are sent
+    layout : list[tuple]
+        (key, dtype, shape, offset) for each array
+
+    Returns
+    -------
+    file : DAT_IMG, VERT_SPEC or GRID_SPEC
+    """
+    cls = _file_kinds[kind]
+    file = cls.__new__(cls)
+    file.__dict__.update(state)
+    if name is None:
+        file._reopen_arrays()
+    else:
+        file._import_arrays(_arrays_from_shared_memory(name, layout))
+    return file
+
+
+def load_many(file_paths, workers=None, kind='dat', as_completed=False, **kwargs):
+    """
+    Load many files in parallel with a pool of processes.
+
+    Each file is parsed (decompression, meta data, spec table etc.) in a worker process,
+    the arrays are sent back through shared memory instead of being pickled.
+    Arrays which are not in memory, of header-only or memory-mapped files, are not sent
+    but read or mapped lazily in this process as usual.
+    On Windows the calling script needs the usual `if __name__ == '__main__':` guard.
+
+    Parameters
+    ----------
+    file_paths : list[str]
+        Full file paths
+    workers : int
+        Number of worker processes, default to the number of CPUs.
+        With 1 the files are loaded one by one in the current process.
+    kind : str
+        'dat' for DAT_IMG, 'vert' for VERT_SPEC or 'grid' for GRID_SPEC
+    as_completed : bool
+        If False, return a list in the same order as file_paths.
+        If True, return an iterator of (file_path, file) in the order the files are done.
+    kwargs :
+        Extra keyword arguments for the file class, e.g. header_only=True
+
+    Returns
+    -------
+    files : list or iterator
+    """
+    assert kind in _file_kinds, f'kind should be one of {list(_file_kinds)}'
+    file_paths = list(file_paths)
+
+    if workers == 1:
+        files = ((fp, _file_kinds[kind](fp, **kwargs)) for fp in file_paths)
+        return files if as_completed else [file for _, file in files]
+
+    import concurrent.futures
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import resource_tracker
+
+    # let the workers share the resource tracker with this process,
+    # so a shared memory block outlives the worker which creates it
+    if os.name == 'posix':
+        resource_tracker.ensure_running()
+
+    def generate():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_load_to_shared_memory, kind, fp, kwargs): i
+                       for i, fp in enumerate(file_paths)}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield futures.pop(future), _load_from_shared_memory(kind, *future.result())
+            finally:
+                # free the shared memory of the files which are not consumed
+                for future in futures:
+                    if not future.cancel() and future.exception() is None:
+                        _, name, layout = future.result()
+                        if name is not None:
+                            _arrays_from_shared_memory(name, [])
+
+    if as_completed:
+        return ((file_paths[i], file) for i, file in generate())
+    # through generate() as well, so the shared memory of the other files is freed if one fails
+    files = dict(generate())
+    return [files[i] for i in range(len(file_paths))]
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked and compressed columnar store for Createc files, based on HDF5 (h5py)
+
+Each file becomes one group, named after its path relative to the exported directory or after its file name,
+with the meta data and the properties as typed attributes, images and spectra as chunked datasets.
+Single channels or regions can then be sliced without decompressing the whole file.
+"""
+
+import os
+
+import numpy as np
+
+from .Createc_pyFile import DAT_IMG, VERT_SPEC, GRID_SPEC
+
+_file_kinds = {'dat': DAT_IMG, 'vert': VERT_SPEC, 'grid': GRID_SPEC}
+_file_extensions = {'.dat': 'dat', '.vert': 'vert', '.specgrid': 'grid'}
+_block_bytes = 2 ** 26  # arrays are written in blocks of about 64 MB along the first axis
+_meta_prefix = 'meta:'  # of the attribute of each meta entry, which also allows the empty key
+_meta_text_prefix = 'meta_text:'  # of the original text of a meta value, where the number does not reproduce it
+
+
+def _typed(text):
+    """
+    A meta value as a number if it is one
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    value : numpy.int64, numpy.float64 or str
+    """
+    for dtype in (np.int64, np.float64):
+        try:
+            return dtype(text)
+        except (ValueError, OverflowError):
+            pass
+    return text
+
+
+class FILE_STORE:
+    """
+    A store of DAT_IMG, VERT_SPEC and GRID_SPEC instances in one HDF5 file.
+
+    The arrays from the _export_arrays() method of each instance are stored as chunked datasets,
+    e.g. 'img0', 'img1' ... for DAT_IMG, 'index', 'spec0', 'spec1' ... for VERT_SPEC
+    and 'specvz3', 'specdata' for GRID_SPEC. Each meta entry is an attribute 'meta:<key>', an int64 or float64
+    if the value is a number, otherwise a str. load() rebuilds the instance exactly.
+
+    The files are named by their paths relative to the directory given to add_files(), with '/' as separator,
+    so the files of the same name in different folders are kept apart.
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the .h5 file
+    mode : str
+        'r' to read only, 'a' to read and write, 'w' to create a new store
+
+    Examples
+    --------
+    with FILE_STORE('data.h5', 'a') as store:
+        store.add_files('path/to/data_folder')
+        img = store.load('A200622.081914.dat')
+        corner = store.dataset('A200622.081914.dat', 'img0')[:64, :64]
+    """
+
+    def __init__(self, store_path, mode='a'):
+        import h5py
+
+        self.store_path = store_path
+        self.h5 = h5py.File(store_path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the store
+
+        Returns
+        -------
+        None : None
+        """
+        self.h5.close()
+
+    def names(self):
+        """
+        Names of all the files in the store
+
+        Returns
+        -------
+        names : list[str]
+        """
+        names = []
+        self.h5.visititems(lambda name, obj: names.append(name) if 'kind' in obj.attrs else None)
+        return names
+
+    def add(self, file, compression='gzip', name=None):
+        """
+        Add a file instance to the store, replacing any file of the same name
+
+        Parameters
+        ----------
+        file : DAT_IMG, VERT_SPEC or GRID_SPEC
+            The file instance
+        compression : str
+            HDF5 compression filter, e.g. 'gzip', 'lzf' or None
+        name : str
+            Name of the file in the store, e.g. 'folder/A200622.081914.dat', by default the file name
+
+        Returns
+        -------
+        None : None
+        """
+        kind, = [k for k, cls in _file_kinds.items() if type(file) is cls]
+        name = file.fn if name is None else name
+        if name in self.h5:
+            del self.h5[name]
+        group = self.h5.create_group(name, track_order=True)
+        group.attrs['kind'] = kind
+
+        arrays = file._export_arrays()
+        none_attrs, builtin_attrs = [], []
+        for attr, value in vars(file).items():
+            if attr in file._array_attrs or attr in ('meta', '_cache', '_cached'):
+                continue
+            if value is None:
+                none_attrs.append(attr)
+            elif isinstance(value, (bool, int, float, str)):
+                builtin_attrs.append(attr)
+                group.attrs[attr] = value
+            elif isinstance(value, np.generic):
+                group.attrs[attr] = value
+        group.attrs['_none_attrs'] = none_attrs
+        group.attrs['_builtin_attrs'] = builtin_attrs
+
+        if isinstance(file, (DAT_IMG, VERT_SPEC)):
+            for key, text in file.meta.items():
+                value = _typed(text)
+                group.attrs[_meta_prefix + key] = value
+                if str(value) != text:
+                    # e.g. '100.00', kept as well so the meta dict is rebuilt exactly
+                    group.attrs[_meta_text_prefix + key] = text
+
+        for key, arr in arrays.items():
+            dataset = group.create_dataset(key, shape=arr.shape, dtype=arr.dtype,
+                                           chunks=True if arr.ndim else None,
+                                           compression=compression if arr.ndim else None)
+            if arr.ndim == 0:
+                dataset[()] = arr
+                continue
+            step = max(1, _block_bytes // max(1, arr[:1].nbytes))
+            for start in range(0, arr.shape[0], step):
+                dataset[start:start + step] = arr[start:start + step]
+
+    def add_files(self, file_paths, compression='gzip', **kwargs):
+        """
+        Add files to the store, the kind of a file is given by its extension (.dat, .vert or .specgrid)
+
+        Parameters
+        ----------
+        file_paths : str or list[str]
+            Full file paths, or a directory which is searched recursively
+        compression : str
+            HDF5 compression filter, e.g. 'gzip', 'lzf' or None
+        kwargs :
+            Extra keyword arguments for the file classes, e.g. cache=...
+
+        Returns
+        -------
+        names : list[str]
+            Names of the files added, their paths relative to the directory, or their file names
+        """
+        directory = None
+        if isinstance(file_paths, str) and os.path.isdir(file_paths):
+            directory = file_paths
+            file_paths = [os.path.join(root, fn) for root, _, fns in sorted(os.walk(directory)) for fn in sorted(fns)]
+        files = dict()
+        for fp in file_paths:
+            kind = _file_extensions.get(os.path.splitext(fp)[1].lower())
+            if kind is None:
+                continue
+            name = os.path.basename(fp) if directory is None else os.path.relpath(fp, directory).replace(os.sep, '/')
+            if name in files:
+                raise ValueError(f'{fp} and {files[name][0]} would have the same name {name} in the store')
+            files[name] = fp, kind
+        for name, (fp, kind) in files.items():
+            if kind == 'grid':
+                file = GRID_SPEC(fp, mmap=True)
+            else:
+                file = _file_kinds[kind](fp, **kwargs)
+            self.add(file, compression, name)
+        return list(files)
+
+    def dataset(self, name, key):
+        """
+        Return a dataset of a file for slicing, only the chunks which are sliced are read and decompressed
+
+        Parameters
+        ----------
+        name : str
+            Name of the file in the store
+        key : str
+            Dataset name, e.g. 'img0' or 'specdata'
+
+        Returns
+        -------
+        dataset : h5py.Dataset
+        """
+        return self.h5[name][key]
+
+    def load(self, name):
+        """
+        Load a file instance from the store
+
+        Parameters
+        ----------
+        name : str
+            Name of the file in the store
+
+        Returns
+        -------
+        file : DAT_IMG, VERT_SPEC or GRID_SPEC
+        """
+        group = self.h5[name]
+        cls = _file_kinds[group.attrs['kind']]
+        file = cls.__new__(cls)
+        file.__dict__.update(dict.fromkeys(cls._array_attrs))
+        file.__dict__.update(dict.fromkeys(group.attrs['_none_attrs']))
+        builtin_attrs = set(group.attrs['_builtin_attrs'])
+        meta = dict()
+        for attr, value in group.attrs.items():
+            if attr.startswith(_meta_prefix):
+                key = attr[len(_meta_prefix):]
+                meta[key] = group.attrs.get(_meta_text_prefix + key, str(value))
+                continue
+            if attr in ('kind', '_none_attrs', '_builtin_attrs') or attr.startswith(_meta_text_prefix):
+                continue
+            setattr(file, attr, value.item() if attr in builtin_attrs and hasattr(value, 'item') else value)
+
+        arrays = {key: dataset[()] for key, dataset in group.items()}
+        if isinstance(file, (DAT_IMG, VERT_SPEC)):
+            file.meta = meta
+            file._meta_binary, file._cache, file._cached = None, None, None
+        if hasattr(file, '_mmap'):
+            file._mmap = False  # the arrays are read into memory
+        if isinstance(file, VERT_SPEC):
+            file._spec_meta(spec_meta=file._spec_meta_line,
+                            index_header='g_file_spec_index_header',
+                            vz_header='g_file_spec_vz_header',
+                            spec_headers='g_file_spec_headers')
+        file._import_arrays(arrays)
+        return file
+
+
+def export_store(file_paths, store_path, compression='gzip', **kwargs):
+    """
+    Export files, or a whole directory of them, into a FILE_STORE
+
+    Parameters
+    ----------
+    file_paths : str or list[str]
+        Full file paths, or a directory which is searched recursively
+    store_path : str
+        Path to the .h5 file, it is created if it does not exist
+    compression : str
+        HDF5 compression filter, e.g. 'gzip', 'lzf' or None
+    kwargs :
+        Extra keyword arguments for the file classes
+
+    Returns
+    -------
+    names : list[str]
+        Names of the files exported
+    """
+    with FILE_STORE(store_path, 'a') as store:
+        return store.add_files(file_paths, compression, **kwargs)
+
+
+def load_store(store_path, name):
+    """
+    Load one file instance from a FILE_STORE
+
+    Parameters
+    ----------
+    store_path : str
+        Path to the .h5 file
+    name : str
+        Name of the file in the store
+
+    Returns
+    -------
+    file : DAT_IMG, VERT_SPEC or GRID_SPEC
+    """
+    with FILE_STORE(store_path, 'r') as store:
+        return store.load(name)
@@ -6,6 +6,35 @@ Created on Wed May 20 22:24:50 2020
 """
 __version__ = '1.0'
 
-from .Createc_pyCOM import CreatecWin32
-from .Createc_pyFile import DAT_IMG
-from .Createc_pyFile import VERT_SPEC
+# The public classes are imported on first access, so `import createc` stays cheap
+_lazy_attrs = {'CreatecWin32': 'Createc_pyCOM',
+               'DAT_IMG': 'Createc_pyFile',
+               'VERT_SPEC': 'Createc_pyFile',
+               'load_many': 'Createc_pyFile'}
+
+__all__ = list(_lazy_attrs)
+
+
+def __getattr__(name):
+    """
+    Import the public classes lazily
+
+    Parameters
+    ----------
+    name : str
+        attribute name
+
+    Returns
+    -------
+    attr : object
+    """
+    if name in _lazy_attrs:
+        import importlib
+        attr = getattr(importlib.import_module('.' + _lazy_attrs[name], __name__), name)
+        globals()[name] = attr
+        return attr
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
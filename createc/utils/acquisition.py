@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Background acquisition into preallocated ring buffers
+
+An ACQUISITION_THREAD calls the producer functions at its own rate and writes the samples into one RING_BUFFER
+per channel, so that a GUI can read whole batches at a lower frame rate, independent of the sampling.
+"""
+import threading
+import time
+
+import numpy as np
+
+from .data_producer import ADC_BATCH
+
+
+class RING_BUFFER:
+    """
+    Preallocated ring buffer of the timestamps and the values of one channel, thread safe
+
+    Parameters
+    ----------
+    capacity : int
+        Number of samples kept, older samples are overwritten
+    dtype : numpy.dtype
+        dtype of the values
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        assert capacity > 0, 'capacity should be larger than 0'
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity, dtype=dtype)
+        self.count = 0  # total number of samples ever appended, the cursor for read()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, times, values):
+        """
+        Append a batch of samples
+
+        Parameters
+        ----------
+        times : numpy.array
+            time.monotonic() timestamps
+        values : numpy.array
+            values of the same length
+
+        Returns
+        -------
+        None : None
+        """
+        times, values = np.atleast_1d(times), np.atleast_1d(values)
+        skipped = max(0, len(times) - self.capacity)  # samples which would be overwritten right away
+        times, values = times[skipped:], values[skipped:]
+        n = len(times)
+        with self._lock:
+            start = (self.count + skipped) % self.capacity
+            first = min(n, self.capacity - start)
+            self.times[start:start + first] = times[:first]
+            self.values[start:start + first] = values[:first]
+            self.times[:n - first] = times[first:]
+            self.values[:n - first] = values[first:]
+            self.count += skipped + n
+
+    def read(self, since=0):
+        """
+        Read the samples appended after a cursor, in order
+
+        Parameters
+        ----------
+        since : int
+            The cursor returned by the previous read(), 0 for everything still in the buffer
+
+        Returns
+        -------
+        times : numpy.array
+        values : numpy.array
+        cursor : int
+            The cursor for the next read()
+        """
+        with self._lock:
+            count = self.count
+            n = min(count - since, self.capacity)
+            idx = np.arange(count - n, count) % self.capacity
+            return self.times[idx], self.values[idx], count
+
+    def latest(self):
+        """
+        The latest sample
+
+        Returns
+        -------
+        time : float
+        value : float
+        """
+        with self._lock:
+            assert self.count, 'the buffer is empty'
+            i = (self.count - 1) % self.capacity
+            return self.times[i], self.values[i]
+
+
+def as_batch(result):
+    """
+    Normalise the output of a producer function into a batch
+
+    Parameters
+    ----------
+    result : ADC_BATCH or tuple
+        A batch, or a tuple of one value per channel as from e.g. data_producer.createc_fbz
+
+    Returns
+    -------
+    batch : ADC_BATCH
+        timestamps in the shape of (samples,), data in the shape of (samples, channels)
+    """
+    if isinstance(result, ADC_BATCH):
+        return result
+    return ADC_BATCH(np.array([time.monotonic()]), np.array([result], dtype=float))
+
+
+class ACQUISITION_THREAD(threading.Thread):
+    """
+    Thread calling producer functions periodically and writing the samples into one RING_BUFFER per channel
+
+    Parameters
+    ----------
+    funcs : list[callable]
+        Producer functions, each returning an ADC_BATCH or a tuple of one value per channel
+    n_channels : int
+        Total number of channels of all the producers
+    capacity : int
+        Samples kept per channel
+    period : float
+        Seconds between the starts of two passes over the producers
+    callback : callable
+        If given, it is called with the list of ADC_BATCH, one per producer, after each pass,
+        on the acquisition thread, e.g. to feed a logger
+
+    Examples
+    --------
+    acquisition = ACQUISITION_THREAD([partial(createc_adc_batch, stm=stm, pairs=pairs)], len(pairs), 100000, 0.02)
+    acquisition.start()
+    times, values, cursor = acquisition.buffers[0].read(cursor)
+    acquisition.stop()
+    """
+
+    def __init__(self, funcs, n_channels, capacity, period, callback=None):
+        super().__init__(daemon=True, name='createc-acquisition')
+        self.funcs = funcs
+        self.buffers = [RING_BUFFER(capacity) for _ in range(n_channels)]
+        self.period = period
+        self.callback = callback
+        self.errors = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def acquire(self):
+        """
+        One pass over the producers
+
+        Returns
+        -------
+        batches : list[ADC_BATCH]
+            One batch per producer
+        """
+        batches = [as_batch(func()) for func in self.funcs]
+        channel = 0
+        for batch in batches:
+            for column in batch.data.T:
+                self.buffers[channel].append(batch.timestamps, column)
+                channel += 1
+        return batches
+
+    def run(self):
+        next_start = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                batches = self.acquire()
+                if self.callback is not None:
+                    self.callback(batches)
+            except Exception as error:
+                # keep sampling, e.g. through a hiccup of the STM software
+                self.errors += 1
+                self.last_error = error
+            next_start = max(next_start + self.period, time.monotonic())
+            self._stop_event.wait(next_start - time.monotonic())
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread and wait for it
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait at most
+
+        Returns
+        -------
+        None : None
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
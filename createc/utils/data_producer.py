@@ -9,6 +9,7 @@ Repo of data generators and functions
 import numpy as np
 import datetime
 import time
+from collections import namedtuple
 
 # these two are not in use
 Log_Avg_Len = 5  # Average through recent X points for logging
@@ -33,7 +34,7 @@ def createc_fbz(stm):
     return stm.getdacvalfb(),
 
 
-def createc_adc(stm, channel, board, kelvin=False):
+def createc_adc(stm, channel, board, kelvin=False, lut=False):
     """   
     Function returning Createc channel ADC value
     Note that the kelvin param is for the old software.
@@ -49,6 +50,8 @@ def createc_adc(stm, channel, board, kelvin=False):
         Board number
     kelvin : bool
         Whether it is for temperature
+    lut : bool
+        With kelvin, whether to interpolate the precomputed table of DT670.Volt2Kelvin_LUT
         
     Returns
     -------
@@ -58,10 +61,82 @@ def createc_adc(stm, channel, board, kelvin=False):
     data = stm.getadcvalf(board, channel)
     if kelvin:
         import createc.utils.DT670
-        data = createc.utils.DT670.Volt2Kelvin(data)
+        data = (createc.utils.DT670.Volt2Kelvin_LUT if lut else createc.utils.DT670.Volt2Kelvin)(data)
     return data,
 
 
+ADC_BATCH = namedtuple('ADC_BATCH', ['timestamps', 'data'])
+ADC_BATCH.__doc__ = """
+    Namedtuple of a batch of ADC readings, timestamps in time.monotonic() seconds in the shape of (samples,)
+    and data in the shape of (samples, channels)
+"""
+
+# offset from time.monotonic() to time.time(), taken once so the converted timestamps stay monotonic
+_wall_clock_offset = time.time() - time.monotonic()
+
+
+def createc_adc_batch(stm, pairs, samples=1, period=0.0, kelvin=False, lut=False):
+    """
+    Read a list of Createc ADC channels in one pass, optionally several times
+
+    Each pass is stamped with a single monotonic timestamp, the middle of the pass.
+    The remote method is looked up only once for all the readings.
+
+    Parameters
+    ----------
+    stm : createc.CreatecWin32
+        Createc instance
+    pairs : list[tuple[int]]
+        (board, channel) of each ADC
+    samples : int
+        Number of passes
+    period : float
+        Seconds from the start of one pass to the start of the next one, 0 for as fast as possible
+    kelvin : bool
+        Whether to convert the voltages to temperatures, see createc_adc()
+    lut : bool
+        With kelvin, whether to interpolate the precomputed table of DT670.Volt2Kelvin_LUT
+
+    Returns
+    -------
+    batch : ADC_BATCH
+    """
+    read = stm.getadcvalf
+    timestamps = np.empty(samples)
+    data = np.empty((samples, len(pairs)))
+    next_start = time.monotonic()
+    for i in range(samples):
+        wait = next_start - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        start = time.monotonic()
+        data[i] = [read(board, channel) for board, channel in pairs]
+        timestamps[i] = (start + time.monotonic()) / 2
+        next_start = max(next_start + period, start)
+    if kelvin:
+        import createc.utils.DT670
+        data = (createc.utils.DT670.Volt2Kelvin_LUT if lut else createc.utils.DT670.Volt2Kelvin)(data)
+    return ADC_BATCH(timestamps, data)
+
+
+def monotonic_to_datetime(timestamps):
+    """
+    Convert time.monotonic() timestamps to wall clock datetimes
+
+    Parameters
+    ----------
+    timestamps : numpy.array
+        time.monotonic() seconds
+
+    Returns
+    -------
+    datetimes : numpy.array
+        numpy.datetime64 in microseconds, local time as datetime.datetime.now()
+    """
+    utc_offset = datetime.datetime.now().astimezone().utcoffset().total_seconds()
+    return ((np.asarray(timestamps) + _wall_clock_offset + utc_offset) * 1e6).astype('datetime64[us]')
+
+
 def createc_auxadc_6(stm):
     """
     Function to return the STM temperature as float number in Kelvin
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Downsampling of long traces to about the screen resolution for plotting
+
+minmax_decimate() keeps the extremes of every bucket, so spikes are never lost.
+lttb() is the Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape with one point per bucket.
+"""
+import numpy as np
+
+
+def window(x, y, start=None, end=None):
+    """
+    Select the part of a trace within [start, end]
+
+    Parameters
+    ----------
+    x : numpy.array
+        sorted x, e.g. timestamps
+    y : numpy.array
+        y of the same length
+    start : float
+        None for the beginning
+    end : float
+        None for the end
+
+    Returns
+    -------
+    x : numpy.array
+    y : numpy.array
+        views of the inputs
+    """
+    i = 0 if start is None else np.searchsorted(x, start, side='left')
+    j = len(x) if end is None else np.searchsorted(x, end, side='right')
+    return x[i:j], y[i:j]
+
+
+def minmax_decimate(x, y, n_out):
+    """
+    Downsample a trace by keeping the minimum and the maximum of each of n_out // 2 buckets, in their order in x.
+    NaN values are ignored unless a bucket has nothing else.
+
+    Parameters
+    ----------
+    x : numpy.array
+        sorted x
+    y : numpy.array
+        y of the same length
+    n_out : int
+        Number of points to keep at most
+
+    Returns
+    -------
+    x : numpy.array
+    y : numpy.array
+    """
+    n = len(x)
+    buckets = n_out // 2
+    if n <= n_out or buckets < 1:
+        return x, y
+    size = -(-n // buckets)
+    rows = -(-n // size)
+    nan = np.isnan(y)
+    y_low = np.full(rows * size, np.inf)
+    y_low[:n] = np.where(nan, np.inf, y)
+    y_high = np.full(rows * size, -np.inf)
+    y_high[:n] = np.where(nan, -np.inf, y)
+    offsets = np.arange(rows) * size
+    idx = np.stack([offsets + y_low.reshape(rows, size).argmin(axis=1),
+                    offsets + y_high.reshape(rows, size).argmax(axis=1)], axis=1)
+    idx = np.minimum(np.sort(idx, axis=1).ravel(), n - 1)
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    """
+    Downsample a trace with the Largest-Triangle-Three-Buckets algorithm.
+    The first and the last points are kept, from each bucket in between the point is kept
+    which spans the largest triangle with the point kept before and the mean of the next bucket.
+
+    Parameters
+    ----------
+    x : numpy.array
+        sorted x
+    y : numpy.array
+        y of the same length
+    n_out : int
+        Number of points to keep, at least 3
+
+    Returns
+    -------
+    x : numpy.array
+    y : numpy.array
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+    x_f = np.asarray(x, dtype=float)
+    y_f = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    # mean of every bucket, the last point being the bucket after the last one
+    sums_x = np.add.reduceat(x_f[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y_f[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x_f[-1])
+    mean_y = np.append(sums_y / counts, y_f[-1])
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x_f[a] - mean_x[i + 1]) * (y_f[lo:hi] - y_f[a]) -
+                      (x_f[a] - x_f[lo:hi]) * (mean_y[i + 1] - y_f[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return x[idx], y[idx]
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Drift tracking by cross-correlation against a fixed template
+
+The template is preprocessed and Fourier transformed once, every new image then costs one forward FFT,
+one inverse FFT and a small upsampled DFT around the correlation peak for the sub-pixel shift.
+The shifts measured over several images give the drift velocity, to extrapolate the correction.
+"""
+import collections
+import functools
+
+import numpy as np
+
+from .image_utils import level_correction
+
+
+@functools.lru_cache(maxsize=16)
+def _frequencies(n, upsample_factor):
+    """
+    Sample frequencies of an axis of n pixels on the upsampled grid, cached per shape
+
+    Parameters
+    ----------
+    n : int
+    upsample_factor : int
+
+    Returns
+    -------
+    frequencies : numpy.array
+    """
+    frequencies = np.fft.fftfreq(n, upsample_factor)
+    frequencies.flags.writeable = False
+    return frequencies
+
+
+def _upsampled_dft(data, region_size, upsample_factor, offsets):
+    """
+    The inverse DFT of a spectrum on a region of an upsampled grid, by matrix products instead of a zero-padded FFT,
+    as in Guizar-Sicairos et al., Optics Letters 33, 156 (2008)
+
+    Parameters
+    ----------
+    data : numpy.array
+        The spectrum in the shape of (m, n)
+    region_size : int
+        Size of the region in upsampled pixels along both axes
+    upsample_factor : int
+    offsets : numpy.array
+        The upsampled pixel of the region origin along both axes
+
+    Returns
+    -------
+    result : numpy.array
+        In the shape of (region_size, region_size)
+    """
+    for n, offset in zip(data.shape[::-1], offsets[::-1]):
+        kernel = np.exp(-2j * np.pi * (np.arange(region_size) - offset)[:, np.newaxis] *
+                        _frequencies(n, upsample_factor))
+        data = np.tensordot(kernel, data, axes=(1, -1))
+    return data
+
+
+def _correlation_shift(product, upsample_factor):
+    """
+    The shift at the peak of the cross-correlation of a cross-power spectrum,
+    refined to 1 / upsample_factor pixel
+
+    Parameters
+    ----------
+    product : numpy.array
+        Cross-power spectrum in the shape of (m, n)
+    upsample_factor : int
+
+    Returns
+    -------
+    shift : numpy.array
+        (dy, dx) in pixels
+    """
+    shape = np.array(product.shape)
+    correlation = np.fft.ifft2(product)
+    shift = np.array(np.unravel_index(np.argmax(np.abs(correlation)), correlation.shape), dtype=float)
+    shift[shift > shape // 2] -= shape[shift > shape // 2]
+    if upsample_factor == 1:
+        return shift
+    shift = np.round(shift * upsample_factor) / upsample_factor
+    region_size = int(np.ceil(upsample_factor * 1.5))
+    center = np.fix(region_size / 2)
+    correlation = _upsampled_dft(product.conj(), region_size, upsample_factor,
+                                 center - shift * upsample_factor).conj()
+    peak = np.array(np.unravel_index(np.argmax(np.abs(correlation)), correlation.shape), dtype=float)
+    return shift + (peak - center) / upsample_factor
+
+
+class DRIFT_TRACKER:
+    """
+    Sub-pixel drift tracking of new images against a template, with the drift velocity from a history of shifts.
+
+    The shift of an image is (dy, dx) in pixels with the sign convention of
+    skimage.registration.phase_cross_correlation(image, template), averaged over the channels,
+    so stm.setxyoffpixel(dx=shift[1], dy=shift[0]) moves the scan back onto the template.
+
+    The images are levelled and tapered by a Hann window, so the edges do not correlate.
+    The Gaussian smoothing is a weight on the cross-power spectrum, kept with the template spectrum.
+    Rescaling the intensity only scales the correlation, so it is left out.
+
+    Parameters
+    ----------
+    template : numpy.array
+        The template image in the shape of (m, n), or its channels in the shape of (channels, m, n)
+    timestamp : float
+        When the template was taken, e.g. DAT_IMG.timestamp. If given, it is the first point of the drift history,
+        with zero drift
+    upsample_factor : int
+        The shifts are refined to 1 / upsample_factor pixel, 1 for whole pixels
+    history : int
+        Number of registered shifts used for the drift velocity
+    sigma : float
+        Standard deviation in pixels of the Gaussian smoothing, 0 for none
+    window : bool
+        Whether to taper the images by a Hann window
+    normalization : str
+        'phase' to normalise the cross-power spectrum to unit magnitude as in phase correlation,
+        which cancels the smoothing, or None for the plain cross-correlation, which is more robust to noise
+
+    Examples
+    --------
+    tracker = DRIFT_TRACKER(template_imgs, template_timestamp)
+    shift = tracker.register(imgs, timestamp)
+    correction = tracker.predict(time.time() + delay)
+    stm.setxyoffpixel(dx=correction[1], dy=correction[0])
+    tracker.corrected(correction)
+    """
+
+    def __init__(self, template, timestamp=None, upsample_factor=10, history=5, sigma=1.0, window=True,
+                 normalization=None):
+        template = np.asarray(template, dtype=float)
+        if template.ndim == 2:
+            template = template[np.newaxis]
+        assert upsample_factor >= 1, 'upsample_factor should be at least 1'
+        assert normalization in (None, 'phase'), "normalization should be None or 'phase'"
+        self.shape = template.shape
+        self.upsample_factor = int(upsample_factor)
+        self.normalization = normalization
+        m, n = self.shape[-2:]
+        self._window = np.outer(np.hanning(m), np.hanning(n)) if window else None
+        # the conjugate template spectrum, times the response of the smoothing of both images
+        fy, fx = np.meshgrid(np.fft.fftfreq(m), np.fft.fftfreq(n), indexing='ij')
+        smoothing = np.exp(-4 * np.pi ** 2 * sigma ** 2 * (fx ** 2 + fy ** 2))
+        self._template_conj = np.fft.fft2(self._preprocess(template)).conj() * smoothing
+        # (timestamp, drift) pairs, drift being the shift measured plus the corrections applied until then
+        self._history = collections.deque(maxlen=history + (timestamp is not None))
+        if timestamp is not None:
+            self._history.append((timestamp, np.zeros(2)))
+        self.correction = np.zeros(2)  # total correction applied so far
+
+    def _preprocess(self, imgs):
+        """
+        Level the images and taper them by the window
+
+        Parameters
+        ----------
+        imgs : numpy.array
+            In the shape of (channels, m, n)
+
+        Returns
+        -------
+        imgs : numpy.array
+        """
+        imgs = level_correction(imgs)
+        if self._window is not None:
+            imgs *= self._window
+        return imgs
+
+    def shift(self, imgs):
+        """
+        The sub-pixel shift of images against the template
+
+        Parameters
+        ----------
+        imgs : numpy.array
+            The channels of the template, in the same shape
+
+        Returns
+        -------
+        shift : numpy.array
+            (dy, dx) in pixels, averaged over the channels
+        """
+        imgs = np.asarray(imgs, dtype=float).reshape(self.shape)
+        product = np.fft.fft2(self._preprocess(imgs)) * self._template_conj
+        if self.normalization == 'phase':
+            product /= np.maximum(np.abs(product), 100 * np.finfo(float).eps)
+        return np.mean([_correlation_shift(p, self.upsample_factor) for p in product], axis=0)
+
+    def register(self, imgs, timestamp):
+        """
+        Measure the shift of images and add it to the drift history
+
+        Parameters
+        ----------
+        imgs : numpy.array
+            See shift()
+        timestamp : float
+            When the images were taken, e.g. DAT_IMG.timestamp
+
+        Returns
+        -------
+        shift : numpy.array
+            (dy, dx) in pixels
+        """
+        shift = self.shift(imgs)
+        self._history.append((timestamp, shift + self.correction))
+        return shift
+
+    def corrected(self, correction):
+        """
+        Tell the tracker that the scan was moved by setxyoffpixel
+
+        Parameters
+        ----------
+        correction : numpy.array
+            (dy, dx) in pixels
+
+        Returns
+        -------
+        None : None
+        """
+        self.correction = self.correction + np.asarray(correction, dtype=float)
+
+    @property
+    def velocity(self):
+        """
+        The drift velocity, the slope of a least squares line through the drift history
+
+        Returns
+        -------
+        velocity : numpy.array
+            (dy, dx) in pixels per second, zeros until the history spans some time
+        """
+        if len(self._history) < 2:
+            return np.zeros(2)
+        times = np.array([t for t, _ in self._history])
+        drifts = np.array([d for _, d in self._history])
+        if np.ptp(times) <= 0:
+            return np.zeros(2)
+        return np.polyfit(times - times[-1], drifts, 1)[0]
+
+    def predict(self, timestamp):
+        """
+        The correction which moves the scan back onto the template at a time,
+        the latest drift extrapolated with the drift velocity, less the corrections already applied
+
+        Parameters
+        ----------
+        timestamp : float
+            e.g. time.time() plus the delay until the scan starts
+
+        Returns
+        -------
+        correction : numpy.array
+            (dy, dx) in pixels
+        """
+        if not self._history:
+            return np.zeros(2)
+        last_time, last_drift = self._history[-1]
+        return last_drift + self.velocity * (timestamp - last_time) - self.correction
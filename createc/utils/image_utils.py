@@ -1,29 +1,186 @@
 # -*- coding: utf-8 -*-
 #
+import functools
 
 
-def level_correction(img):
+@functools.lru_cache(maxsize=32)
+def _poly_basis(length, degree):
+    """
+    Powers 0..degree of the coordinates 0..length-1 scaled to -1..1, cached per shape
+
+    Parameters
+    ----------
+    length : int
+        Number of pixels along the axis
+    degree : int
+        Highest power
+
+    Returns
+    -------
+    basis : numpy.array
+        Read-only, in the shape of (degree + 1, length)
+    """
+    import numpy as np
+
+    u = np.linspace(-1, 1, length) if length > 1 else np.zeros(1)
+    basis = u[np.newaxis, :] ** np.arange(degree + 1)[:, np.newaxis]
+    basis.flags.writeable = False
+    return basis
+
+
+def _terms(order):
+    """
+    Exponents (a, b) of the terms u**a * v**b of a 2D polynomial background
+
+    Parameters
+    ----------
+    order : int
+
+    Returns
+    -------
+    a, b : numpy.array
+    """
+    import numpy as np
+
+    a, b = np.nonzero(np.add.outer(np.arange(order + 1), np.arange(order + 1)) <= order)
+    return a, b
+
+
+@functools.lru_cache(maxsize=32)
+def _inverse_normal_matrix(m, n, order):
+    """
+    The inverse of the normal matrix of a polynomial background on an m x n image, cached per shape.
+    The moments of the separable terms u**a * v**b factorise into 1D moments of u and of v.
+
+    Parameters
+    ----------
+    m, n : int
+        Shape of the image
+    order : int
+        Order of the polynomial
+
+    Returns
+    -------
+    inverse : numpy.array
+        Read-only, in the shape of (terms, terms)
+    """
+    import numpy as np
+
+    a, b = _terms(order)
+    moments_u = _poly_basis(m, 2 * order).sum(axis=1)
+    moments_v = _poly_basis(n, 2 * order).sum(axis=1)
+    normal = moments_u[np.add.outer(a, a)] * moments_v[np.add.outer(b, b)]
+    inverse = np.linalg.pinv(normal)
+    inverse.flags.writeable = False
+    return inverse
+
+
+def level_correction(img, order=1, mask=None, rows=False):
     """
     Do level correction for an input image img in the format of numpy 2d array
     returns the result image in numpy 2d array
 
+    The least squares background is found from the normal equations, whose matrix only depends on the image shape
+    and is cached, so only the moments of the image itself are computed, as two small matrix products.
+
     Parameters
     ----------
     img : numpy.array
-        An image in 2d numpy.array
+        An image in 2d numpy.array, or a stack of images in the shape of (k, m, n)
+    order : int
+        Order of the polynomial background, 1 for a plane
+    mask : numpy.array
+        Boolean, True for the pixels left out of the fit, e.g. adsorbates or spikes,
+        in the shape of an image or of the stack. The background is still subtracted from every pixel
+    rows : bool
+        Whether to fit every row (scan line) on its own, with a polynomial of order along the row
+
     Returns
     -------
     result : numpy.array
-        Level corrected image in 2d numpy.array
+        Level corrected image in 2d numpy.array, or a stack of them
     """
     import numpy as np
 
-    m, n = img.shape
+    img = np.asarray(img, dtype=float)
+    assert img.ndim in (2, 3), 'img should be an image or a stack of images'
+    m, n = img.shape[-2:]
+    assert order >= 0, 'order should not be negative'
+    if rows:
+        assert n >= 2
+        return _subtract(img, _row_coefficients(img, order, mask), _poly_basis(n, 2 * order)[:order + 1])
     assert m >= 2 and n >= 2
-    X1, X2 = np.mgrid[:m, :n]
-    X = np.hstack((np.reshape(X1, (m * n, 1)), np.reshape(X2, (m * n, 1))))
-    X = np.hstack((np.ones((m * n, 1)), X))
-    YY = np.reshape(img, (m * n, 1))
-    theta = np.dot(np.dot(np.linalg.pinv(np.dot(X.transpose(), X)), X.transpose()), YY)
-    plane = np.reshape(np.dot(X, theta), (m, n))
-    return img - plane
+    U, V = _poly_basis(m, 2 * order), _poly_basis(n, 2 * order)
+    a, b = _terms(order)
+    if mask is None:
+        # moments of the image for all a, b <= order, then only the terms of the polynomial
+        moments = (U[:order + 1] @ img @ V[:order + 1].T)[..., a, b]
+        theta = moments @ _inverse_normal_matrix(m, n, order)
+    else:
+        weights = ~np.asarray(mask, dtype=bool)
+        moments = (U[:order + 1] @ (img * weights) @ V[:order + 1].T)[..., a, b]
+        weight_moments = U @ weights @ V.T
+        normal = weight_moments[..., np.add.outer(a, a), np.add.outer(b, b)]
+        theta = (np.linalg.pinv(normal) @ moments[..., np.newaxis])[..., 0]
+    coefficients = np.zeros(img.shape[:-2] + (order + 1, order + 1))
+    coefficients[..., a, b] = theta
+    return _subtract(img, U[:order + 1].T @ coefficients, V[:order + 1])
+
+
+def _subtract(img, left, right):
+    """
+    Subtract the background left @ right from every image, one image at a time into one result array
+
+    Parameters
+    ----------
+    img : numpy.array
+        In the shape of (m, n) or (k, m, n)
+    left : numpy.array
+        In the shape of (m, terms) or (k, m, terms)
+    right : numpy.array
+        In the shape of (terms, n)
+
+    Returns
+    -------
+    result : numpy.array
+    """
+    import numpy as np
+
+    result = np.empty_like(img)
+    for index in np.ndindex(img.shape[:-2]):
+        np.subtract(img[index], left[index] @ right, out=result[index])
+    return result
+
+
+def _row_coefficients(img, order, mask=None):
+    """
+    The polynomial coefficients of the background of every row of an image or a stack of images
+
+    Parameters
+    ----------
+    img : numpy.array
+        In the shape of (m, n) or (k, m, n)
+    order : int
+        Order of the polynomial
+    mask : numpy.array
+        Boolean, True for the pixels left out of the fit
+
+    Returns
+    -------
+    coefficients : numpy.array
+        In the shape of (m, order + 1) or (k, m, order + 1)
+    """
+    import numpy as np
+
+    V = _poly_basis(img.shape[-1], 2 * order)
+    if mask is None:
+        normal = V[:order + 1] @ V[:order + 1].T
+        theta = img @ V[:order + 1].T @ np.linalg.pinv(normal)
+    else:
+        weights = ~np.asarray(mask, dtype=bool)
+        moments = (img * weights) @ V[:order + 1].T
+        weight_moments = weights @ V.T
+        powers = np.arange(order + 1)
+        normal = weight_moments[..., np.add.outer(powers, powers)]
+        theta = (np.linalg.pinv(normal) @ moments[..., np.newaxis])[..., 0]
+    return theta
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the remote calls to the STM software
+
+An INSTRUMENTED_CLIENT wraps the remote object of CreatecWin32 and keeps, per method,
+the number of calls, the number of errors and a histogram of the latencies.
+It is only in the call path while enabled, see CreatecWin32.instrument()
+"""
+import json
+import logging
+import math
+import threading
+import time
+
+_bins_per_decade = 10
+_min_latency = 1e-7  # seconds, the lower edge of the first bin
+_n_bins = 10 * _bins_per_decade  # up to 1000 s
+
+
+class LATENCY_HISTOGRAM:
+    """
+    Histogram of latencies with logarithmic bins, 10 per decade from 0.1 us to 1000 s
+
+    Percentiles are estimated at the geometric centers of the bins, which is within 12% of the true value
+    """
+
+    def __init__(self):
+        self.counts = [0] * (_n_bins + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds, error=False):
+        """
+        Add one call
+
+        Parameters
+        ----------
+        seconds : float
+            latency
+        error : bool
+            Whether the call raised
+
+        Returns
+        -------
+        None : None
+        """
+        i = int(math.log10(seconds / _min_latency) * _bins_per_decade) if seconds > _min_latency else 0
+        self.counts[min(i, _n_bins)] += 1
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """
+        Estimate a percentile of the latencies
+
+        Parameters
+        ----------
+        q : float
+            percentile in 0 ~ 100
+
+        Returns
+        -------
+        seconds : float
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.max, _min_latency * 10 ** ((i + 0.5) / _bins_per_decade))
+        return self.max
+
+    def summary(self):
+        """
+        Summary of the calls, latencies in milliseconds
+
+        Returns
+        -------
+        summary : dict
+        """
+        return {'count': self.count,
+                'errors': self.errors,
+                'total_s': self.total,
+                'mean_ms': self.total / self.count * 1e3 if self.count else 0.0,
+                'p50_ms': self.percentile(50) * 1e3,
+                'p90_ms': self.percentile(90) * 1e3,
+                'p99_ms': self.percentile(99) * 1e3,
+                'max_ms': self.max * 1e3}
+
+
+class INSTRUMENTED_CLIENT:
+    """
+    Proxy of the remote object which times every method call and property read
+
+    Parameters
+    ----------
+    client : object
+        The remote object, e.g. the COM server or STM_SIMULATOR
+    log_file : str
+        If given, the stats are appended to this file as one json line per export
+    interval : float
+        Seconds between two exports, to the log_file or else to the 'createc' logger. No export if None
+    """
+
+    def __init__(self, client, log_file=None, interval=None):
+        self._client = client
+        self._histograms = dict()
+        self._lock = threading.Lock()
+        self._log_file = log_file
+        self._stop = threading.Event()
+        self._exporter = None
+        if interval is not None:
+            self._exporter = threading.Thread(target=self._export_loop, args=(interval,), daemon=True,
+                                              name='createc-stats')
+            self._exporter.start()
+
+    def _record(self, name, seconds, error=False):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LATENCY_HISTOGRAM()
+            self._histograms[name].add(seconds, error)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        start = time.perf_counter()
+        try:
+            attr = getattr(self._client, name)
+        except Exception:
+            self._record(name, time.perf_counter() - start, error=True)
+            raise
+        if not callable(attr):
+            # a property such as scanstatus is a remote call by itself
+            self._record(name, time.perf_counter() - start)
+            return attr
+
+        def timed_call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._record(name, time.perf_counter() - start, error=True)
+                raise
+            self._record(name, time.perf_counter() - start)
+            return result
+
+        return timed_call
+
+    def stats(self):
+        """
+        Per method count, errors, total seconds and latency mean and percentiles in milliseconds
+
+        Returns
+        -------
+        stats : dict[str, dict]
+        """
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        """
+        Clear the stats
+
+        Returns
+        -------
+        None : None
+        """
+        with self._lock:
+            self._histograms.clear()
+
+    def export(self):
+        """
+        Export the stats to the log_file, or else to the 'createc' logger
+
+        Returns
+        -------
+        None : None
+        """
+        record = {'time': time.time(), 'stats': self.stats()}
+        if self._log_file is None:
+            logging.getLogger('createc').info('remote calls: %s', json.dumps(record['stats']))
+            return
+        with open(self._log_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _export_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.export()
+
+    def close(self):
+        """
+        Stop the periodic export, after a last one
+
+        Returns
+        -------
+        client : object
+            The remote object
+        """
+        if self._exporter is not None:
+            self._stop.set()
+            self._exporter.join()
+            self.export()
+        return self._client
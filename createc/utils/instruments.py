@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Polling of serial instruments, e.g. pressure gauges, on background threads
+
+Each port is owned by one SERIAL_POLLER thread, which sends the queries of its device, pipelined if the device allows,
+and publishes every answer into a shared LATEST_VALUES, so a GUI or an ACQUISITION_THREAD never waits on a port.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+GAUGE_QUERY = collections.namedtuple('GAUGE_QUERY', ['request', 'parse', 'terminator'])
+GAUGE_QUERY.__new__.__defaults__ = (b'\r',)
+GAUGE_QUERY.__doc__ = """
+    One query of a serial instrument
+
+    Parameters
+    ----------
+    request : bytes
+        e.g. b'RPV1\\r'
+    parse : callable
+        Converts the answer, including its terminator, into a float
+    terminator : bytes
+        The end of the answer
+    """
+
+
+def parse_prep(response):
+    """
+    Pressure in mbar from the answer to b'#RD\\r' of the prep chamber gauge
+    """
+    return float(response[2:-1])
+
+
+def parse_rpv(response):
+    """
+    Pressure in mbar from the answer 'status,pressure' to b'RPV1\\r', b'RPV3\\r' etc. of the Vacom gauge controller
+    """
+    return float(response.decode('ascii').split(',')[1])
+
+
+def parse_ion(response):
+    """
+    Pressure in mbar from the answer to b'~ 05 0B 02 00\\r' of the ion pump controller
+    """
+    return float(response.split()[3])
+
+
+class LATEST_VALUES:
+    """
+    The latest value and its time.monotonic() timestamp of every channel, thread safe
+
+    Parameters
+    ----------
+    n_channels : int
+    max_age : float
+        Values older than this many seconds are read as NaN, never if None
+    """
+
+    def __init__(self, n_channels, max_age=None):
+        self.values = np.full(n_channels, np.nan)
+        self.times = np.zeros(n_channels)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def update(self, channel, value, timestamp=None):
+        """
+        Publish a value
+
+        Parameters
+        ----------
+        channel : int
+        value : float
+        timestamp : float
+            time.monotonic() seconds, now if None
+
+        Returns
+        -------
+        None : None
+        """
+        with self._lock:
+            self.values[channel] = value
+            self.times[channel] = time.monotonic() if timestamp is None else timestamp
+
+    def read(self):
+        """
+        The latest values
+
+        Returns
+        -------
+        times : numpy.array
+        values : numpy.array
+            NaN if never published or older than max_age
+        """
+        with self._lock:
+            times, values = self.times.copy(), self.values.copy()
+        if self.max_age is not None:
+            values[time.monotonic() - times > self.max_age] = np.nan
+        return times, values
+
+    def __call__(self):
+        """
+        The latest values as a tuple, so the instance is a producer function of an ACQUISITION_THREAD
+
+        Returns
+        -------
+        values : tuple[float]
+        """
+        return tuple(self.read()[1])
+
+
+class SERIAL_POLLER(threading.Thread):
+    """
+    Thread polling one serial device and publishing the answers into a LATEST_VALUES
+
+    Up to `pipeline` queries are sent before their answers are read, which saves the round trips
+    on devices with an input queue. An answer not complete within the timeout of the port is counted in `timeouts`,
+    one which cannot be parsed in `errors`; the input is then flushed and the rest of the pass skipped,
+    so the answers do not stay out of step.
+
+    Parameters
+    ----------
+    port : serial.Serial
+        An open port with a timeout, or any object with write(), read_until() and optionally reset_input_buffer()
+    queries : list[GAUGE_QUERY]
+        One query per channel
+    latest : LATEST_VALUES
+        The shared buffer
+    first_channel : int
+        The channel in latest of the first query
+    period : float
+        Seconds between the starts of two passes over the queries
+    pipeline : int
+        Queries sent at most before reading their answers
+    timeout : float
+        If given, set as the timeout of the port in seconds
+
+    Examples
+    --------
+    latest = LATEST_VALUES(2, max_age=5)
+    poller = SERIAL_POLLER(serial.Serial('COM6'), [GAUGE_QUERY(b'RPV1\\r', parse_rpv),
+                                                   GAUGE_QUERY(b'RPV3\\r', parse_rpv)], latest, pipeline=2)
+    poller.start()
+    times, values = latest.read()
+    poller.stop()
+    """
+
+    def __init__(self, port, queries, latest, first_channel=0, period=0.5, pipeline=1, timeout=0.5):
+        super().__init__(daemon=True, name='createc-serial')
+        assert pipeline > 0, 'pipeline should be larger than 0'
+        self.port = port
+        self.queries = queries
+        self.latest = latest
+        self.first_channel = first_channel
+        self.period = period
+        self.pipeline = pipeline
+        if timeout is not None:
+            self.port.timeout = timeout
+        self.passes = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def poll(self):
+        """
+        One pass over the queries
+
+        Returns
+        -------
+        complete : bool
+            False if an answer timed out or could not be parsed
+        """
+        pending = collections.deque()
+        for index, query in enumerate(self.queries):
+            while len(pending) >= self.pipeline:
+                if not self._answer(pending.popleft()):
+                    return self._resync()
+            self.port.write(query.request)
+            pending.append(index)
+        while pending:
+            if not self._answer(pending.popleft()):
+                return self._resync()
+        self.passes += 1
+        return True
+
+    def _answer(self, index):
+        """
+        Read and publish the answer to a query
+
+        Parameters
+        ----------
+        index : int
+            Index of the query
+
+        Returns
+        -------
+        in_step : bool
+            False if the answer timed out or could not be parsed
+        """
+        query = self.queries[index]
+        response = self.port.read_until(query.terminator)
+        if not response.endswith(query.terminator):
+            self.timeouts += 1
+            return False
+        try:
+            value = query.parse(response)
+        except (ValueError, IndexError) as error:
+            # most likely the answer to another query, after one went unanswered
+            self.errors += 1
+            self.last_error = error
+            return False
+        self.latest.update(self.first_channel + index, value)
+        return True
+
+    def _resync(self):
+        """
+        Drop the answers still pending, so the next pass starts in step
+
+        Returns
+        -------
+        complete : bool
+            False
+        """
+        if hasattr(self.port, 'reset_input_buffer'):
+            self.port.reset_input_buffer()
+        return False
+
+    def run(self):
+        next_start = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as error:
+                # keep polling, e.g. through a replugged adapter
+                self.errors += 1
+                self.last_error = error
+            next_start = max(next_start + self.period, time.monotonic())
+            self._stop_event.wait(next_start - time.monotonic())
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread and wait for it
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait at most
+
+        Returns
+        -------
+        None : None
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -3,6 +3,11 @@
 
 
 from collections import namedtuple
+import copy
+import functools
+import hashlib
+import json
+import os
 import numpy as np
 
 XY2D = namedtuple('XY2D', ['x', 'y'])
@@ -10,6 +15,80 @@ XY2D.__doc__ = """
     Namedtuple for 2D point coordinate
 """
 
+_cgc_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Createc_global_const.yaml')
+
+
+@functools.lru_cache(maxsize=None)
+def _read_global_const(yaml_file):
+    """
+    Read the global constants in a yaml file, only once per process.
+
+    The parsed constants are shipped in a json file next to the yaml file, together with the hash
+    of the yaml content, see write_global_const_json(). As long as the hash matches, the json is used
+    and PyYAML is not even imported. Otherwise the yaml is parsed, nothing is written at import.
+
+    Parameters
+    ----------
+    yaml_file : str
+        Path to the yaml file
+
+    Returns
+    -------
+    cgc : dict
+    """
+    with open(yaml_file, 'rb') as f:
+        yaml_binary = f.read()
+    json_file = os.path.splitext(yaml_file)[0] + '.json'
+    try:
+        with open(json_file, 'rt') as f:
+            compiled = json.load(f)
+        if compiled['yaml_sha1'] == hashlib.sha1(yaml_binary).hexdigest():
+            return compiled['cgc']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    import yaml
+    return yaml.safe_load(yaml_binary.decode())
+
+
+def write_global_const_json(yaml_file=_cgc_file):
+    """
+    Regenerate the json file of the global constants after the yaml file is changed, before building the package.
+    It is run with
+    python -m createc.utils.misc
+
+    Parameters
+    ----------
+    yaml_file : str
+        Path to the yaml file, Createc_global_const.yaml by default
+
+    Returns
+    -------
+    json_file : str
+        Path to the json file
+    """
+    import yaml
+    with open(yaml_file, 'rb') as f:
+        yaml_binary = f.read()
+    json_file = os.path.splitext(yaml_file)[0] + '.json'
+    with open(json_file, 'wt') as f:
+        json.dump({'yaml_sha1': hashlib.sha1(yaml_binary).hexdigest(), 'cgc': yaml.safe_load(yaml_binary.decode())},
+                  f, indent=1)
+    return json_file
+
+
+def load_global_const():
+    """
+    Load the global constants in Createc_global_const.yaml, which are parsed only once per process,
+    see _read_global_const()
+
+    Returns
+    -------
+    cgc : dict
+        A copy of the global constants, so changing it does not affect the other modules
+    """
+    return copy.deepcopy(_read_global_const(_cgc_file))
+
 
 def point_rot2D(target=XY2D(1, 1), origin=XY2D(0, 0), radians=0):
     """
@@ -61,3 +140,98 @@ def point_rot2D_y_inv(target=XY2D(1, 1), origin=XY2D(0, 0), radians=0):
                          origin=XY2D(x=origin.x, y=-origin.y),
                          radians=radians)
     return XY2D(x=result.x, y=-result.y)
+
+
+def points_rot2D(points, origin=(0, 0), radians=0):
+    """
+    Rotate 2D points around origins by angles in radians, the array counterpart of point_rot2D
+
+    Parameters
+    ----------
+    points : numpy.array
+        Points in the shape of (N, 2), or one point in the shape of (2,)
+    origin : numpy.array
+        One rotation origin in the shape of (2,), or one per point in the shape of (N, 2)
+    radians : float or numpy.array
+        One rotation angle, or one per point in the shape of (N,)
+
+    Returns
+    -------
+    result : numpy.array
+        In the shape of points
+    """
+    points = np.asarray(points, dtype=float)
+    origin = np.asarray(origin, dtype=float)
+    cos_rad, sin_rad = np.cos(radians), np.sin(radians)
+    dx, dy = points[..., 0] - origin[..., 0], points[..., 1] - origin[..., 1]
+    return np.stack([origin[..., 0] + cos_rad * dx - sin_rad * dy,
+                     origin[..., 1] + sin_rad * dx + cos_rad * dy], axis=-1)
+
+
+def points_rot2D_y_inv(points, origin=(0, 0), radians=0):
+    """
+    Rotate 2D points around origins by angles in radians with y flipped before and after,
+    the array counterpart of point_rot2D_y_inv
+
+    Parameters
+    ----------
+    points : numpy.array
+        Points in the shape of (N, 2), or one point in the shape of (2,)
+    origin : numpy.array
+        One rotation origin in the shape of (2,), or one per point in the shape of (N, 2)
+    radians : float or numpy.array
+        One rotation angle, or one per point in the shape of (N,)
+
+    Returns
+    -------
+    result : numpy.array
+        In the shape of points
+    """
+    return points_rot2D(points, origin, -np.asarray(radians))
+
+
+def affine_matrix(linear=((1, 0), (0, 1)), translation=(0, 0)):
+    """
+    The 3x3 matrix of the affine transform p -> linear @ p + translation of 2D points in homogeneous coordinates,
+    transforms are chained by matrix products, and inverted by numpy.linalg.inv
+
+    Parameters
+    ----------
+    linear : numpy.array
+        In the shape of (2, 2)
+    translation : numpy.array
+        In the shape of (2,)
+
+    Returns
+    -------
+    matrix : numpy.array
+        In the shape of (3, 3)
+    """
+    matrix = np.eye(3)
+    matrix[:2, :2] = linear
+    matrix[:2, 2] = translation
+    return matrix
+
+
+def affine_transform(matrix, points):
+    """
+    Apply an affine matrix to 2D points
+
+    Parameters
+    ----------
+    matrix : numpy.array
+        In the shape of (3, 3), e.g. from affine_matrix() or GENERIC_FILE.affine()
+    points : numpy.array
+        Points in the shape of (N, 2), or one point in the shape of (2,)
+
+    Returns
+    -------
+    result : numpy.array
+        In the shape of points
+    """
+    points = np.asarray(points, dtype=float)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+if __name__ == '__main__':
+    print(write_global_const_json())
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+An in-process stand-in for the pstmafm.stmafmrem COM server, to be used as the backend of CreatecWin32
+
+It keeps the parameters in memory, simulates the scan timing, the ADC and feedback readouts
+and writes synthetic .dat files which can be read by DAT_IMG,
+so the control layer can be tested and benchmarked without the STM software.
+"""
+import datetime
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .misc import XY2D, load_global_const
+
+cgc = load_global_const()
+
+# (header key, parameter name, default value) in the order as in the .dat header,
+# the header key is None if the parameter appears only under its own name
+_params = ((None, 'Titel', 'Simulator'),
+           ('Delta X', 'Delta X [Dac]', 32),
+           ('Delta Y', 'Delta Y [Dac]', 32),
+           ('Num.X', 'Num.X', 128),
+           ('Num.Y', 'Num.Y', 128),
+           ('Delay Y', 'Delay Y', 1),
+           ('DX_DIV_DDelta-X', 'DX/DDeltaX', 20),
+           ('Rotation', 'Rotation', 0.0),
+           ('BiasVoltage', 'BiasVolt.[mV]', 100.0),
+           ('Gainpreamp', 'GainPre 10^', cgc['g_preamp_gain']),
+           ('Scanrotoffx', 'OffsetX', 0.0),
+           ('Scanrotoffy', 'OffsetY', 0.0),
+           ('CHMode', 'CHMode', 0),
+           ('Channels', 'Channels', 4),
+           ('RotCMode', 'RotCMode', 1),
+           ('ScanYMode', 'ScanYMode', 0),
+           ('CHModeZoff', 'CHModeZoff', 0.0),
+           ('CHModeBias[mV]', 'CHModeBias[mV]', 0.0),
+           ('Channelselectval', 'ChannelSelectVal', 3),
+           (None, 'FBLogIset', 100.0),
+           (None, 'ZPiezoconst', 8.79),
+           (None, 'XPiezoconst', 34.44),
+           (None, 'YPiezoconst', 34.44))
+
+_dac_clock = 3.2e6  # DAC steps per second, which gives the 'Sec/Image:' of real files
+_angstrom_per_dac = cgc['g_XY_volt'] / 2 ** cgc['g_XY_bits']  # times the piezo constant
+
+
+class STM_SIMULATOR:
+    """
+    Simulated STM backend with the same methods as the remote operation object of the STM software
+
+    Parameters
+    ----------
+    latency : float
+        Seconds each remote call takes, to mimic the cross-process COM overhead
+    time_scale : float
+        Real seconds per simulated second of scanning, e.g. 1e-3 makes a scan 1000 times faster.
+        'Sec/Image:' is reported in real seconds
+    data_dir : str
+        Directory where the .dat files are saved, the current directory by default
+    drift : XY2D
+        Thermal drift of the sample in angstrom per simulated second
+    seed : int
+        Seed of the noise
+
+    Examples
+    --------
+    stm = CreatecWin32(backend=STM_SIMULATOR(latency=1e-3, time_scale=1e-3))
+    stm.ramp_bias_mV(500)
+    """
+
+    def __init__(self, latency=0.0, time_scale=1.0, data_dir=None, drift=XY2D(x=0, y=0), seed=None):
+        self.latency = latency
+        self.time_scale = time_scale
+        self.data_dir = os.getcwd() if data_dir is None else data_dir
+        self.drift = drift
+        self._rng = np.random.default_rng(seed)
+        self._adsorbates = np.random.default_rng(0).uniform(-2000, 2000, size=(400, 2))
+        self._lock = threading.RLock()
+        self._names = {name.lower(): name for _, name, _ in _params}
+        self._values = {name: value for _, name, value in _params}
+        self._derived = {'length x[a]': lambda: self._length('X'),
+                         'length y[a]': lambda: self._length('Y'),
+                         'sec/image:': lambda: self._sec_per_image() * self.time_scale}
+        self._t0 = time.monotonic()
+        self._scan_start = None
+        self._scan_end = None
+        self._scan_datetime = datetime.datetime.now()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _value(self, name):
+        """
+        Value of a parameter as a float, without latency
+
+        Parameters
+        ----------
+        name : str
+            Parameter name, case insensitive
+
+        Returns
+        -------
+        value : float
+        """
+        key = name.lower()
+        if key in self._derived:
+            return self._derived[key]()
+        return float(self._values[self._names[key]])
+
+    def _length(self, axis):
+        """
+        Nominal image length in angstrom along an axis, 'X' or 'Y'
+        """
+        return (self._value(f'Delta {axis} [Dac]') * self._value(f'Num.{axis}') *
+                _angstrom_per_dac * self._value(f'{axis}Piezoconst'))
+
+    def _sec_per_image(self):
+        """
+        Duration of a forward and backward scan in simulated seconds
+        """
+        return (2 * self._value('Num.X') * self._value('Num.Y') * self._value('Delta X [Dac]') *
+                self._value('DX/DDeltaX') / _dac_clock)
+
+    def getparam(self, key):
+        """
+        Get a parameter as a string, unknown parameters give an empty string
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, case insensitive
+
+        Returns
+        -------
+        value : str
+        """
+        self._wait()
+        with self._lock:
+            key = key.lower()
+            if key in self._derived:
+                return f'{self._derived[key]():.4f}'
+            if key not in self._names:
+                return ''
+            return str(self._values[self._names[key]])
+
+    def setparam(self, key, value):
+        """
+        Set a parameter, the derived ones such as 'Length x[A]' and 'Sec/Image:' are ignored
+
+        Parameters
+        ----------
+        key : str
+            Parameter name, case insensitive
+        value : str, int or float
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            if key.lower() in self._derived:
+                return
+            name = self._names.setdefault(key.lower(), key)
+            self._values[name] = value
+
+    def setchmodezoff(self, z_offset):
+        """
+        Set the z offset of the constant height mode in angstrom
+        """
+        self.setparam('CHModeZoff', z_offset)
+
+    def getadcvalf(self, board, channel):
+        """
+        Read an ADC, a slow sine plus noise which depend on the board and the channel
+
+        Parameters
+        ----------
+        board : int
+        channel : int
+
+        Returns
+        -------
+        value : float
+        """
+        self._wait()
+        phase = (time.monotonic() - self._t0) / self.time_scale if self.time_scale else 0.0
+        return float(np.sin(phase / (10 + channel) + board) + 0.01 * self._rng.standard_normal())
+
+    def getdacvalfb(self):
+        """
+        Read the z feedback DAC
+
+        Returns
+        -------
+        value : float
+        """
+        self._wait()
+        return float(1000 * np.sin((time.monotonic() - self._t0) / 7) + self._rng.standard_normal())
+
+    def setxyoffvolt(self, x_volt, y_volt):
+        """
+        Move the scan offset, in volts on the piezo
+
+        Parameters
+        ----------
+        x_volt : float
+        y_volt : float
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            self._values['OffsetX'] = -x_volt / _angstrom_per_dac
+            self._values['OffsetY'] = -y_volt / _angstrom_per_dac
+
+    def setxyoffpixel(self, dx=0, dy=0):
+        """
+        Move the scan offset by pixels along the rotated scan axes
+
+        Parameters
+        ----------
+        dx : float
+        dy : float
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            radians = np.deg2rad(self._value('Rotation'))
+            dx_dac = dx * self._value('Delta X [Dac]')
+            dy_dac = dy * self._value('Delta Y [Dac]')
+            self._values['OffsetX'] = self._value('OffsetX') - (np.cos(radians) * dx_dac - np.sin(radians) * dy_dac)
+            self._values['OffsetY'] = self._value('OffsetY') - (np.sin(radians) * dx_dac + np.cos(radians) * dy_dac)
+
+    def scanstart(self):
+        """
+        Start a scan, which lasts as long as 'Sec/Image:' and 'Delay Y' tell
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            duration = self._value('Sec/Image:') / 2 * (1 + 1 / self._value('Delay Y'))
+            self._scan_start = time.monotonic()
+            self._scan_end = self._scan_start + duration
+            self._scan_datetime = datetime.datetime.now()
+
+    def scanstop(self):
+        """
+        Stop the scan
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            if self._scan_end is not None:
+                self._scan_end = min(self._scan_end, time.monotonic())
+
+    def scanwaitfinished(self):
+        """
+        Block until the scan is finished
+
+        Returns
+        -------
+        None : None
+        """
+        while self.scanstatus:
+            time.sleep(min(0.01, max(0.0, self._scan_end - time.monotonic())))
+
+    @property
+    def scanstatus(self):
+        """
+        1 while scanning, 0 otherwise
+
+        Returns
+        -------
+        status : int
+        """
+        self._wait()
+        return int(self._scan_end is not None and time.monotonic() < self._scan_end)
+
+    @property
+    def scan_progress(self):
+        """
+        Fraction of the image already scanned, 1 if no scan is running
+
+        Returns
+        -------
+        progress : float
+        """
+        if self._scan_end is None or self._scan_end <= self._scan_start:
+            return 1.0
+        return min(1.0, (time.monotonic() - self._scan_start) / (self._scan_end - self._scan_start))
+
+    def scan_rows(self, start, stop):
+        """
+        Rows of the images of the last scan, as the remote data access of the STM software.
+        While scanning, the rows not yet scanned are zeros.
+
+        Parameters
+        ----------
+        start : int
+            The first row
+        stop : int
+            The row after the last one
+
+        Returns
+        -------
+        imgs : numpy.array
+            In the shape of (channels, stop - start, Num.X)
+        """
+        self._wait()
+        with self._lock:
+            rows = int(self.scan_progress * self._value('Num.Y'))
+            return self._image(rows)[:, start:stop]
+
+    @property
+    def savedatfilename(self):
+        """
+        Full path of the .dat file of the last scan, named after its start time as by the STM software
+
+        Returns
+        -------
+        file_path : str
+        """
+        self._wait()
+        return os.path.join(self.data_dir, self._scan_datetime.strftime('A%y%m%d.%H%M%S.dat'))
+
+    def topography(self, x, y, t=0.0):
+        """
+        The simulated surface, a hexagonal lattice with a few adsorbates, drifting with time
+
+        Parameters
+        ----------
+        x : numpy.array
+            x in angstrom
+        y : numpy.array
+            y in angstrom
+        t : float
+            Simulated time in seconds
+
+        Returns
+        -------
+        z : numpy.array
+            Height in angstrom
+        """
+        x = x - self.drift.x * t
+        y = y - self.drift.y * t
+        k = 2 * np.pi / 2.5
+        z = sum(np.cos(k * (np.cos(a) * x + np.sin(a) * y)) for a in (0, np.pi / 3, 2 * np.pi / 3)) * 0.05
+        for cx, cy in self._adsorbates:
+            z = z + np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / 50)
+        return z
+
+    def _image(self, rows=None):
+        """
+        Synthetic images of all the channels at the current offset, rotation and size
+
+        Parameters
+        ----------
+        rows : int
+            Number of rows scanned, the rest are zeros. All rows by default
+
+        Returns
+        -------
+        imgs : numpy.array
+            In the shape of (channels, Num.Y, Num.X)
+        """
+        nx, ny = int(self._value('Num.X')), int(self._value('Num.Y'))
+        size = XY2D(x=self._length('X'), y=self._length('Y'))
+        offset = XY2D(x=-self._value('OffsetX') * _angstrom_per_dac * self._value('XPiezoconst'),
+                      y=-self._value('OffsetY') * _angstrom_per_dac * self._value('YPiezoconst'))
+        radians = np.deg2rad(self._value('Rotation'))
+        # the image starts at the offset and extends along y as in GENERIC_FILE.offset and the map applet
+        u, v = np.meshgrid((np.arange(nx) / nx - 0.5) * size.x, np.arange(ny) / ny * size.y)
+        x = offset.x + np.cos(radians) * u + np.sin(radians) * v
+        y = offset.y - np.sin(radians) * u + np.cos(radians) * v
+        t = 0.0 if self._scan_start is None else self._scan_start - self._t0
+        z = self.topography(x, y, t / self.time_scale if self.time_scale else t)
+        channels = int(self._value('Channels'))
+        imgs = np.empty((channels, ny, nx), dtype=cgc['g_file_dat_img_pixel_data_npdtype'])
+        for i in range(channels):
+            imgs[i] = (z if i % 2 == 0 else np.gradient(z, axis=1)) + \
+                1e-3 * self._rng.standard_normal(z.shape)
+        if rows is not None:
+            imgs[:, rows:] = 0
+        return imgs
+
+    def _header(self):
+        """
+        The .dat header in binary, padded to the offset of the image data
+
+        Returns
+        -------
+        header : bytes
+        """
+        lines = ['[Paramco32]']
+        for header_key, name, _ in _params:
+            value = self._values[name]
+            lines.append(f'{header_key} / {name}={value}' if header_key else f'{name}={value}')
+        lines += [f'Length x[A]={self._length("X"):.4f}',
+                  f'Length y[A]={self._length("Y"):.4f}',
+                  f'Sec/Image:={self._value("Sec/Image:"):.3f}']
+        header = ('\r\n'.join(lines) + '\r\n').encode('cp1252')
+        assert len(header) <= cgc['g_file_data_bin_offset'] - 4, 'too many parameters for the header'
+        return header.ljust(cgc['g_file_data_bin_offset'] - 4, b'\x00') + b'DATA'
+
+    def filesave(self, file_path):
+        """
+        Save the image of the last scan as a .dat file. While scanning, the rows not yet scanned are zeros.
+
+        Parameters
+        ----------
+        file_path : str
+            Full path of the .dat file
+
+        Returns
+        -------
+        None : None
+        """
+        self._wait()
+        with self._lock:
+            rows = int(self.scan_progress * self._value('Num.Y'))
+            header = self._header()
+            imgs = self._image(rows)
+        data = np.concatenate([np.zeros(1, imgs.dtype), imgs.ravel()])
+        with open(file_path, 'wb') as f:
+            f.write(header)
+            f.write(zlib.compress(data.tobytes()))
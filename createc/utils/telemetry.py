@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Binary append-only telemetry log
+
+Each record is the wall clock time in float64 seconds since the epoch, followed by one float32 per channel.
+The records are appended to rotating files of a fixed size header and fixed width records,
+so a file can be memory-mapped and a time range found by binary search without parsing.
+"""
+import datetime
+import glob
+import json
+import os
+
+import numpy as np
+
+from .data_producer import ADC_BATCH, _wall_clock_offset
+
+_magic = b'CTLM'
+_header_size = 1024
+_suffix = '.tlm'
+
+
+def record_dtype(n_channels):
+    """
+    dtype of a record
+
+    Parameters
+    ----------
+    n_channels : int
+
+    Returns
+    -------
+    dtype : numpy.dtype
+    """
+    return np.dtype([('time', '<f8'), ('data', '<f4', (n_channels,))])
+
+
+def _header(labels):
+    """
+    The header of a file, the magic followed by the labels in json, padded to _header_size
+
+    Parameters
+    ----------
+    labels : list[str]
+
+    Returns
+    -------
+    header : bytes
+    """
+    header = _magic + json.dumps({'version': 1, 'labels': list(labels)}).encode('utf-8')
+    assert len(header) < _header_size, 'too many or too long labels'
+    return header.ljust(_header_size, b'\0')
+
+
+def _epoch(t):
+    """
+    Seconds since the epoch of a float, a datetime.datetime, or None
+    """
+    if isinstance(t, datetime.datetime):
+        return t.timestamp()
+    return t
+
+
+class TELEMETRY_WRITER:
+    """
+    Append samples to rotating telemetry files '{name}_{%Y%m%d_%H%M%S}.tlm' in a directory.
+    It is not thread safe, write from one thread only, e.g. in the callback of an ACQUISITION_THREAD.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the files
+    name : str
+        The prefix of the file names
+    labels : list[str]
+        The labels of the channels
+    max_bytes : int
+        A new file is started once a file reaches this size
+
+    Examples
+    --------
+    with TELEMETRY_WRITER('logs', 'adc', labels) as writer:
+        writer.write_batch(dp.createc_adc_batch(stm, pairs))
+    """
+
+    def __init__(self, directory, name, labels, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.name = name
+        self.labels = list(labels)
+        self.dtype = record_dtype(len(self.labels))
+        self.max_records = max(1, (max_bytes - _header_size) // self.dtype.itemsize)
+        self.file_path = None
+        self._file = None
+        self._records = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _rotate(self, first_time):
+        """
+        Close the current file and start a new one named after the time of its first record
+        """
+        self.close()
+        stamp = datetime.datetime.fromtimestamp(first_time).strftime('%Y%m%d_%H%M%S')
+        self.file_path = os.path.join(self.directory, f'{self.name}_{stamp}{_suffix}')
+        index = 0
+        while os.path.exists(self.file_path):
+            index += 1
+            self.file_path = os.path.join(self.directory, f'{self.name}_{stamp}_{index}{_suffix}')
+        self._file = open(self.file_path, 'wb')
+        self._file.write(_header(self.labels))
+        self._records = 0
+
+    def write(self, times, data, monotonic=True):
+        """
+        Append samples
+
+        Parameters
+        ----------
+        times : numpy.array
+            Timestamps in the shape of (samples,)
+        data : numpy.array
+            Values in the shape of (samples, channels)
+        monotonic : bool
+            Whether the timestamps are time.monotonic() seconds, otherwise seconds since the epoch
+
+        Returns
+        -------
+        None : None
+        """
+        records = np.empty(len(times), dtype=self.dtype)
+        records['time'] = np.asarray(times) + (_wall_clock_offset if monotonic else 0)
+        records['data'] = np.asarray(data).reshape(len(records), len(self.labels))
+        start = 0
+        while start < len(records):
+            if self._file is None or self._records >= self.max_records:
+                self._rotate(records['time'][start])
+            n = min(len(records) - start, self.max_records - self._records)
+            self._file.write(records[start:start + n].tobytes())
+            self._records += n
+            start += n
+        if self._file is not None:
+            self._file.flush()
+
+    def write_batch(self, batches):
+        """
+        Append one ADC_BATCH, or a list of batches of the same timestamps side by side, e.g. from an ACQUISITION_THREAD
+
+        Parameters
+        ----------
+        batches : ADC_BATCH or list[ADC_BATCH]
+
+        Returns
+        -------
+        None : None
+        """
+        if isinstance(batches, ADC_BATCH):
+            batches = [batches]
+        n = min(len(batch.timestamps) for batch in batches)
+        self.write(batches[0].timestamps[-n:], np.hstack([batch.data[-n:] for batch in batches]))
+
+    def close(self):
+        """
+        Close the current file
+
+        Returns
+        -------
+        None : None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_file(file_path):
+    """
+    Memory-map the records of a telemetry file, a partially written last record is left out
+
+    Parameters
+    ----------
+    file_path : str
+
+    Returns
+    -------
+    labels : list[str]
+    records : numpy.memmap or numpy.array
+        Structured with the fields 'time' and 'data'
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(_header_size)
+    assert header[:len(_magic)] == _magic, f'{file_path} is not a telemetry file'
+    labels = json.loads(header[len(_magic):].rstrip(b'\0').decode('utf-8'))['labels']
+    dtype = record_dtype(len(labels))
+    n = (os.path.getsize(file_path) - _header_size) // dtype.itemsize
+    if n <= 0:
+        return labels, np.empty(0, dtype=dtype)
+    return labels, np.memmap(file_path, dtype=dtype, mode='r', offset=_header_size, shape=(n,))
+
+
+class TELEMETRY_READER:
+    """
+    Read the telemetry files written by a TELEMETRY_WRITER of the same directory and name,
+    including the file being written.
+
+    Parameters
+    ----------
+    directory : str
+    name : str
+    """
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+
+    @property
+    def files(self):
+        """
+        The files in the order of time
+
+        Returns
+        -------
+        file_paths : list[str]
+        """
+        return sorted(glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(self.name)}_*{_suffix}')))
+
+    @property
+    def labels(self):
+        """
+        The labels of the channels in the latest file
+
+        Returns
+        -------
+        labels : list[str]
+        """
+        files = self.files
+        assert files, f'no telemetry of {self.name} in {self.directory}'
+        return read_file(files[-1])[0]
+
+    def read(self, start=None, end=None, monotonic=False):
+        """
+        Read the samples within a time range
+
+        Parameters
+        ----------
+        start : float or datetime.datetime
+            Seconds since the epoch, None for the beginning
+        end : float or datetime.datetime
+            Seconds since the epoch, None for the end
+        monotonic : bool
+            Whether to return the timestamps as time.monotonic() seconds of this process, e.g. for a RING_BUFFER
+
+        Returns
+        -------
+        times : numpy.array
+            In the shape of (samples,)
+        data : numpy.array
+            In the shape of (samples, channels)
+        """
+        start, end = _epoch(start), _epoch(end)
+        n_channels = None
+        times, data = [], []
+        for file_path in self.files:
+            labels, records = read_file(file_path)
+            if n_channels is None:
+                n_channels = len(labels)
+            if not len(records) or len(labels) != n_channels:
+                continue
+            t = records['time']
+            if (start is not None and t[-1] < start) or (end is not None and t[0] > end):
+                continue
+            i = 0 if start is None else np.searchsorted(t, start, side='left')
+            j = len(t) if end is None else np.searchsorted(t, end, side='right')
+            times.append(np.array(t[i:j]))
+            data.append(np.array(records['data'][i:j]))
+        if not times:
+            return np.empty(0), np.empty((0, n_channels or 0), dtype='<f4')
+        times = np.concatenate(times)
+        return (times - _wall_clock_offset if monotonic else times), np.concatenate(data)
+
+    def replay(self, buffers, start=None, end=None):
+        """
+        Load the samples within a time range into ring buffers, e.g. those shown by the oscilloscope
+
+        Parameters
+        ----------
+        buffers : list[createc.utils.acquisition.RING_BUFFER]
+            One per channel
+        start : float or datetime.datetime
+        end : float or datetime.datetime
+            See read()
+
+        Returns
+        -------
+        count : int
+            Number of samples per channel
+        """
+        times, data = self.read(start, end, monotonic=True)
+        for buffer, column in zip(buffers, data.T):
+            buffer.append(times, column)
+        return len(times)
@@ -18,7 +18,7 @@ import os
 import secrets
 from createc.Createc_pyFile import DAT_IMG
 from createc.Createc_pyCOM import CreatecWin32
-from createc.utils.misc import XY2D, point_rot2D_y_inv
+from createc.utils.misc import XY2D
 from createc.utils.image_utils import level_correction
 
 
@@ -40,15 +40,17 @@ def make_document(doc):
             show_stm_area_bn.disabled = True
             return
 
-        x0 = stm.offset.x + np.sin(np.deg2rad(stm.angle)) * stm.nom_size.y / 2
-        y0 = stm.offset.y + np.cos(np.deg2rad(stm.angle)) * stm.nom_size.y / 2
+        with stm.snapshot():
+            offset, nom_size, angle = stm.offset, stm.nom_size, stm.angle
+        x0 = offset.x + np.sin(np.deg2rad(angle)) * nom_size.y / 2
+        y0 = offset.y + np.cos(np.deg2rad(angle)) * nom_size.y / 2
 
-        plot = p.rect(x=x0, y=y0, width=stm.nom_size.x, height=stm.nom_size.y, 
-                      angle=stm.angle, angle_units='deg',
+        plot = p.rect(x=x0, y=y0, width=nom_size.x, height=nom_size.y, 
+                      angle=angle, angle_units='deg',
                       fill_alpha=0, line_color='blue')
         rect_que.append(plot)
-        textxy_show.value = f'x={stm.offset.x:.2f}, y={stm.offset.y:.2f}'
-        textxy_tap.value = f'{stm.offset.x:.2f},{stm.offset.y:.2f}'
+        textxy_show.value = f'x={offset.x:.2f}, y={offset.y:.2f}'
+        textxy_tap.value = f'{offset.x:.2f},{offset.y:.2f}'
         status_text.value = 'STM location shown'
 
     def mark_area_callback(event):
@@ -65,11 +67,13 @@ def make_document(doc):
         x, y = textxy_tap.value.split(',')
         x = float(x)
         y = float(y)
-        x0 = x + np.sin(np.deg2rad(stm.angle)) * stm.nom_size.y / 2
-        y0 = y + np.cos(np.deg2rad(stm.angle)) * stm.nom_size.y / 2
+        with stm.snapshot():
+            nom_size, angle = stm.nom_size, stm.angle
+        x0 = x + np.sin(np.deg2rad(angle)) * nom_size.y / 2
+        y0 = y + np.cos(np.deg2rad(angle)) * nom_size.y / 2
 
-        plot = p.rect(x=x0, y=y0, width=stm.nom_size.x, height=stm.nom_size.y, 
-                      angle=stm.angle, angle_units='deg',
+        plot = p.rect(x=x0, y=y0, width=nom_size.x, height=nom_size.y, 
+                      angle=angle, angle_units='deg',
                       fill_alpha=0, line_color='green')
         rect_que.append(plot)
         status_text.value = 'Area selected'
@@ -131,12 +135,8 @@ def make_document(doc):
         threshold = np.mean(img)-NUM_SIGMA*np.std(img)
         img[img<threshold] = threshold
 
-        temp = file.nom_size.y-file.size.y if file.scan_ymode == 2 else 0
-        anchor = XY2D(x=file.offset.x, 
-                      y=(file.offset.y+temp+file.size.y/2))
-
-        anchor = point_rot2D_y_inv(anchor, XY2D(x=file.offset.x, y=file.offset.y), 
-                             np.deg2rad(file.rotation))
+        # the center of the (cropped) image
+        anchor = XY2D(*file.transform([file.xPixel / 2, file.img_pixels.y / 2], 'pixel', 'angstrom'))
         # print('offset:', file.offset)
         # print('angle:', file.rotation)
         if int(file.rotation*100) not in [0, 9000, -9000, 18000, -18000]:
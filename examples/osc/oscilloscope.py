@@ -2,12 +2,15 @@
 """
      Oscilloscope with logging (graphing by Bokeh)
      Implemented with producer/consumer model
-     Main thread :  data_producer and a Bokeh server for graphing
-     Child thread : Logger (consumer)
+     Main thread :  a Bokeh server for graphing, which reads the ring buffers at its own frame rate
+                    and sends a decimated view of about the screen resolution to the browser
+     Child threads : acquisition (data_producer into ring buffers, and every sample into a binary telemetry log)
+                     and optionally a text Logger (consumer)
 """
 
 from bokeh.server.server import Server
-from bokeh.models import ColumnDataSource, Label, HoverTool
+from bokeh.models import ColumnDataSource, DataRange1d, Label, HoverTool
+from bokeh.events import Reset
 from bokeh.plotting import figure
 from bokeh.layouts import column
 from functools import partial
@@ -16,6 +19,14 @@ import datetime as dt
 from threading import Thread, Event
 import queue
 import argparse
+import os
+
+import numpy as np
+
+import createc.utils.data_producer as dp
+from createc.utils.acquisition import ACQUISITION_THREAD
+from createc.utils.decimation import window, minmax_decimate, lttb
+from createc.utils.telemetry import TELEMETRY_WRITER, TELEMETRY_READER
 
 # Scope_Points = 50000  # total points to show in each channel in the scope
 # Log_Avg_Len = 5  # Average through recent X points for logging
@@ -81,43 +92,78 @@ def logger(buffer_q, labels, log_name, quit_sig, log_interval, format_specifier,
         #time.sleep(interval * 0.001)  # try to be in sync with producer, but not necessary
 
 
-def make_document(doc, log_q, funcs, labels, scope_points, format_specifier, y_axis_type, interval):
+def make_document(doc, acquisition, labels, view_points, format_specifier, y_axis_type, frame_interval,
+                  decimate=minmax_decimate):
     """
-    The document for bokeh server, it takes care of data producer in the update() function
+    The document for bokeh server, it shows the samples of the acquisition thread in the update() function.
+    The full history stays in the ring buffers, only a decimated view of the shown time range is sent to the browser,
+    which is recomputed on every frame as well as on zoom and pan.
 
     Parameters
     ----------
     doc :
         The current doc
-    log_q : queue.Queue
-        The queue holding the data for logger
-    funcs : list(functions)
-        List of producer functions
+    acquisition : createc.utils.acquisition.ACQUISITION_THREAD
+        The acquisition thread with one ring buffer per channel
     labels : list(str)
         List of osc labels
-    scope_points : int
-        Total points shown in a scope
+    view_points : int
+        Points at most sent to a scope, about its width in pixels
     format_specifier : str
         Format specifier for the values shown in the scope annotation
+    frame_interval : int
+        Refresh interval of the scope in milliseconds
+    decimate : callable
+        minmax_decimate or lttb
 
     Returns
     -------
     None : None
     """
+    # monotonic seconds of the shown time range, None for the whole history up to the latest sample
+    view = dict(start=None, end=None)
+    cursors = [0] * len(acquisition.buffers)
+    # datetime axes are in milliseconds of the local time
+    epoch_ms = dp.monotonic_to_datetime(np.zeros(1)).astype('datetime64[us]').astype(float)[0] * 1e-3
+
+    def refresh(force=False):
+        """
+        Send the decimated view of the shown time range to the scopes
+        """
+        for index, buffer in enumerate(acquisition.buffers):
+            if not force and buffer.count == cursors[index]:
+                continue
+            times, values, cursors[index] = buffer.read()
+            if not len(values):
+                continue
+            annotations[index].text = f'{values[-1]:{format_specifier}}'
+            times, values = decimate(*window(times, values, view['start'], view['end']), view_points)
+            sources[index].data = dict(time=dp.monotonic_to_datetime(times), data=values)
 
     def update():
         """
-        The data producer and updater for bokeh server
+        Show the samples acquired since the last update, unless the scopes are zoomed into the past
         """
-        data_list = []
-        for func in funcs:
-            data_list += [(dt.datetime.now(), res) for res in func()]
+        if view['end'] is None:
+            refresh()
 
-        data_pak = tuple(data_list)
-        log_q.put(data_pak)
-        for index, data in enumerate(data_pak):
-            sources[index].stream(dict(time=[data[0]], data=[data[1]]), scope_points)
-            annotations[index].text = f'{data[1]:{format_specifier}}'
+    def on_range_change(attr, old, new):
+        """
+        Recompute the view for the new time range, following the latest samples if it reaches them
+        """
+        if x_range.start is None or x_range.end is None:
+            return
+        start, end = (x_range.start - epoch_ms) * 1e-3, (x_range.end - epoch_ms) * 1e-3
+        latest = max((buffer.latest()[0] for buffer in acquisition.buffers if buffer.count), default=end)
+        following = view['end'] is None
+        view['start'], view['end'] = start, (None if end >= latest else end)
+        # the range also follows the new samples by itself, which update() already sends
+        if not (following and view['end'] is None):
+            refresh(force=True)
+
+    def on_reset(event):
+        view['start'] = view['end'] = None
+        refresh(force=True)
 
     sources = [ColumnDataSource(dict(time=[], data=[])) for _ in range(len(labels))]
     figs = []
@@ -130,20 +176,25 @@ def make_document(doc, log_q, funcs, labels, scope_points, format_specifier, y_a
         ],
         formatters={"$x": "datetime"}
     )
+    x_range = DataRange1d()  # the scopes share the time axis, zoom and pan act on all of them
     for i in range(len(labels)):
         figs.append(figure(x_axis_type='datetime',
+                           x_range=x_range,
                            y_axis_type=y_axis_type,
                            y_axis_label=labels[i],
-                           toolbar_location=None, active_drag=None, active_scroll=None, tools=[hover]))
+                           toolbar_location=None, active_drag='xpan', active_scroll='xwheel_zoom',
+                           tools=['xpan', 'xwheel_zoom', 'reset', hover]))
         figs[i].line(x='time', y='data', source=sources[i], line_color='red')
         annotations.append(Label(x=10, y=10, text='text', text_font_size=font_size, text_color='white',
                                  x_units='screen', y_units='screen', background_fill_color=None))
         figs[i].add_layout(annotations[i])
+        figs[i].on_event(Reset, on_reset)
+    x_range.on_change('start', 'end', on_range_change)
 
     doc.theme = 'dark_minimal'
     doc.title = "Oscilloscope"
     doc.add_root(column([fig for fig in figs], sizing_mode='stretch_both'))
-    doc.add_periodic_callback(callback=update, period_milliseconds=interval)
+    doc.add_periodic_callback(callback=update, period_milliseconds=frame_interval)
 
 
 if __name__ == '__main__':
@@ -156,15 +207,27 @@ if __name__ == '__main__':
     group.add_argument("-c", "--cpu", help="show cpu usage", action="store_true")
     group.add_argument("-a", "--adc", help="show ADC signals board 1..2 channel 0..5", action="store_true")
     group.add_argument("-p", "--pressure", help="show pressure", action="store_true")
+    group.add_argument("-r", "--replay", help="replay the telemetry log of a name, e.g. pressure, instead")
 
     parser.add_argument("-o", "--port", help="specify a port", default=5001, type=int)
-    parser.add_argument("-l", "--log_interval", help="log interval in seconds", default=5, type=int)
-    parser.add_argument("-s", "--scope_points", help="total points shown in a scope", default=50000, type=int)
-    parser.add_argument("-i", "--interval", help="stream interval in milliseconds", default=500, type=int)
+    parser.add_argument("-l", "--log_interval", help="log interval in seconds of the text log", default=5, type=int)
+    parser.add_argument("-x", "--text_log", help="also log to text, every log_interval", action="store_true")
+    parser.add_argument("-s", "--scope_points", help="total points kept in the history of a scope", default=50000,
+                        type=int)
+    parser.add_argument("-v", "--view_points", help="points at most sent to the browser for a scope", default=2000,
+                        type=int)
+    parser.add_argument("-d", "--decimation", help="decimation of the history for the scopes",
+                        choices=['minmax', 'lttb'], default='minmax')
+    parser.add_argument("-i", "--interval", help="sampling interval in milliseconds", default=500, type=int)
+    parser.add_argument("-f", "--frame_interval", help="scope refresh interval in milliseconds", default=500,
+                        type=int)
+    parser.add_argument("-n", "--samples", help="ADC samples in each sampling interval, with --adc", default=1,
+                        type=int)
 
     args = parser.parse_args()
     y_axis_type = 'linear'
     fs = '.2f'
+    pollers = []
     if args.zi:
         import createc.utils.data_producer as dp
         from createc.Createc_pyCOM import CreatecWin32
@@ -196,132 +259,30 @@ if __name__ == '__main__':
         from createc.Createc_pyCOM import CreatecWin32
 
         stm = CreatecWin32()
-        producer_funcs = [partial(dp.createc_adc, stm=stm, channel=0, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=1, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=2, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=3, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=4, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=5, board=1),
-                          partial(dp.createc_adc, stm=stm, channel=0, board=2),
-                          partial(dp.createc_adc, stm=stm, channel=1, board=2),
-                          partial(dp.createc_adc, stm=stm, channel=2, board=2),
-                          partial(dp.createc_adc, stm=stm, channel=3, board=2),
-                          partial(dp.createc_adc, stm=stm, channel=4, board=2),
-                          partial(dp.createc_adc, stm=stm, channel=5, board=2)]
+        # all the 12 channels in one pass, args.samples passes in each stream interval
+        producer_funcs = [partial(dp.createc_adc_batch, stm=stm,
+                                  pairs=[(board, channel) for board in (1, 2) for channel in range(6)],
+                                  samples=args.samples, period=args.interval * 1e-3 / args.samples)]
         y_labels = ['ADC' + str(i) for i in range(12)]
         logger_name = 'ADC'
     elif args.pressure:
-        def prep_p_dp(ser):
-            """
-
-            Parameters
-            ----------
-            ser : serial.Serial
-                Serial instance
-
-            Returns
-            -------
-            response : float
-                Pressure in mbar
-            """
-            ser.write('#RD\r'.encode())
-            response = ser.readline()
-            if len(response) == 0:
-                return 0
-            return float(response[2:-1]),
-
-
-        def loadlock_p_dp(ser):
-            """
-
-            Parameters
-            ----------
-            ser : serial.Serial
-                Serial instance
-
-            Returns
-            -------
-            response : float
-                Pressure in mbar
-            """
-            ser.write(b"RPV1\r")
-            response = ser.read(size=50).decode('ascii').split(',')
-            try:
-                return float(response[1]),
-            except IndexError:
-                return 0,
-
-
-        def gasline_p_dp(ser):
-            """
-
-            Parameters
-            ----------
-            ser : serial.Serial
-                Serial instance
-
-            Returns
-            -------
-            response : float
-                Pressure in mbar
-            """
-            ser.write(b"RPV3\r")
-            response = ser.read(size=50).decode('ascii').split(',')
-            try:
-                return float(response[1]),
-            except IndexError:
-                return 0,
-            
-
-        def vacom_p_dp(ser):
-            """
-
-            Parameters
-            ----------
-            ser : serial.Serial
-                Serial instance
-
-            Returns
-            -------
-            response : tuple
-                Pressures in mbar
-            """
-            ser.write(b"RPV3\r")
-            try:
-                p = ser.read(size=100).decode('cp1252', errors='ignore').strip().split('0,')
-            except IndexError:
-                p = ['000', '000']
-            ser.write(b"RPV3\r")
-            ser.write(b"RPV1\r")
-            return float(p[-1].strip()), float(p[1].strip())
-
-        def main_ion_p_dp(ser):
-            """
-
-            Parameters
-            ----------
-            ser : serial.Serial
-                Serial instance
-
-            Returns
-            -------
-            response : float
-                Pressure in mbar
-            """
-            ser.write(b'~ 05 0B 02 00\r')
-            response = ser.readline()
-            return float(response.split()[3]),
-
-
         import serial
-
-        ser_prep_p = serial.Serial('COM4', timeout=0)
-        ser_vacom_p = serial.Serial('COM6', timeout=0)
-        ser_main_ion_p = serial.Serial('COM7', timeout=0)
-        producer_funcs = [partial(main_ion_p_dp, ser=ser_main_ion_p),
-                          partial(prep_p_dp, ser=ser_prep_p),
-                          partial(vacom_p_dp, ser=ser_vacom_p)
-                          ]
+        from createc.utils.instruments import GAUGE_QUERY, LATEST_VALUES, SERIAL_POLLER, parse_prep, parse_rpv, \
+            parse_ion
+
+        # every gauge is polled on its own thread, the scopes only read the latest values
+        latest_pressure = LATEST_VALUES(4, max_age=10 * args.interval * 1e-3)
+        pollers = [SERIAL_POLLER(serial.Serial('COM7'), [GAUGE_QUERY(b'~ 05 0B 02 00\r', parse_ion, b'\n')],
+                                 latest_pressure, first_channel=0, period=args.interval * 1e-3),
+                   SERIAL_POLLER(serial.Serial('COM4'), [GAUGE_QUERY(b'#RD\r', parse_prep, b'\n')],
+                                 latest_pressure, first_channel=1, period=args.interval * 1e-3),
+                   # the loadlock and the gasline gauges on one controller, both queries sent at once
+                   SERIAL_POLLER(serial.Serial('COM6'), [GAUGE_QUERY(b'RPV1\r', parse_rpv),
+                                                         GAUGE_QUERY(b'RPV3\r', parse_rpv)],
+                                 latest_pressure, first_channel=2, period=args.interval * 1e-3, pipeline=2)]
+        for poller in pollers:
+            poller.start()
+        producer_funcs = [latest_pressure]
         y_labels = ['Main_Ion_P',
                     'Prep_P', 
                     'Loadlock_P',
@@ -330,6 +291,11 @@ if __name__ == '__main__':
         logger_name = 'pressure'
         fs = '.2e'
         y_axis_type = 'log'
+    elif args.replay:
+        reader = TELEMETRY_READER(os.path.join(os.path.dirname(__file__), 'logs'), args.replay)
+        producer_funcs = []
+        y_labels = reader.labels
+        logger_name = args.replay
     else:
         import createc.utils.data_producer as dp
 
@@ -338,19 +304,49 @@ if __name__ == '__main__':
         logger_name = 'random'
 
     logger_q = queue.Queue()
-
-    # Start the data producer thread and the logger thread
     quit_signal = Event()  # signal for terminating all threads
 
-    logging = Thread(target=logger,
-                     args=(logger_q, y_labels, logger_name, quit_signal, args.log_interval, fs, args.interval))
-    logging.start()
-    print('Start logging thread')
+    if args.replay:
+        # the whole log is kept for the scopes
+        times, data = reader.read(monotonic=True)
+        acquisition = ACQUISITION_THREAD(producer_funcs, len(y_labels), max(args.scope_points, len(times), 1),
+                                         args.interval * 1e-3)
+        for buffer, column in zip(acquisition.buffers, data.T):
+            buffer.append(times, column)
+        print(f'Replay {len(times)} samples of {logger_name}')
+    else:
+        telemetry = TELEMETRY_WRITER(os.path.join(os.path.dirname(__file__), 'logs'), logger_name, y_labels)
+
+        def to_logger(batches):
+            """
+            Write every sample to the telemetry log, and feed the latest sample of every channel to the text logger
+            """
+            telemetry.write_batch(batches)
+            if not args.text_log:
+                return
+            data_pak = []
+            for batch in batches:
+                stamp = dp.monotonic_to_datetime(batch.timestamps[-1:]).astype(dt.datetime)[0]
+                data_pak += [(stamp, value) for value in batch.data[-1]]
+            logger_q.put(tuple(data_pak))
+
+        # Start the acquisition thread and the logger thread
+        acquisition = ACQUISITION_THREAD(producer_funcs, len(y_labels), args.scope_points, args.interval * 1e-3,
+                                         callback=to_logger)
+        acquisition.start()
+        print('Start acquisition thread, logging to ' + telemetry.directory)
+
+        if args.text_log:
+            logging = Thread(target=logger,
+                             args=(logger_q, y_labels, logger_name, quit_signal, args.log_interval, fs, args.interval))
+            logging.start()
+            print('Start logging thread')
 
     # Main thread for graphing
-    server = Server({'/': partial(make_document, log_q=logger_q, funcs=producer_funcs, labels=y_labels,
-                                  scope_points=args.scope_points, format_specifier=fs,
-                                  y_axis_type=y_axis_type, interval=args.interval)},
+    server = Server({'/': partial(make_document, acquisition=acquisition, labels=y_labels,
+                                  view_points=args.view_points, format_specifier=fs,
+                                  y_axis_type=y_axis_type, frame_interval=args.frame_interval,
+                                  decimate=lttb if args.decimation == 'lttb' else minmax_decimate)},
                     port=args.port)
     server.start()
     server.io_loop.add_callback(server.show, "/")
@@ -358,30 +354,11 @@ if __name__ == '__main__':
         server.io_loop.start()
     except KeyboardInterrupt:
         quit_signal.set()
+        acquisition.stop()
+        if not args.replay:
+            telemetry.close()
         print('Keyboard interruption')
-"""
     finally:
-        try: 
-            ser_prep_p
-        except NameError:
-            pass
-        else:
-            if ser_prep_p.isOpen():
-                ser_prep_p.close()
-                
-        try:
-            ser_vacom_p
-        except NameError:
-            pass
-        else:
-            if ser_vacom_p.isOpen():
-                ser_vacom_p.close()
-                
-        try:
-            ser_main_ion_p
-        except NameError:
-            pass
-        else:
-            if ser_main_ion_p.isOpen():
-                ser_main_ion_p.close()
-"""
+        for poller in pollers:
+            poller.stop()
+            poller.port.close()
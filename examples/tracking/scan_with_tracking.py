@@ -9,14 +9,10 @@ Autofilesave should be OFF
 Be careful about daylight saving time where the continuous shift-finding can fail.
 """
 from createc.Createc_pyFile import DAT_IMG
-# from skimage.feature import register_translation as rt
-from skimage.registration import phase_cross_correlation as pcc
-from skimage.exposure import rescale_intensity as ri
-from skimage.filters import gaussian
 import numpy as np
 import time
 from createc.Createc_pyCOM import CreatecWin32
-from createc.utils.image_utils import level_correction
+from createc.utils.drift import DRIFT_TRACKER
 import logging.config
 import yaml
 import sys
@@ -24,31 +20,6 @@ import os
 import datetime
 
 
-def find_shift(img_src, img_des, img_previous, extra_sec, continuous_drift=True):
-    """
-
-    Parameters
-    ----------
-    img_src
-    img_des
-    img_previous
-    extra_sec
-    continuous_drift
-
-    Returns
-    -------
-
-    """
-    shift = [pcc(level_correction(gaussian(ri(src))), level_correction(gaussian(ri(des))))[0]
-             for src, des in zip([img_src.img_array_list[i] for i in params['shift_reg_channel']],
-                                 [img_des.img_array_list[i] for i in params['shift_reg_channel']])]
-    shift = np.mean(shift, axis=0)
-    dt1 = img_src.timestamp - img_previous.timestamp
-    dt2 = time.time() + extra_sec - img_previous.timestamp
-    shift_c = shift * dt2 / dt1
-    return shift_c if continuous_drift else shift
-
-
 this_dir = os.path.dirname(__file__)
 log_config = os.path.join(this_dir, 'logging_tracking.config')
 log_fn = 'log_' + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + '.log'
@@ -72,7 +43,8 @@ except FileNotFoundError:
     print('Template file cannot be opened.')
     sys.exit()
 
-img_previous = img_des
+# the template spectrum is computed once, the drift velocity is fitted to the shifts of the alignment scans
+tracker = DRIFT_TRACKER([img_des.img_array_list[i] for i in params['shift_reg_channel']], img_des.timestamp)
 logger.info('Start.' + '*' * 30)
 logger.info('template: ' + template[-params['g_filename_len']:])
 
@@ -119,11 +91,14 @@ for ch_zoff, ci_bias, ci_current in zip(Height_Range_Angstrom, Bias_Range_mV, Cu
         logger.info('Align to template')
         img_src = DAT_IMG(cc_file_4align)
 
-        shift = find_shift(img_src, img_des, img_previous, params['g_reposition_delay'],
-                           continuous_drift=True)
+        shift = tracker.register([img_src.img_array_list[i] for i in params['shift_reg_channel']],
+                                 img_src.timestamp)
+        logger.info('shift [dy, dx] = {}, drift velocity [dy, dx] = {} px/s'.format(shift, tracker.velocity))
+        correction = tracker.predict(time.time() + params['g_reposition_delay'])
 
-        logger.info('[dy, dx] = {}'.format(shift))
-        stm.setxyoffpixel(dx=shift[1], dy=shift[0])
+        logger.info('[dy, dx] = {}'.format(correction))
+        stm.setxyoffpixel(dx=correction[1], dy=correction[0])
+        tracker.corrected(correction)
         time.sleep(params['g_reposition_delay'])
 
         # for testing shift registration
@@ -159,7 +134,6 @@ for ch_zoff, ci_bias, ci_current in zip(Height_Range_Angstrom, Bias_Range_mV, Cu
                 time.sleep(5)
             stm.filesave(stm.savedatfilename)
             logger.info('cc: ' + stm.savedatfilename[-params['g_filename_len']:])
-            img_previous = DAT_IMG(stm.savedatfilename)
 
         logger.info('Data scan')
         stm.pre_scan_config(chmode=params['Const_Height'],
@@ -4,6 +4,7 @@ from bokeh.models import Button, TextInput, Slider, Select
 from bokeh.models.formatters import FuncTickFormatter
 
 from createc.Createc_pyCOM import CreatecWin32
+from createc.Createc_pyAsync import AsyncCreatec
 import logging.config
 import logging
 import os
@@ -15,8 +16,17 @@ def make_document(doc):
     """
     The make doc func for bokeh
 
+    All the STM calls go through AsyncCreatec, so ramping does not freeze the server
     """
 
+    def read_state(stm):
+        """
+        Read what the controls show, in one go on the STM worker thread
+        """
+        with stm.snapshot():
+            return (stm.bias_mV, stm.current_pA, stm.imgX_size_bits, stm.nom_size.x,
+                    stm.img_dDeltaX_bits, stm.duration)
+
     def connect_stm_callback(event):
         """
         Callback to connect to the STM software
@@ -24,23 +34,32 @@ def make_document(doc):
         status_text.value = 'Connecting to STM'
         connect_stm_bn.disabled = True
 
-        def process():
+        async def process():
             nonlocal stm
-            stm = CreatecWin32()
+            if stm is not None:
+                stm.close()
+            stm = AsyncCreatec()
+            bias_mV, current_pA, size_bits, real_size, dDeltaX_bits, duration = await stm.run(read_state)
             status_text.value = 'STM connected'
             connect_stm_bn.disabled = False
-            bias_mV_input.value = stm.bias_mV
-            current_pA_input.value = stm.current_pA
-            img_size_text.value = str(stm.imgX_size_bits)
-            img_real_size.value = str(stm.nom_size.x)
-            img_duration_text.value = str(stm.img_dDeltaX_bits)
-            img_real_duration.value = str(datetime.timedelta(seconds=stm.duration))
+            bias_mV_input.value = bias_mV
+            current_pA_input.value = current_pA
+            img_size_text.value = str(size_bits)
+            img_real_size.value = str(real_size)
+            img_duration_text.value = str(dDeltaX_bits)
+            img_real_duration.value = str(datetime.timedelta(seconds=duration))
             msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Connect to STM'
             this_logger.info(msg)
 
         doc.add_next_tick_callback(process)
 
-    def process_bias():
+    async def is_connected():
+        if stm is None or not await stm.run(CreatecWin32.is_active):
+            status_text.value = 'No STM is connected'
+            return False
+        return True
+
+    async def process_bias():
         try:
             bias_target = float(bias_mV_input.value)
         except ValueError:
@@ -53,7 +72,10 @@ def make_document(doc):
             status_text.value = 'Invalid steps'
             ramping_bias_bn.disabled = False
             return
-        stm.ramp_bias_mV(bias_target, steps)
+        if not await is_connected():
+            ramping_bias_bn.disabled = False
+            return
+        await stm.ramp_bias_mV(bias_target, steps)
         msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         msg = msg + f' Ramp bias to {bias_target} mV with steps speed {steps}'
         this_logger.info(msg)
@@ -61,9 +83,6 @@ def make_document(doc):
         ramping_bias_bn.disabled = False
 
     def preprocess_bias():
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
         status_text.value = 'Ramping bias'
         ramping_bias_bn.disabled = True
 
@@ -78,7 +97,7 @@ def make_document(doc):
         preprocess_bias()
         doc.add_next_tick_callback(process_bias)
 
-    def process_current():
+    async def process_current():
         try:
             current_target = float(current_pA_input.value)
         except ValueError:
@@ -91,7 +110,10 @@ def make_document(doc):
             status_text.value = 'Invalid steps'
             ramping_current_bn.disabled = False
             return
-        stm.ramp_current_pA(current_target, steps)
+        if not await is_connected():
+            ramping_current_bn.disabled = False
+            return
+        await stm.ramp_current_pA(current_target, steps)
         msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         msg = msg + f' Ramp current to {current_target} pA with steps speed {steps}'
         this_logger.info(msg)
@@ -99,9 +121,6 @@ def make_document(doc):
         ramping_current_bn.disabled = False
 
     def preprocess_current():
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
         status_text.value = 'Ramping current'
         ramping_current_bn.disabled = True
 
@@ -117,18 +136,21 @@ def make_document(doc):
         doc.add_next_tick_callback(process_current)
 
     def img_size_select_cb(attr, old, new):
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
-        stm.setparam('Delta X [Dac]', int(img_size_select.value))
-        status_text.value = 'Image size changed'
-        msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image size changed to ' + img_size_select.value
-        this_logger.info(msg)
+        async def process():
+            if not await is_connected():
+                return
+            await stm.setparam('Delta X [Dac]', int(img_size_select.value))
+            status_text.value = 'Image size changed'
+            msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image size changed to ' + \
+                img_size_select.value
+            this_logger.info(msg)
 
-    def img_size_change_cb(event, op):
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
+        doc.add_next_tick_callback(process)
+
+    def change_size(stm, op):
+        """
+        Change the image size on the STM worker thread
+        """
         old_size = stm.imgX_size_bits
         if op == 'plus1':
             new_size = old_size + 1
@@ -142,27 +164,37 @@ def make_document(doc):
             raise ValueError('operation is not supported')
 
         stm.imgX_size_bits = new_size
-        new_size = stm.imgX_size_bits
-        status_text.value = 'Image size changed'
-        img_size_text.value = str(new_size)
-        img_real_size.value = str(stm.nom_size.x)
-        msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image size changed to ' + str(new_size)
-        this_logger.info(msg)
+        return stm.imgX_size_bits, stm.nom_size.x
+
+    def img_size_change_cb(event, op):
+        async def process():
+            if not await is_connected():
+                return
+            new_size, real_size = await stm.run(change_size, op)
+            status_text.value = 'Image size changed'
+            img_size_text.value = str(new_size)
+            img_real_size.value = str(real_size)
+            msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image size changed to ' + str(new_size)
+            this_logger.info(msg)
+
+        doc.add_next_tick_callback(process)
 
     def img_speed_select_cb(attr, old, new):
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
-        stm.setparam('DX/DDeltaX', int(img_speed_select.value))
-        status_text.value = 'Image speed changed'
-        msg = datetime.datetime.now().strftime(
-            "%Y-%m-%d %H:%M:%S") + ' Image speed changed to ' + img_speed_select.value
-        this_logger.info(msg)
+        async def process():
+            if not await is_connected():
+                return
+            await stm.setparam('DX/DDeltaX', int(img_speed_select.value))
+            status_text.value = 'Image speed changed'
+            msg = datetime.datetime.now().strftime(
+                "%Y-%m-%d %H:%M:%S") + ' Image speed changed to ' + img_speed_select.value
+            this_logger.info(msg)
 
-    def img_duration_change_cb(event, op):
-        if stm is None or not stm.is_active():
-            status_text.value = 'No STM is connected'
-            return
+        doc.add_next_tick_callback(process)
+
+    def change_duration(stm, op):
+        """
+        Change the image duration on the STM worker thread
+        """
         old_duration = stm.img_dDeltaX_bits
         if op == 'plus1':
             new_duration = old_duration + 1
@@ -176,12 +208,21 @@ def make_document(doc):
             raise ValueError('operation is not supported')
 
         stm.img_dDeltaX_bits = new_duration
-        new_duration = stm.img_dDeltaX_bits
-        status_text.value = 'Image duration changed'
-        img_duration_text.value = str(new_duration)
-        img_real_duration.value = str(datetime.timedelta(seconds=stm.duration))
-        msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image duration changed to ' + str(new_duration)
-        this_logger.info(msg)
+        return stm.img_dDeltaX_bits, stm.duration
+
+    def img_duration_change_cb(event, op):
+        async def process():
+            if not await is_connected():
+                return
+            new_duration, duration = await stm.run(change_duration, op)
+            status_text.value = 'Image duration changed'
+            img_duration_text.value = str(new_duration)
+            img_real_duration.value = str(datetime.timedelta(seconds=duration))
+            msg = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' Image duration changed to ' + \
+                str(new_duration)
+            this_logger.info(msg)
+
+        doc.add_next_tick_callback(process)
 
     """
     Main body below
@@ -14,7 +14,7 @@ setuptools.setup(
     url="https://py-createc.readthedocs.io/en/latest/",
     packages=setuptools.find_packages(exclude=['examples']),
     package_data={
-        'createc': ['*.yaml'],        
+        'createc': ['*.yaml', '*.json'],
     },
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -23,5 +23,5 @@ setuptools.setup(
         "Topic :: System :: Hardware :: Hardware Drivers",
         "Topic :: Scientific/Engineering :: Physics",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )
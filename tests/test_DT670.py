@@ -0,0 +1,44 @@
+import numpy as np
+
+
+def volt2kelvin_reference(volt):
+    # the former scalar implementation, with cos(I * arccos(X))
+    from createc.utils import DT670
+    if volt < 0.090681 or volt > 1.65:
+        return 0
+    elif volt >= 1.334990:
+        return DT670._Chebychev(volt, DT670.para1)
+    elif volt >= 1.1226855:
+        return DT670._Chebychev(volt, DT670.para2)
+    elif volt >= 0.986974:
+        return DT670._Chebychev(volt, DT670.para3)
+    else:
+        return DT670._Chebychev(volt, DT670.para4)
+
+
+def test_Volt2Kelvin():
+    """
+    To test the DT670 diode conversion against the former scalar implementation
+    """
+    from createc.utils import DT670
+    volts = np.concatenate([np.random.default_rng(0).uniform(0.05, 1.7, 5000),
+                            [0.090681, 0.986974, 1.1226855, 1.334990, 1.65, 0.09, 1.66]])
+    reference = np.array([volt2kelvin_reference(v) for v in volts])
+    assert np.allclose([DT670.Volt2Kelvin(v) for v in volts], reference, rtol=0, atol=1e-9)
+    assert np.allclose(DT670.Volt2Kelvin(volts), reference, rtol=0, atol=1e-9)
+    assert DT670.Volt2Kelvin(volts.reshape(-1, 3)).shape == (1669, 3)
+    assert DT670.Volt2Kelvin(1.7) == 0 and np.isnan(DT670.Volt2Kelvin(np.array([np.nan])))[0]
+
+
+def test_Volt2Kelvin_LUT():
+    """
+    To test the lookup table of the DT670 conversion
+    """
+    from createc.utils import DT670
+    volts = np.random.default_rng(1).uniform(0.05, 1.7, 20000)
+    exact = DT670.Volt2Kelvin(volts)
+    error = np.abs(DT670.Volt2Kelvin_LUT(volts) - exact)
+    near_edge = np.min(np.abs(volts[:, np.newaxis] - DT670._edges), axis=1) < 1e-4
+    assert error[~near_edge].max() < 1e-4 and error.max() < 1e-2
+    assert np.allclose([DT670.Volt2Kelvin_LUT(v) for v in volts[:100]], DT670.Volt2Kelvin_LUT(volts[:100]))
+    assert DT670.Volt2Kelvin_LUT(1.65) == DT670.Volt2Kelvin(1.65) and DT670.Volt2Kelvin_LUT(0.05) == 0
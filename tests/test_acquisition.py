@@ -0,0 +1,50 @@
+import time
+from functools import partial
+
+import numpy as np
+
+
+def test_RING_BUFFER():
+    """
+    To test the ring buffer of timestamped samples
+    """
+    from createc.utils.acquisition import RING_BUFFER
+    buffer = RING_BUFFER(5)
+    buffer.append([0, 1, 2], [10, 11, 12])
+    times, values, cursor = buffer.read()
+    assert list(values) == [10, 11, 12] and cursor == 3
+
+    buffer.append(np.arange(3, 10), np.arange(13, 20))
+    times, values, cursor = buffer.read(cursor)
+    # only the last 5 are kept
+    assert list(times) == [5, 6, 7, 8, 9] and cursor == 10
+    assert len(buffer.read(cursor)[0]) == 0
+    assert buffer.latest() == (9, 19)
+    assert len(buffer) == 5
+
+
+def test_ACQUISITION_THREAD():
+    """
+    To test the acquisition thread on the simulator
+    """
+    import createc.utils.data_producer as dp
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.acquisition import ACQUISITION_THREAD
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR())
+    pairs = [(1, 0), (1, 1), (2, 0)]
+    batches = []
+    acquisition = ACQUISITION_THREAD([partial(dp.createc_adc_batch, stm=stm, pairs=pairs), partial(dp.createc_fbz, stm)],
+                                     n_channels=4, capacity=1000, period=0.01, callback=batches.append)
+    start = time.monotonic()
+    acquisition.start()
+    time.sleep(0.2)
+    acquisition.stop()
+    elapsed = time.monotonic() - start
+    assert acquisition.errors == 0
+    times, values, cursor = acquisition.buffers[3].read()
+    assert 0 < cursor <= elapsed / 0.01 + 1
+    # the calls keep to the schedule, a late call is followed by an early one
+    assert np.all(times - times[0] >= np.arange(cursor) * 0.01 - 5e-3)
+    assert len(batches[0]) == 2
+    assert acquisition.buffers[0].count == cursor
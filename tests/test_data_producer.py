@@ -0,0 +1,39 @@
+import datetime
+
+import numpy as np
+
+
+def test_createc_adc_batch():
+    """
+    To test reading batches of ADC channels on the simulator
+    """
+    import createc.utils.data_producer as dp
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR(seed=0))
+    pairs = [(board, channel) for board in (1, 2) for channel in range(6)]
+    batch = dp.createc_adc_batch(stm, pairs, samples=5, period=0.01)
+    assert batch.data.shape == (5, 12)
+    assert np.all(np.abs(batch.data) < 1.1)
+    # the passes keep to the schedule, a late pass is followed by an early one
+    assert np.all(batch.timestamps - batch.timestamps[0] >= np.arange(5) * 0.01 - 5e-3)
+
+    stamps = dp.monotonic_to_datetime(batch.timestamps).astype(datetime.datetime)
+    assert abs((stamps[-1] - datetime.datetime.now()).total_seconds()) < 1
+
+
+def test_createc_adc_batch_kelvin():
+    """
+    To test the conversion of ADC batches to kelvin
+    """
+    import createc.utils.data_producer as dp
+    from createc.utils import DT670
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR(seed=0))
+    pairs = [(1, 0), (1, 1)]
+    volts = dp.createc_adc_batch(stm, pairs, samples=3).data
+    stm = CreatecWin32(backend=STM_SIMULATOR(seed=0))
+    kelvins = dp.createc_adc_batch(stm, pairs, samples=3, kelvin=True, lut=True).data
+    assert kelvins.shape == (3, 2)
+    assert np.allclose(kelvins, DT670.Volt2Kelvin(volts), atol=1e-2)
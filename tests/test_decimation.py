@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def test_window():
+    """
+    To test selecting the part of a trace within a range
+    """
+    from createc.utils.decimation import window
+    x = np.arange(10.)
+    xs, ys = window(x, x * 2, 2.5, 6)
+    assert list(xs) == [3, 4, 5, 6] and list(ys) == [6, 8, 10, 12]
+    assert len(window(x, x)[0]) == 10
+
+
+def test_minmax_decimate():
+    """
+    To test the min-max decimation, which keeps the spikes
+    """
+    from createc.utils.decimation import minmax_decimate
+    rng = np.random.default_rng(0)
+    x = np.arange(100003.)
+    y = rng.normal(size=len(x))
+    y[54321] = 100  # a spike
+    y[777] = np.nan
+    xs, ys = minmax_decimate(x, y, 2000)
+    assert len(xs) <= 2000
+    assert np.all(np.diff(xs) >= 0)
+    assert ys.max() == 100 and ys.min() == np.nanmin(y)
+    assert np.array_equal(ys, y[xs.astype(int)])
+    # short traces are not touched
+    assert len(minmax_decimate(x[:100], y[:100], 2000)[0]) == 100
+
+
+def test_lttb():
+    """
+    To test the Largest-Triangle-Three-Buckets decimation
+    """
+    from createc.utils.decimation import lttb
+    x = np.linspace(0, 10, 50000)
+    y = np.sin(x)
+    y[20000] = 5
+    xs, ys = lttb(x, y, 500)
+    assert len(xs) == 500
+    assert xs[0] == x[0] and xs[-1] == x[-1]
+    assert np.all(np.diff(xs) > 0)
+    assert ys.max() == 5
+    # the shape is kept away from the spike
+    error = np.abs(np.interp(x, xs, ys) - y)
+    assert np.delete(error, np.s_[19900:20100]).max() < 1e-3
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+
+def fourier_shift(img, shift):
+    fy, fx = np.meshgrid(np.fft.fftfreq(img.shape[0]), np.fft.fftfreq(img.shape[1]), indexing='ij')
+    return np.fft.ifft2(np.fft.fft2(img) * np.exp(-2j * np.pi * (fy * shift[0] + fx * shift[1]))).real
+
+
+def test_shift_and_velocity():
+    """
+    To test the sub-pixel shifts and the drift velocity of DRIFT_TRACKER
+    """
+    from createc.utils.drift import DRIFT_TRACKER
+    rng = np.random.default_rng(0)
+    # smooth random features, periodic so that the shifted images are exact
+    smoothing = np.exp(-0.5 * np.add.outer(np.fft.fftfreq(96) ** 2, np.fft.fftfreq(128) ** 2) / 0.05 ** 2)
+    template = np.fft.ifft2(np.fft.fft2(rng.normal(size=(96, 128))) * smoothing).real
+    tracker = DRIFT_TRACKER(template, timestamp=100.0)
+    assert tracker.shift(fourier_shift(template, (2.3, -1.7))) == pytest.approx([2.3, -1.7], abs=0.1)
+    assert tracker.predict(110.0) == pytest.approx([0, 0])
+
+    # a steady drift of (0.3, -0.2) px/s, corrected after the second image
+    for t in (110.0, 120.0):
+        tracker.register(fourier_shift(template, (0.3 * (t - 100), -0.2 * (t - 100))), t)
+    assert tracker.velocity == pytest.approx([0.3, -0.2], abs=0.02)
+    correction = tracker.predict(125.0)
+    assert correction == pytest.approx([7.5, -5.0], abs=0.3)
+    tracker.corrected(correction)
+    # the images are then only shifted by the drift since the correction
+    shift = tracker.register(fourier_shift(template, (0.3 * 30 - correction[0], -0.2 * 30 - correction[1])), 130.0)
+    assert shift == pytest.approx([9 - correction[0], -6 - correction[1]], abs=0.1)
+    assert tracker.velocity == pytest.approx([0.3, -0.2], abs=0.02)
+    assert tracker.predict(130.0) == pytest.approx(shift, abs=0.2)
+
+
+def test_simulator_tracking():
+    """
+    To test tracking and compensating the drift on the simulator
+    """
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.drift import DRIFT_TRACKER
+    from createc.utils.misc import XY2D
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    sim = STM_SIMULATOR(time_scale=1e-3, seed=0)
+    stm = CreatecWin32(backend=sim)
+    stm.scanstart()
+    tracker = DRIFT_TRACKER(sim._image(), upsample_factor=20)
+    # the measured shift is the offset move which puts the scan back onto the template
+    for dx, dy in [(2, 0), (0, 1), (2.5, -1.3)]:
+        stm.setxyoffpixel(dx=dx, dy=dy)
+        stm.scanstart()
+        assert tracker.shift(sim._image()) == pytest.approx([-dy, -dx], abs=0.1)
+        stm.setxyoffpixel(dx=-dx, dy=-dy)
+
+    # a drift of about 2 px per 0.1 s, compensated from the predicted correction
+    drift = XY2D(x=0.004, y=-0.002)
+    sim = STM_SIMULATOR(time_scale=1e-3, seed=0, drift=drift)
+    stm = CreatecWin32(backend=sim)
+    pixel = stm.nom_size.x / int(sim.getparam('Num.X'))
+    stm.scanstart()
+    t0 = sim._scan_start
+    tracker = DRIFT_TRACKER(sim._image(), timestamp=t0)
+    for _ in range(3):
+        time.sleep(0.05)
+        stm.scanstart()
+        shift = tracker.register(sim._image(), sim._scan_start)
+        expected = np.array([drift.y, drift.x]) * (sim._scan_start - t0) / sim.time_scale / pixel
+        assert shift == pytest.approx(expected - tracker.correction, abs=0.2)
+        correction = tracker.predict(time.monotonic())
+        stm.setxyoffpixel(dx=correction[1], dy=correction[0])
+        tracker.corrected(correction)
+    assert tracker.velocity == pytest.approx(np.array([drift.y, drift.x]) / sim.time_scale / pixel, rel=0.1)
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def level_correction_reference(img):
+    # the former implementation, with the design matrix and pinv
+    m, n = img.shape
+    X1, X2 = np.mgrid[:m, :n]
+    X = np.hstack((np.ones((m * n, 1)), np.reshape(X1, (m * n, 1)), np.reshape(X2, (m * n, 1))))
+    theta = np.dot(np.dot(np.linalg.pinv(np.dot(X.transpose(), X)), X.transpose()), np.reshape(img, (m * n, 1)))
+    return img - np.reshape(np.dot(X, theta), (m, n))
+
+
+def test_level_correction():
+    """
+    To test level_correction against the former implementation
+    """
+    from createc.utils.image_utils import level_correction
+    rng = np.random.default_rng(0)
+    imgs = rng.normal(size=(3, 40, 64)) + np.mgrid[:40, :64][1] * 0.3 - np.mgrid[:40, :64][0] * 0.1 + 5
+    for img in imgs:
+        assert np.allclose(level_correction(img), level_correction_reference(img))
+    assert np.allclose(level_correction(imgs), [level_correction_reference(img) for img in imgs])
+
+    # a quadratic background is removed completely by order 2 only
+    u, v = np.mgrid[:30, :50]
+    bowl = 1e-3 * (u - 12) ** 2 + 2e-3 * (v - 30) ** 2 + 1e-3 * u * v
+    assert np.abs(level_correction(bowl, order=2)).max() < 1e-9
+    assert np.abs(level_correction(bowl)).max() > 0.1
+
+
+def test_level_correction_mask():
+    """
+    To test level_correction with the pixels of a mask left out of the fit
+    """
+    from createc.utils.image_utils import level_correction
+    u, v = np.mgrid[:32, :32]
+    plane = 0.5 * u - 0.2 * v + 3
+    img = plane.copy()
+    img[10:14, 10:14] += 100  # an adsorbate
+    mask = img - plane > 50
+    result = level_correction(img, mask=mask)
+    assert np.abs(result[~mask]).max() < 1e-9 and np.allclose(result[mask], 100)
+    assert np.abs(level_correction(img)[~mask]).max() > 1
+    # one mask for a stack, and per image masks
+    assert np.allclose(level_correction(np.stack([img, img]), mask=mask), [result, result])
+    assert np.allclose(level_correction(np.stack([img, plane]), mask=np.stack([mask, mask & False]))[1], 0)
+
+
+def test_level_correction_rows():
+    """
+    To test level_correction of every scan line on its own
+    """
+    from createc.utils.image_utils import level_correction
+    rng = np.random.default_rng(1)
+    offsets = rng.normal(size=(20, 1)) * 10  # a jump of z between scan lines
+    slopes = rng.normal(size=(20, 1))
+    img = offsets + slopes * np.arange(30)
+    assert np.abs(level_correction(img, rows=True)).max() < 1e-9
+    assert np.abs(level_correction(img)).max() > 1
+    img[:, 5] += 50
+    mask = np.zeros(img.shape, dtype=bool)
+    mask[:, 5] = True
+    assert np.abs(level_correction(img, rows=True, mask=mask)[~mask]).max() < 1e-9
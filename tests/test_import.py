@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+
+def _modules_after(statement):
+    code = f'import sys; {statement}; print(" ".join(sys.modules))'
+    return set(subprocess.check_output([sys.executable, '-c', code], text=True).split())
+
+
+def test_import_lazy():
+    """
+    To test that importing createc does not import the heavy dependencies until they are used
+    """
+    modules = _modules_after('import createc')
+    assert not {'numpy', 'pandas', 'yaml', 'createc.Createc_pyFile'} & modules
+
+    modules = _modules_after('import createc; createc.DAT_IMG')
+    assert 'createc.Createc_pyFile' in modules
+    assert not {'pandas', 'yaml'} & modules
+
+
+def test_load_global_const(tmp_path):
+    """
+    To test loading the global constants through their json copy
+    """
+    import json
+    import shutil
+    import yaml
+    from createc.utils.misc import load_global_const, write_global_const_json, _read_global_const, _cgc_file
+    with open(_cgc_file, 'rt') as f:
+        cgc = yaml.safe_load(f)
+    assert load_global_const() == cgc
+    # every module gets its own copy
+    load_global_const()['g_file_data_bin_offset'] = None
+    assert load_global_const() == cgc
+
+    # the shipped json is up to date
+    with open(os.path.splitext(_cgc_file)[0] + '.json', 'rt') as f:
+        assert json.load(f)['cgc'] == cgc
+
+    # a stale or half-written json falls back to the yaml, without writing anything at import
+    yaml_file = str(tmp_path / 'Createc_global_const.yaml')
+    shutil.copy(_cgc_file, yaml_file)
+    with open(tmp_path / 'Createc_global_const.json', 'wt') as f:
+        f.write('{"yaml_sha1": "')
+    assert _read_global_const(yaml_file) == cgc
+    assert sorted(os.listdir(tmp_path)) == ['Createc_global_const.json', 'Createc_global_const.yaml']
+    with open(tmp_path / 'Createc_global_const.json', 'rt') as f:
+        assert f.read() == '{"yaml_sha1": "'
+
+    # until it is regenerated
+    assert write_global_const_json(yaml_file) == str(tmp_path / 'Createc_global_const.json')
+    with open(tmp_path / 'Createc_global_const.json', 'rt') as f:
+        assert json.load(f)['cgc'] == cgc
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+
+def test_LATENCY_HISTOGRAM():
+    """
+    To test the percentiles of the latency histogram
+    """
+    from createc.utils.instrumentation import LATENCY_HISTOGRAM
+    histogram = LATENCY_HISTOGRAM()
+    for ms in range(1, 101):
+        histogram.add(ms * 1e-3)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['mean_ms'] == pytest.approx(50.5)
+    assert summary['p50_ms'] == pytest.approx(50, rel=0.13)
+    assert summary['p99_ms'] == pytest.approx(99, rel=0.13)
+    assert summary['max_ms'] == pytest.approx(100)
+
+
+def test_instrument(tmp_path):
+    """
+    To test the instrumentation of the remote calls of CreatecWin32
+    """
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    backend = STM_SIMULATOR(latency=2e-3)
+    stm = CreatecWin32(backend=backend)
+    assert stm.stats() == {}
+
+    log_file = str(tmp_path / 'stats.jsonl')
+    stm.instrument(log_file=log_file, interval=0.05)
+    with stm.snapshot():
+        stm.offset, stm.offset
+    stm.setparam('Rotation', 10)
+    stm.scanstatus
+    with pytest.raises(TypeError):
+        stm.setxyoffpixel(1, 2, 3)
+    stats = stm.stats()
+    assert stats['getparam']['count'] == 4
+    assert stats['getparam']['p50_ms'] >= 2
+    assert stats['setparam']['count'] == 1
+    assert stats['scanstatus']['count'] == 1
+    assert stats['setxyoffpixel']['errors'] == 1
+
+    stm.instrument(False)
+    assert stm.client is backend
+    assert stm.stats() == {}
+    with open(log_file) as f:
+        records = [json.loads(line) for line in f]
+    assert records[-1]['stats']['getparam']['count'] == 4
@@ -0,0 +1,95 @@
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+
+class PTY_PORT:
+    """
+    The subset of serial.Serial used by SERIAL_POLLER, on the slave side of a pseudo-terminal
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.timeout = None
+
+    def write(self, data):
+        os.write(self.fd, data)
+
+    def read_until(self, expected=b'\n'):
+        deadline = time.monotonic() + self.timeout
+        data = b''
+        while not data.endswith(expected):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                break
+            data += os.read(self.fd, 1)
+        return data
+
+    def reset_input_buffer(self):
+        while select.select([self.fd], [], [], 0.05)[0]:
+            os.read(self.fd, 1024)
+
+
+def gauge(fd, stop, answers):
+    """
+    A gauge controller on the master side, answering the requests in order and ignoring unknown ones
+    """
+    buffer = b''
+    while not stop.is_set():
+        if not select.select([fd], [], [], 0.05)[0]:
+            continue
+        buffer += os.read(fd, 1024)
+        while b'\r' in buffer:
+            request, buffer = buffer.split(b'\r', 1)
+            if request in answers:
+                time.sleep(0.002)
+                os.write(fd, answers[request])
+
+
+def test_SERIAL_POLLER():
+    """
+    To test polling a gauge controller on a pseudo-terminal
+    """
+    from createc.utils.instruments import GAUGE_QUERY, LATEST_VALUES, SERIAL_POLLER, parse_rpv, parse_ion
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    stop = threading.Event()
+    answers = {b'RPV1': b'0,1.5E-03\r', b'RPV3': b'0,2.0E+02\r', b'~ 05 0B 02 00': b'OK 00 ION 3.2E-10\r'}
+    device = threading.Thread(target=gauge, args=(master, stop, answers), daemon=True)
+    device.start()
+
+    latest = LATEST_VALUES(4, max_age=1)
+    queries = [GAUGE_QUERY(b'RPV1\r', parse_rpv), GAUGE_QUERY(b'RPV3\r', parse_rpv),
+               GAUGE_QUERY(b'~ 05 0B 02 00\r', parse_ion)]
+    poller = SERIAL_POLLER(PTY_PORT(slave), queries, latest, first_channel=1, period=0.01, pipeline=2,
+                           timeout=0.2)
+    try:
+        assert poller.poll()
+        times, values = latest.read()
+        assert np.isnan(values[0]) and values[1:].tolist() == [1.5e-3, 200, 3.2e-10]
+
+        # an unanswered query ends the pass, the answer to the next one is not taken for it
+        del answers[b'RPV3']
+        answers[b'RPV1'] = b'0,1.6E-03\r'
+        assert not poller.poll()
+        assert poller.timeouts + poller.errors == 1
+        assert latest.read()[1][1:].tolist() == [1.6e-3, 200, 3.2e-10]
+        answers[b'RPV3'] = b'0,2.1E+02\r'
+        errors = poller.errors
+
+        poller.start()
+        time.sleep(0.3)
+        assert latest()[1:] == (1.6e-3, 210, 3.2e-10)
+        assert poller.passes > 2 and poller.errors == errors, poller.last_error
+    finally:
+        poller.stop()
+        stop.set()
+        device.join()
+        os.close(master)
+        os.close(slave)
+    assert not poller.is_alive()
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+
+def test_ramps_concurrent():
+    """
+    To test that concurrent ramps do not block the event loop
+    """
+    from createc.Createc_pyAsync import AsyncCreatec
+    from createc.utils.stm_simulator import STM_SIMULATOR
+
+    async def main():
+        async with AsyncCreatec(backend=STM_SIMULATOR(latency=1e-3)) as stm:
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tick_task = asyncio.create_task(ticker())
+            start = time.monotonic()
+            await asyncio.gather(stm.ramp_bias_mV(-300), stm.ramp_current_pA(20))
+            elapsed = time.monotonic() - start
+            tick_task.cancel()
+            assert float(await stm.getparam('Biasvolt.[mV]')) == -300
+            assert float(await stm.get('current_pA')) == pytest.approx(20)
+            # the event loop kept running during the ramps
+            assert ticks > elapsed / 0.01 / 2
+
+    asyncio.run(main())
+
+
+def test_ramp_cancel():
+    """
+    To test cancelling a ramp
+    """
+    from createc.Createc_pyAsync import AsyncCreatec
+    from createc.utils.stm_simulator import STM_SIMULATOR
+
+    async def main():
+        async with AsyncCreatec(backend=STM_SIMULATOR()) as stm:
+            task = asyncio.create_task(stm.ramp_bias_mV(1000))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            bias = float(await stm.getparam('Biasvolt.[mV]'))
+            assert 100 < bias < 1000
+
+    asyncio.run(main())
+
+
+def test_wait_scan_finished():
+    """
+    To test waiting for a scan, and stopping it on cancel
+    """
+    from createc.Createc_pyAsync import AsyncCreatec
+    from createc.utils.stm_simulator import STM_SIMULATOR
+
+    async def main():
+        async with AsyncCreatec(backend=STM_SIMULATOR(time_scale=0.1)) as stm:
+            await stm.setparam('Num.X', 32)
+            await stm.setparam('Num.Y', 32)
+            # 0.41 s simulated, 41 ms real
+            waited = await stm.scan(rotation=10, poll_min=0.01)
+            assert waited > 0.04
+            assert not await stm.get('scanstatus')
+
+            await stm.call('scanstart')
+            task = asyncio.create_task(stm.wait_scan_finished(stop_on_cancel=True))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert not await stm.get('scanstatus')
+
+    asyncio.run(main())
+
+
+def test_ramp_param():
+    """
+    To test ramps of a given duration
+    """
+    from createc.Createc_pyAsync import AsyncCreatec
+    from createc.utils.stm_simulator import STM_SIMULATOR
+
+    async def main():
+        async with AsyncCreatec(backend=STM_SIMULATOR(latency=1e-3)) as stm:
+            start = time.monotonic()
+            await asyncio.gather(stm.ramp_param('Rotation', 45, duration=0.2),
+                                 stm.ramp_bias_mV(1000, duration=0.2))
+            assert time.monotonic() - start >= 0.2 - 1e-3
+            assert await stm.get('angle') == 45
+            assert float(await stm.getparam('Biasvolt.[mV]')) == 1000
+
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+
+class CountingClient:
+    """
+    A minimal stand-in for the remote object, counting the getparam calls
+    """
+    def __init__(self):
+        self.params = {'OffsetX': '100', 'OffsetY': '-50', 'XPiezoconst': '20', 'YPiezoconst': '20',
+                       'Length x[A]': '200', 'Length y[A]': '200', 'Rotation': '0'}
+        self.reads = 0
+
+    def getparam(self, key):
+        self.reads += 1
+        return self.params[key]
+
+    def setparam(self, key, value):
+        self.params[key] = str(value)
+
+    def setxyoffvolt(self, x, y):
+        self.params['OffsetX'], self.params['OffsetY'] = str(x), str(y)
+
+
+def _stm():
+    from createc.Createc_pyCOM import CreatecWin32
+    return CreatecWin32(backend=CountingClient())
+
+
+def test_snapshot():
+    """
+    To test that the parameters are read once within a snapshot, until a remote call may change them
+    """
+    stm = _stm()
+    stm.offset, stm.offset
+    assert stm.client.reads == 8
+
+    stm.client.reads = 0
+    with stm.snapshot():
+        offset = stm.offset
+        assert stm.offset == offset
+        assert stm.client.reads == 4
+        stm.setparam('OffsetX', 0)
+        assert stm.offset.x == 0
+        stm.setxyoffvolt(10, 10)
+        assert float(stm.getparam('OffsetY')) == 10
+    assert stm._param_cache is None
+
+
+def test_get_set_params():
+    """
+    To test reading and writing several parameters at once
+    """
+    stm = _stm()
+    stm.set_params({'Rotation': 30, 'Length x[A]': 100})
+    assert stm.get_params(['Rotation', 'Length x[A]', 'Rotation']) == {'Rotation': '30', 'Length x[A]': '100'}
+    assert stm.client.reads == 2
+
+
+def test_simulator_ramp():
+    """
+    To test the ramps and the scan configuration of CreatecWin32 on the simulator
+    """
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR())
+    assert stm.is_active()
+    stm.ramp_bias_mV(-150)
+    assert float(stm.bias_mV) == -150
+    stm.ramp_current_pA(50)
+    assert float(stm.current_pA) == pytest.approx(50)
+    stm.pre_scan_config(rotation=30, deltaX_dac=16, ch_zoff=1.5)
+    assert stm.angle == 30
+    assert float(stm.getparam('CHModeZoff')) == 1.5
+
+
+def test_simulator_scan(tmp_path):
+    """
+    To test a scan on the simulator, and reading the .dat file it saves
+    """
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.Createc_pyFile import DAT_IMG
+    from createc.utils.misc import XY2D
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR(time_scale=1e-3, data_dir=str(tmp_path), seed=0))
+    stm.setxyoffvolt(100 / stm.xPiezoConst, -50 / stm.yPiezoConst)
+    assert stm.offset == pytest.approx(XY2D(x=100, y=-50))
+    stm.setparam('Rotation', 15)
+
+    stm.scanstart()
+    assert stm.scanstatus
+    time.sleep(float(stm.getparam('Sec/Image:')))
+    while stm.scanstatus:
+        time.sleep(1e-3)
+    stm.filesave(stm.savedatfilename)
+
+    file = DAT_IMG(stm.savedatfilename)
+    assert len(file.imgs) == file.channels == 4
+    assert file.imgs[0].shape == (128, 128)
+    assert np.all(file.imgs[0] != 0)
+    assert file.offset == pytest.approx(stm.offset)
+    assert file.nom_size == pytest.approx(stm.nom_size)
+    assert file.rotation == 15
+
+
+def test_ramp_param_timed():
+    """
+    To test the ramps of a given duration or rate on the simulator
+    """
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    stm = CreatecWin32(backend=STM_SIMULATOR(latency=20e-3))
+    start = time.monotonic()
+    count = stm.ramp_param('Biasvolt.[mV]', 1000, duration=0.3, log=True)
+    assert time.monotonic() - start >= 0.3 - 20e-3
+    assert float(stm.bias_mV) == 1000
+    assert 1 < count <= 31
+
+    start = time.monotonic()
+    stm.ramp_param('Rotation', 30, rate=150)
+    assert time.monotonic() - start >= 0.2 - 20e-3
+    assert stm.angle == 30
+
+    stm.ramp_bias_mV(-10, rate=10)
+    assert float(stm.bias_mV) == -10
+    stm.ramp_param('Rotation', 0, duration=0)
+    assert stm.angle == 0
+
+
+def _run_setpoints(setpoints, now, call=0.0):
+    """
+    Run the setpoints on a fake clock, each call taking the given seconds
+    """
+    schedule = []
+    for deadline, value in setpoints:
+        now[0] = max(now[0], deadline) + call
+        schedule.append((deadline, value))
+    return schedule
+
+
+def test_timed_ramp_setpoints_schedule():
+    """
+    To test the deadlines of the setpoints for a given duration or rate
+    """
+    import pytest
+    from createc.Createc_pyCOM import timed_ramp_setpoints
+    now = [100.0]
+    schedule = _run_setpoints(timed_ramp_setpoints([(1, 1000)], duration=0.3, log=True, interval=0.01,
+                                                   clock=lambda: now[0]), now)
+    deadlines, values = zip(*schedule)
+    assert schedule[-1] == (pytest.approx(100.3), 1000)
+    assert len(schedule) == 30
+    assert np.all(np.diff(deadlines) == pytest.approx(0.01))
+    # logarithmic, one decade per 0.1 s
+    assert values[9] == pytest.approx(10, rel=1e-6)
+
+    now = [0.0]
+    schedule = _run_setpoints(timed_ramp_setpoints([(0, 30)], rate=150, interval=0.01, clock=lambda: now[0]), now)
+    assert schedule[-1] == (pytest.approx(0.2), 30)
+    assert schedule[0] == (pytest.approx(0.01), pytest.approx(1.5))
+
+    # the latency of the calls is compensated, the last value is still due at the end
+    now = [0.0]
+    schedule = _run_setpoints(timed_ramp_setpoints([(0, 1)], duration=1, interval=0.01, clock=lambda: now[0]),
+                              now, call=5e-3)
+    assert now[0] == pytest.approx(1, abs=1e-3)
+    assert schedule[1][1] == pytest.approx(0.02 + 5e-3 * 0.3, abs=1e-6)
+
+    # no time to ramp, the values are set at once
+    for duration, rate in [(0, None), (None, 0), (0, 0), (-1, None)]:
+        now = [5.0]
+        assert list(timed_ramp_setpoints([(0, 1), (1, 2)], duration=duration, rate=rate,
+                                         clock=lambda: now[0])) == [(5.0, 1), (5.0, 2)]
+
+
+def test_timed_ramp_setpoints_coalesce():
+    """
+    To test that the setpoints are dropped instead of sent late when the calls are slow
+    """
+    from createc.Createc_pyCOM import timed_ramp_setpoints
+    now = [0.0]
+    setpoints = timed_ramp_setpoints([(0, 1)], duration=1, interval=0.01, clock=lambda: now[0])
+    values = [value for _, value in _run_setpoints(setpoints, now, call=0.1)]
+    # each call takes 0.1 s, so only about one in ten ticks is sent
+    assert values[-1] == 1
+    assert len(values) <= 11
+    assert values == sorted(values)
+
+
+def test_scan_lines(tmp_path, monkeypatch):
+    """
+    To test streaming the scan lines while the simulator scans
+    """
+    import tempfile
+    from createc.Createc_pyCOM import CreatecWin32
+    from createc.utils.stm_simulator import STM_SIMULATOR
+    sim = STM_SIMULATOR(time_scale=0.05, data_dir=str(tmp_path), seed=0)
+    stm = CreatecWin32(backend=sim)
+    stops = []
+    for lines in stm.scan_lines(block=16, poll_min=0.01):
+        assert lines.start == (stops[-1] if stops else 0) and lines.stop > lines.start
+        assert lines.stop - lines.start >= 16 or lines.stop == 128
+        # the rows so far are complete while the scan is running, the rest not yet read
+        assert np.all(lines.imgs[:, :lines.stop] != 0) and np.all(lines.imgs[:, lines.stop:] == 0)
+        stops.append(lines.stop)
+    assert stops[-1] == 128 and len(stops) > 2
+    assert lines.imgs.shape == (4, 128, 128)
+    assert not stm.scanstatus
+    assert os.listdir(tmp_path) == []
+
+    # a stopped scan ends at once, with the rest of the buffer read then
+    stops = []
+    for lines in stm.scan_lines(block=16, poll_min=0.01):
+        stops.append(lines.stop)
+        if lines.stop < 128:
+            stm.scanstop()
+    assert stops[-1] == 128 and len(stops) == 2
+
+    # a backend with neither progress nor data access, the blocks are estimated from the time
+    # and read from a temporary .dat file
+    class BareBackend:
+        def __getattr__(self, name):
+            if name in ('scan_progress', 'scan_rows'):
+                raise AttributeError(name)
+            return getattr(sim, name)
+
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    stm = CreatecWin32(backend=BareBackend())
+    stops = []
+    for lines in stm.scan_lines(block=16, poll_min=0.01):
+        assert len(os.listdir(tmp_path)) == 1
+        stops.append(lines.stop)
+    assert stops[-1] == 128 and len(stops) > 2
+    assert np.all(lines.imgs != 0)
+    assert os.listdir(tmp_path) == []
+
+    # the scan is twice as slow as its 'Sec/Image:' tells, the rows read too early are read again
+    class SlowBackend(BareBackend):
+        def getparam(self, key):
+            value = sim.getparam(key)
+            return f'{float(value) / 2:.4f}' if key == 'Sec/Image:' else value
+
+    stm = CreatecWin32(backend=SlowBackend())
+    stops = []
+    for lines in stm.scan_lines(block=16, poll_min=0.01):
+        if lines.stop == 128:
+            assert not stm.scanstatus
+        stops.append(lines.stop)
+    assert stops[-1] == 128 and len(stops) > 2
+    assert np.all(lines.imgs != 0)
@@ -0,0 +1,59 @@
+import os
+
+this_dir = os.path.dirname(__file__)
+dat_files = ['A200619.213320.dat', 'A200621.161352.dat', 'A200622.081914.dat']
+
+
+def test_FILE_CATALOG(tmp_path):
+    """
+    To test the sqlite catalog of .dat files, its queries and refreshes
+    """
+    import datetime
+    import shutil
+    from createc.Createc_pyCatalog import FILE_CATALOG, footprint
+    from createc.Createc_pyFile import DAT_IMG
+
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for fn in dat_files:
+        shutil.copy(os.path.join(this_dir, fn), data_dir)
+    catalog_path = str(tmp_path / 'catalog.sqlite')
+    with FILE_CATALOG(catalog_path) as catalog:
+        assert catalog.refresh(str(data_dir)) == (3, 0)
+        assert catalog.refresh(str(data_dir)) == (0, 0)
+
+        file = DAT_IMG(os.path.join(this_dir, dat_files[1]), header_only=True)
+        center, _ = footprint(file)
+        assert [r.fn for r in catalog.query(point=center)] == dat_files[1:2]
+        assert [r.fn for r in catalog.query(point=(300, 100))] == [dat_files[0], dat_files[2]]
+        assert [r.fn for r in catalog.query(point=(1e5, 1e5))] == []
+        assert [r.fn for r in catalog.query(current=100)] == dat_files[1:]
+        assert [r.fn for r in catalog.query(start=datetime.datetime(2020, 6, 21),
+                                            end=datetime.datetime(2020, 6, 22))] == dat_files[1:2]
+
+        os.remove(data_dir / dat_files[0])
+        os.utime(data_dir / dat_files[1], ns=(0, 0))
+        assert catalog.refresh(str(data_dir)) == (1, 1)
+
+    with FILE_CATALOG(catalog_path) as catalog:
+        assert len(catalog) == 2
+        record, = catalog.query(bias=100, current=100, channels=4, bbox=(500, 600, -300, -250))
+        assert record.fn == dat_files[1]
+
+
+def test_footprint_rotation():
+    """
+    To test the footprint of a rotated image
+    """
+    import pytest
+    from createc.Createc_pyCatalog import footprint
+    from createc.Createc_pyFile import DAT_IMG
+    from createc.utils.misc import XY2D, point_rot2D_y_inv
+
+    file = DAT_IMG(os.path.join(this_dir, dat_files[2]), header_only=True)
+    file.rotation = 30.0
+    center, (x_min, x_max, y_min, y_max) = footprint(file)
+    corners = [point_rot2D_y_inv(XY2D(x=center.x + sx * file.nom_size.x / 2, y=center.y + sy * file.nom_size.y / 2),
+                                 center, 30 * 3.141592653589793 / 180) for sx in (-1, 1) for sy in (-1, 1)]
+    assert min(c.x for c in corners) == pytest.approx(x_min)
+    assert max(c.y for c in corners) == pytest.approx(y_max)
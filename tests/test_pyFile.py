@@ -17,6 +17,71 @@ def test_DAT_IMG():
             np.testing.assert_allclose(img, npy_img)
 
 
+def test_meta():
+    """
+    To test the meta data parsing against a plain line-by-line parsing of the meta binary
+    """
+    from createc.Createc_pyFile import DAT_IMG
+    for fn in ['A200619.213320.dat', 'A200621.161352.dat', 'A200622.081914.dat']:
+        file = DAT_IMG(os.path.join(this_dir, fn), header_only=True)
+        meta_binary = file._meta_binary[:file._meta_binary.find(b'\x00')]
+        meta_list = meta_binary.decode('cp1252', errors='ignore').split('\n')
+        meta = {'file_version': meta_list[0]}
+        for line in meta_list:
+            temp = line.split('=')
+            if len(temp) == 2:
+                for kw in temp[0].split(' / '):
+                    meta[kw.strip().lower()] = temp[1][:-1]
+        assert file.meta == meta
+        assert file.xPixel == int(meta['num.x'])
+        assert file.bias == float(meta['biasvoltage'])
+
+
+def test_DAT_IMG_header_only():
+    """
+    To test the header_only mode of DAT_IMG
+    """
+    from createc.Createc_pyFile import DAT_IMG
+    file = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'))
+    lazy = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'), header_only=True)
+    assert lazy.meta == file.meta
+    assert lazy._data_binary is None
+    assert lazy._img_array_list is None
+    assert lazy.img_pixels == file.img_pixels
+    for img, lazy_img in zip(file.imgs, lazy.imgs):
+        np.testing.assert_array_equal(img, lazy_img)
+
+
+def test_DAT_IMG_mmap(tmp_path):
+    """
+    To test the mmap mode of DAT_IMG, for both compressed and uncompressed files
+    """
+    import zlib
+    from createc.Createc_pyFile import DAT_IMG
+    src = os.path.join(this_dir, 'A200622.081914.dat')
+    with open(src, 'rb') as f:
+        meta_binary = f.read(16384)
+        data_binary = f.read()
+    uncompressed = tmp_path / 'A200622.081914.dat'
+    uncompressed.write_bytes(meta_binary + zlib.decompress(data_binary))
+
+    file = DAT_IMG(src)
+    for fp in [src, str(uncompressed)]:
+        mapped = DAT_IMG(fp, mmap=True)
+        assert mapped.img_pixels == file.img_pixels
+        for img, mapped_img in zip(file.imgs, mapped.imgs):
+            np.testing.assert_array_equal(img, mapped_img)
+    assert isinstance(mapped.img_array_list[0].base, np.memmap)
+
+    # uncompressed data which happen to start like a zlib stream
+    size = len(zlib.decompress(data_binary))
+    lookalike = zlib.compress(np.random.default_rng(0).bytes(4096))[:2048]
+    lookalike = lookalike + bytes(size - len(lookalike))
+    uncompressed.write_bytes(meta_binary + lookalike)
+    mapped = DAT_IMG(str(uncompressed), mmap=True)
+    np.testing.assert_array_equal(np.concatenate(mapped.img_array_list).tobytes(), lookalike[4:size])
+
+
 def test_VERT_SPEC():
     """
     To test the class VERT_SPEC
@@ -34,6 +99,145 @@ def test_VERT_SPEC():
     assert_frame_equal(readin, file.spec)
 
 
+def test_VERT_SPEC_read_spec():
+    """
+    To test the spec table parsing with the C engine against the python engine of pandas.read_csv
+    """
+    from createc.Createc_pyFile import VERT_SPEC
+    import io
+    import warnings
+    import pandas as pd
+    from pandas._testing import assert_frame_equal
+
+    for fn in ['A190824.135614.VERT', 'A201222.074639.VERT', 'A201222.074849.VERT', 'A201222.075325.VERT']:
+        file = VERT_SPEC(os.path.join(this_dir, fn))
+        spec_body = file._data_binary.split(b'\n', maxsplit=2)[2]
+        readin = pd.read_csv(io.BytesIO(spec_body), sep='\t', header=None, names=file.spec_headers,
+                             index_col=['idx'], engine='python', usecols=range(len(file.spec_headers)))
+        assert_frame_equal(readin, file.spec)
+        # a ragged table
+        assert_frame_equal(readin.iloc[:-1], file._read_spec(spec_body[:spec_body.rindex(b'\t', 0, -3)]).iloc[:-1])
+
+    # integer columns are int64 and words are kept, without any warning
+    rows = [[i, 3 * i] + [0.5 * i] * (len(file.spec_headers) - 2) for i in range(5)]
+    for cell in ['-7', 'abc']:
+        rows[2][1] = cell
+        spec_body = ''.join('\t'.join(map(str, row)) + '\t\r\n' for row in rows).encode()
+        readin = pd.read_csv(io.BytesIO(spec_body), sep='\t', header=None, names=file.spec_headers,
+                             index_col=['idx'], usecols=range(len(file.spec_headers)))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            assert_frame_equal(readin, file._read_spec(spec_body))
+
+
+def test_GRID_SPEC(tmp_path):
+    """
+    To test the class GRID_SPEC, in normal and mmap mode, with a small synthetic grid
+    """
+    from createc.Createc_pyFile import GRID_SPEC
+    header = np.zeros(256, dtype=np.uint32)
+    header[1:3] = 6, 4  # nx, ny
+    header[7] = 5  # vertpoints
+    header[25:27] = 1, 1  # specgriddx, specgriddy
+    specvz = np.arange(15, dtype=np.float32)
+    specdata = np.random.rand(6, 4, 5, 3).astype(np.float32)
+    fp = str(tmp_path / 'A211021.201245.specgrid')
+    with open(fp, 'wb') as f:
+        f.write(header.tobytes() + specvz.tobytes() + specdata.tobytes())
+
+    file = GRID_SPEC(fp)
+    np.testing.assert_array_equal(file.specdata, specdata)
+    np.testing.assert_array_equal(file.cube_array, specdata[:, :, :, 1].T)
+    mapped = GRID_SPEC(fp, mmap=True)
+    assert isinstance(mapped.specdata, np.memmap)
+    np.testing.assert_array_equal(mapped.cube_array, file.cube_array)
+    np.testing.assert_array_equal(mapped.pixel(2, 3), specdata[2, 3])
+    blocks = list(mapped.iter_blocks(rows=4, channel=1))
+    assert [block for block, _ in blocks] == [slice(0, 4), slice(4, 6)]
+    np.testing.assert_array_equal(np.concatenate([arr for _, arr in blocks]), specdata[:, :, :, 1])
+
+    from createc.Createc_pyFile import load_many
+    loaded, = load_many([fp], workers=2, kind='grid', mmap=True)
+    assert isinstance(loaded.specdata, np.memmap)
+    np.testing.assert_array_equal(loaded.cube_array, file.cube_array)
+    np.testing.assert_array_equal(loaded.specvz3, specvz.reshape(5, 3))
+
+
+def test_load_many():
+    """
+    To test loading files in parallel with load_many
+    """
+    from createc.Createc_pyFile import DAT_IMG, VERT_SPEC, load_many
+    from pandas._testing import assert_frame_equal
+
+    fps = [os.path.join(this_dir, fn) for fn in ['A200619.213320.dat', 'A200621.161352.dat', 'A200622.081914.dat']]
+    files = load_many(fps, workers=2)
+    assert [file.fn for file in files] == [os.path.basename(fp) for fp in fps]
+    for fp, file in zip(fps, files):
+        ref = DAT_IMG(fp)
+        assert file.meta == ref.meta
+        assert file.img_pixels == ref.img_pixels
+        for img, ref_img in zip(file.imgs, ref.imgs):
+            np.testing.assert_array_equal(img, ref_img)
+
+    assert sorted(fp for fp, _ in load_many(fps, workers=2, as_completed=True, header_only=True)) == sorted(fps)
+    # header-only and memory-mapped images are not decoded in the workers, but lazily here
+    for mode in [dict(header_only=True), dict(mmap=True)]:
+        files = load_many(fps, workers=2, **mode)
+        assert all(file._img_array_list is None for file in files)
+        np.testing.assert_array_equal(files[-1].imgs[0], DAT_IMG(fps[-1]).imgs[0])
+
+    fps = [os.path.join(this_dir, fn) for fn in ['A190824.135614.VERT', 'A201222.074849.VERT']]
+    for fp, file in zip(fps, load_many(fps, workers=2, kind='vert')):
+        assert_frame_equal(VERT_SPEC(fp).spec, file.spec)
+
+    # if a file fails, the shared memory of the others is freed
+    if os.path.isdir('/dev/shm'):
+        import time
+        import pytest
+        before = set(os.listdir('/dev/shm'))
+        with pytest.raises(FileNotFoundError):
+            load_many(fps + [os.path.join(this_dir, 'missing.VERT')] + fps, workers=2, kind='vert')
+        # blocks of other processes come and go, a leaked one stays
+        leaked = set(os.listdir('/dev/shm')) - before
+        time.sleep(0.5)
+        assert not leaked & set(os.listdir('/dev/shm'))
+
+
+def test_PARSE_CACHE(tmp_path):
+    """
+    To test the on-disk cache of parsed files
+    """
+    import shutil
+    from createc.Createc_pyFile import DAT_IMG, VERT_SPEC, PARSE_CACHE
+    from pandas._testing import assert_frame_equal
+
+    cache = PARSE_CACHE(str(tmp_path / 'cache'))
+    fp = str(tmp_path / 'A200622.081914.dat')
+    shutil.copy(os.path.join(this_dir, 'A200622.081914.dat'), fp)
+    ref = DAT_IMG(fp)
+    file = DAT_IMG(fp, cache=cache)
+    assert len(os.listdir(cache.cache_dir)) == 1
+    cached = DAT_IMG(fp, cache=cache)
+    assert cached._meta_binary is None
+    assert cached.meta == ref.meta
+    for img, cached_img in zip(ref.imgs, cached.imgs):
+        np.testing.assert_array_equal(img, cached_img)
+
+    # a modified file is not taken from the cache
+    os.utime(fp, ns=(0, 0))
+    assert DAT_IMG(fp, cache=cache)._meta_binary is not None
+
+    fp = os.path.join(this_dir, 'A201222.074849.VERT')
+    VERT_SPEC(fp, cache=cache)
+    cached = VERT_SPEC(fp, cache=cache)
+    assert cached._meta_binary is None
+    assert_frame_equal(VERT_SPEC(fp).spec, cached.spec)
+
+    cache.evict(max_bytes=0)
+    assert os.listdir(cache.cache_dir) == []
+
+
 """
     with open('A200622.081914.npy', 'wb') as f:
         for img in file.imgs:
@@ -41,3 +245,55 @@ def test_VERT_SPEC():
 """
 
 # test_DAT_IMG()
+
+
+def test_affine():
+    """
+    To test the coordinate frames of GENERIC_FILE against the geometry of the map applet
+    """
+    from createc.Createc_pyFile import DAT_IMG
+    from createc.utils.misc import XY2D, point_rot2D_y_inv, points_rot2D_y_inv
+    file = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'), header_only=True)
+    file.rotation = 30.0
+    file.scan_ymode = 0
+    assert np.allclose(file.transform([float(file.meta['scanrotoffx']), float(file.meta['scanrotoffy'])],
+                                      'dac', 'angstrom'), file.offset)
+    # the center of the image, as the anchor of the map applet
+    anchor = point_rot2D_y_inv(XY2D(x=file.offset.x, y=file.offset.y + file.nom_size.y / 2), file.offset,
+                               np.deg2rad(file.rotation))
+    assert np.allclose(file.transform([file.xPixel / 2, file.yPixel / 2]), anchor)
+
+    pixels = np.random.default_rng(0).uniform(0, file.xPixel, (1000, 2))
+    angstrom = file.transform(pixels)
+    assert np.allclose(file.transform(angstrom, 'angstrom', 'pixel'), pixels)
+    assert np.allclose(file.transform(file.transform(pixels, 'pixel', 'dac'), 'dac', 'angstrom'), angstrom)
+    # rotating back around the anchor gives an upright image of the nominal size
+    upright = points_rot2D_y_inv(angstrom, anchor, -np.deg2rad(file.rotation))
+    assert np.allclose(upright - anchor, (pixels - [file.xPixel / 2, file.yPixel / 2]) *
+                       [file.nom_size.x / file.xPixel, file.nom_size.y / file.yPixel])
+    # per point angles
+    radians = np.linspace(0, np.pi, len(pixels))
+    expected = [point_rot2D_y_inv(XY2D(*p), XY2D(0, 0), r) for p, r in zip(pixels, radians)]
+    assert np.allclose(points_rot2D_y_inv(pixels, (0, 0), radians), expected)
+
+
+def test_affine_header_only():
+    """
+    To test that only the pixel frame of a scan in ScanYMode 2 needs the images
+    """
+    from createc.Createc_pyFile import DAT_IMG
+    file = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'), header_only=True)
+    assert file.scan_ymode == 2
+    dac = [float(file.meta['scanrotoffx']), float(file.meta['scanrotoffy'])]
+    assert np.allclose(file.transform(file.transform(dac, 'dac', 'angstrom'), 'angstrom', 'dac'), dac)
+    assert np.allclose(file.affine('pixel', 'pixel'), np.eye(3))
+    assert file._img_array_list is None
+
+    # the scan ends at the nominal frame, so it starts as many lines later as are missing
+    full = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'))
+    assert full.img_pixels.y < full.yPixel
+    assert np.allclose(full.transform([0, 0], 'pixel', 'angstrom') - full.transform([0, 0], 'dac', 'angstrom'),
+                       file.transform([0, 0], 'pixel', 'angstrom') - file.transform([0, 0], 'dac', 'angstrom'))
+    first = full.transform([0, 0], 'pixel', 'angstrom')
+    full.scan_ymode = 0
+    assert np.allclose(first, full.transform([0, full.yPixel - full.img_pixels.y], 'pixel', 'angstrom'))
@@ -0,0 +1,81 @@
+import numpy as np
+import os
+import pytest
+
+this_dir = os.path.dirname(__file__)
+
+
+def test_FILE_STORE(tmp_path):
+    """
+    To test the round trip of files through FILE_STORE
+    """
+    pytest.importorskip('h5py')
+    from createc.Createc_pyFile import DAT_IMG, VERT_SPEC, GRID_SPEC
+    from createc.Createc_pyStore import FILE_STORE, export_store, load_store
+    from pandas._testing import assert_frame_equal
+
+    header = np.zeros(256, dtype=np.uint32)
+    header[1:3] = 6, 4  # nx, ny
+    header[7] = 5  # vertpoints
+    header[25:27] = 1, 1  # specgriddx, specgriddy
+    grid_fp = str(tmp_path / 'A211021.201245.specgrid')
+    with open(grid_fp, 'wb') as f:
+        f.write(header.tobytes() + np.random.rand(15 + 6 * 4 * 5 * 3).astype(np.float32).tobytes())
+
+    store_path = str(tmp_path / 'store.h5')
+    names = export_store(this_dir, store_path)
+    assert 'A200622.081914.dat' in names and 'A201222.074849.VERT' in names
+    names = export_store([grid_fp], store_path)
+    assert names == ['A211021.201245.specgrid']
+
+    file = DAT_IMG(os.path.join(this_dir, 'A200622.081914.dat'))
+    loaded = load_store(store_path, 'A200622.081914.dat')
+    assert loaded.meta == file.meta
+    assert loaded.offset == file.offset and loaded.size == file.size
+    for img, loaded_img in zip(file.imgs, loaded.imgs):
+        np.testing.assert_array_equal(img, loaded_img)
+
+    file = VERT_SPEC(os.path.join(this_dir, 'A201222.074849.VERT'))
+    loaded = load_store(store_path, 'A201222.074849.VERT')
+    assert loaded.meta == file.meta
+    assert loaded.spec_headers == file.spec_headers
+    assert_frame_equal(file.spec, loaded.spec)
+
+    file = GRID_SPEC(grid_fp)
+    with FILE_STORE(store_path, 'r') as store:
+        loaded = store.load('A211021.201245.specgrid')
+        np.testing.assert_array_equal(store.dataset('A211021.201245.specgrid', 'specdata')[2:4, 1],
+                                      file.specdata[2:4, 1])
+    assert loaded.vertpoints == file.vertpoints and loaded.vertpoints.dtype == file.vertpoints.dtype
+    np.testing.assert_array_equal(loaded.cube_array, file.cube_array)
+
+
+def test_FILE_STORE_names(tmp_path):
+    """
+    To test the names of the files in FILE_STORE and their typed meta attributes
+    """
+    pytest.importorskip('h5py')
+    import shutil
+    from createc.Createc_pyFile import DAT_IMG
+    from createc.Createc_pyStore import FILE_STORE, export_store
+
+    fp = os.path.join(this_dir, 'A200622.081914.dat')
+    for folder in ['day1', os.path.join('day1', 'tip2'), 'day2']:
+        os.makedirs(tmp_path / 'data' / folder)
+        shutil.copy(fp, tmp_path / 'data' / folder)
+    store_path = str(tmp_path / 'store.h5')
+    names = export_store(str(tmp_path / 'data'), store_path)
+    assert names == ['day1/A200622.081914.dat', 'day1/tip2/A200622.081914.dat', 'day2/A200622.081914.dat']
+    with pytest.raises(ValueError):
+        export_store([str(tmp_path / 'data' / 'day1' / 'A200622.081914.dat'),
+                      str(tmp_path / 'data' / 'day2' / 'A200622.081914.dat')], store_path)
+
+    file = DAT_IMG(fp)
+    with FILE_STORE(store_path, 'r') as store:
+        assert store.names() == names
+        group = store.h5['day1/tip2/A200622.081914.dat']
+        assert group.attrs['meta:num.x'] == 512 and group.attrs['meta:num.x'].dtype == np.int64
+        assert group.attrs['meta:biasvoltage'] == 100.0 and group.attrs['meta:titel'] == 'LHeNew'
+        loaded = store.load('day1/tip2/A200622.081914.dat')
+    assert loaded.meta == file.meta
+    np.testing.assert_array_equal(loaded.imgs[0], file.imgs[0])
@@ -0,0 +1,52 @@
+import datetime
+import os
+
+import numpy as np
+
+
+def test_TELEMETRY(tmp_path):
+    """
+    To test writing, rotating, reading and replaying telemetry files
+    """
+    from createc.utils.acquisition import RING_BUFFER
+    from createc.utils.telemetry import TELEMETRY_WRITER, TELEMETRY_READER, read_file, record_dtype
+    labels = ['ADC0', 'ADC1', 'ADC2']
+    t0 = datetime.datetime(2020, 6, 22, 8, 0).timestamp()
+    times = t0 + np.arange(1000) * 0.1
+    data = np.arange(3000, dtype=float).reshape(1000, 3)
+    # small files to rotate
+    with TELEMETRY_WRITER(str(tmp_path), 'adc', labels, max_bytes=1024 + 300 * record_dtype(3).itemsize) as writer:
+        writer.write(times[:10], data[:10], monotonic=False)
+        writer.write(times[10:], data[10:], monotonic=False)
+    reader = TELEMETRY_READER(str(tmp_path), 'adc')
+    assert len(reader.files) == 4 and reader.labels == labels
+
+    t, d = reader.read()
+    assert np.array_equal(t, times) and np.array_equal(d, data)
+    t, d = reader.read(times[250], datetime.datetime.fromtimestamp(times[650]))
+    assert np.array_equal(t, times[250:651]) and np.array_equal(d, data[250:651])
+    assert len(reader.read(times[-1] + 1)[0]) == 0
+
+    # a partially written record is left out
+    with open(reader.files[-1], 'ab') as f:
+        f.write(b'\1\2\3')
+    assert len(read_file(reader.files[-1])[1]) == 100
+
+    buffers = [RING_BUFFER(2000) for _ in labels]
+    assert reader.replay(buffers, end=times[99]) == 100
+    assert np.array_equal(buffers[2].read()[1], data[:100, 2])
+
+
+def test_TELEMETRY_WRITER_batches(tmp_path):
+    """
+    To test writing batches of ADC samples side by side
+    """
+    from createc.utils.data_producer import ADC_BATCH
+    from createc.utils.telemetry import TELEMETRY_WRITER, TELEMETRY_READER
+    writer = TELEMETRY_WRITER(str(tmp_path), 'zi', ['Z', 'I', 'T'])
+    stamps = np.array([1.0, 2.0])
+    writer.write_batch([ADC_BATCH(stamps, np.array([[1, 2], [3, 4]])), ADC_BATCH(stamps[-1:], np.array([[5]]))])
+    writer.close()
+    t, d = TELEMETRY_READER(str(tmp_path), 'zi').read(monotonic=True)
+    assert np.allclose(t, [2.0]) and d.tolist() == [[3, 4, 5]]
+    assert os.path.basename(writer.file_path).startswith('zi_')